@@ -0,0 +1,87 @@
+# Security Audit Sink
+"""
+Buffered writer for SecurityEvent rows recorded by the RBAC middleware.
+
+Request auditing used to insert one or two SecurityEvent rows inside every
+request. The sink keeps those inserts off the request path: routine events
+are queued in memory and written with bulk_create by a background thread,
+while high-severity events are written before record() returns so that
+they are never lost to sampling, a full queue or a worker restart.
+"""
+
+import random
+import logging
+from typing import Optional
+
+from core.buffered_writer import BufferedBulkWriter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIT_SETTINGS = {
+    'ASYNC_ENABLED': True,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL_MS': 1000,
+    'MAX_QUEUE_SIZE': 20000,
+    'LOW_SEVERITY_SAMPLE_RATE': 1.0,
+    'IMMEDIATE_SEVERITIES': ['high', 'critical'],
+}
+
+
+class SecurityAuditSink(BufferedBulkWriter):
+    """
+    Buffered writer of unsaved SecurityEvent instances
+
+    Low-severity events are kept with probability LOW_SEVERITY_SAMPLE_RATE.
+    Events whose severity is listed in IMMEDIATE_SEVERITIES bypass sampling
+    and the queue and are saved synchronously. Everything else goes through
+    the shared buffered writer. Settings are read from RBAC_AUDIT_SETTINGS
+    on every record.
+    """
+
+    settings_name = 'RBAC_AUDIT_SETTINGS'
+    default_settings = DEFAULT_AUDIT_SETTINGS
+    thread_name = 'security-audit-sink'
+    label = 'Security audit sink'
+    stat_names = (
+        'recorded', 'sampled_out', 'dropped', 'written', 'written_immediately', 'failed'
+    )
+
+    def get_model(self):
+        from .models import SecurityEvent
+        return SecurityEvent
+
+    def record(self, event) -> None:
+        """Queue an unsaved SecurityEvent, or save it now if it is high severity"""
+        config = self.get_config()
+        self._count('recorded', 1)
+
+        if event.severity in config['IMMEDIATE_SEVERITIES']:
+            self._write_immediately(event)
+            return
+
+        sample_rate = config['LOW_SEVERITY_SAMPLE_RATE']
+        if event.severity == 'low' and sample_rate < 1.0 and random.random() >= sample_rate:
+            self._count('sampled_out', 1)
+            return
+
+        self.enqueue([event], config)
+
+    def _write_immediately(self, event) -> None:
+        try:
+            event.save()
+            self._count('written_immediately', 1)
+        except Exception as e:
+            self._count('failed', 1)
+            logger.error(f"Failed to write {event.severity} security event {event.event_type}: {e}")
+
+
+# Global security audit sink instance
+_audit_sink: Optional[SecurityAuditSink] = None
+
+
+def get_audit_sink() -> SecurityAuditSink:
+    """Get global security audit sink instance"""
+    global _audit_sink
+    if _audit_sink is None:
+        _audit_sink = SecurityAuditSink()
+    return _audit_sink
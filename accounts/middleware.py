@@ -4,96 +4,14 @@ Middleware for implementing tier-based rate limiting
 """
 
 import time
-from collections import defaultdict
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from django.core.cache import cache
-from django.conf import settings
-from .jwt_config import RATE_LIMIT_SETTINGS
 from .utils import get_client_ip
 
-
-class RateLimitMiddleware(MiddlewareMixin):
-    """Middleware for tier-based rate limiting"""
-    
-    def __init__(self, get_response=None):
-        super().__init__(get_response)
-        self.rate_limits = RATE_LIMIT_SETTINGS
-        
-    def process_request(self, request):
-        """Check rate limits before processing request"""
-        # Skip rate limiting for certain paths
-        if self._should_skip_rate_limit(request):
-            return None
-        
-        # Get identifier (user ID or IP)
-        identifier = self._get_identifier(request)
-        
-        # Get rate limit for user tier
-        rate_limit = self._get_rate_limit(request)
-        
-        # Check if rate limit exceeded
-        if self._is_rate_limited(identifier, rate_limit):
-            return JsonResponse(
-                {
-                    'error': 'Rate limit exceeded',
-                    'detail': 'Too many requests. Please try again later.'
-                },
-                status=429
-            )
-        
-        return None
-    
-    def _should_skip_rate_limit(self, request):
-        """Check if rate limiting should be skipped"""
-        skip_paths = [
-            '/admin/',
-            '/health/',
-            '/metrics/',
-        ]
-        
-        for path in skip_paths:
-            if request.path.startswith(path):
-                return True
-        
-        return False
-    
-    def _get_identifier(self, request):
-        """Get unique identifier for rate limiting"""
-        if request.user.is_authenticated:
-            return f"user:{request.user.id}"
-        else:
-            ip_address = get_client_ip(request)
-            return f"ip:{ip_address}"
-    
-    def _get_rate_limit(self, request):
-        """Get rate limit based on user tier"""
-        if request.user.is_authenticated:
-            tier = getattr(request.user, 'tier', 'normal')
-            return self.rate_limits.get(tier, self.rate_limits['normal'])
-        else:
-            return self.rate_limits['anonymous']
-    
-    def _is_rate_limited(self, identifier, rate_limit):
-        """Check if identifier has exceeded rate limit"""
-        now = time.time()
-        window_duration = rate_limit['window']
-        max_requests = rate_limit['requests']
-        
-        # Get current window start
-        window_start = now - (now % window_duration)
-        cache_key = f"rate_limit:{identifier}:{window_start}"
-        
-        # Get current request count
-        current_count = cache.get(cache_key, 0)
-        
-        if current_count >= max_requests:
-            return True
-        
-        # Increment counter
-        cache.set(cache_key, current_count + 1, timeout=window_duration)
-        
-        return False
+# Tier-based rate limiting lives in rate_limit_middleware, which enforces
+# endpoint and tier limits through the shared limiter; re-exported here so
+# existing references to accounts.middleware.RateLimitMiddleware keep working.
+from .rate_limit_middleware import RateLimitMiddleware  # noqa: F401
 
 
 class SecurityHeadersMiddleware(MiddlewareMixin):
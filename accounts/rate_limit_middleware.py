@@ -1,75 +1,129 @@
 """
 Rate limiting middleware for API endpoints
 """
-import time
-import threading
-from collections import defaultdict
 from django.http import JsonResponse
-from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .jwt_config import RATE_LIMIT_SETTINGS, USER_TIER_SETTINGS
+from .rate_limiter import get_rate_limiter
 
 
 class RateLimitMiddleware:
-    """Simple rate limiting middleware"""
-    
+    """Endpoint and tier-based rate limiting backed by the shared limiter"""
+
     def __init__(self, get_response):
         self.get_response = get_response
-        
-        # In-memory storage for rate limiting (use Redis in production)
-        self.request_counts = defaultdict(list)
-        # Thread lock for safe concurrent access
-        self.lock = threading.Lock()
-        
+
         # Rate limit configuration
         self.rate_limits = {
             '/api/v1/accounts/register/': {'requests': 5, 'window': 300},  # 5 per 5 minutes
             '/api/v1/accounts/login/': {'requests': 10, 'window': 300},     # 10 per 5 minutes
             '/api/v1/accounts/password/reset/': {'requests': 3, 'window': 600},  # 3 per 10 minutes
         }
-        
+
         # Default rate limit for all API endpoints
         self.default_rate_limit = {'requests': 100, 'window': 3600}  # 100 per hour
-    
+
+        # API clients authenticate in the DRF view, after this middleware runs
+        self.jwt_authentication = JWTAuthentication()
+
     def __call__(self, request):
+        result = None
+
         # Check if this is an API endpoint
-        if request.path.startswith('/api/'):
-            if not self.check_rate_limit(request):
-                return JsonResponse({
+        if request.path.startswith('/api/') and self._is_enabled(request):
+            result = self.evaluate(request)
+            if not result.allowed:
+                response = JsonResponse({
                     'error': 'Rate limit exceeded. Please try again later.',
                     'detail': 'Too many requests from this IP address.'
                 }, status=429)
-        
+                response['Retry-After'] = str(max(1, int(result.retry_after + 0.999)))
+                self._add_headers(response, result)
+                return response
+
         response = self.get_response(request)
+        if result is not None:
+            self._add_headers(response, result)
         return response
-    
+
     def check_rate_limit(self, request):
         """Check if request is within rate limit"""
-        ip_address = self.get_client_ip(request)
+        return self.evaluate(request).allowed
+
+    def evaluate(self, request):
+        """Count the request against its limit and return the RateLimitResult"""
+        key, rate_limit = self.get_rate_limit(request)
+        return get_rate_limiter().check(
+            key,
+            rate_limit['requests'],
+            rate_limit['window'],
+            burst=rate_limit.get('burst'),
+        )
+
+    def get_rate_limit(self, request):
+        """Get the limiter key and limit for a request"""
         path = request.path
-        current_time = time.time()
-        
-        # Get rate limit for this endpoint
-        rate_limit = self.rate_limits.get(path, self.default_rate_limit)
-        
-        # Create key for this IP and endpoint
-        key = f"{ip_address}:{path}"
-        
-        # Thread-safe list mutation
-        with self.lock:
-            # Clean old requests outside the time window
-            self.request_counts[key] = [
-                req_time for req_time in self.request_counts[key]
-                if current_time - req_time < rate_limit['window']
-            ]
-            
-            # Check if we're over the limit
-            if len(self.request_counts[key]) >= rate_limit['requests']:
-                return False
-            
-            # Add current request
-            self.request_counts[key].append(current_time)
-        
-        return True
-    
+
+        # Sensitive endpoints are limited per IP address and path
+        if path in self.rate_limits:
+            return f"{self.get_client_ip(request)}:{path}", self.rate_limits[path]
+
+        # Authenticated users get their tier's allowance across all endpoints
+        identity = self.get_user_identity(request)
+        if identity is not None:
+            user_id, tier = identity
+            tier_config = USER_TIER_SETTINGS.get(tier, USER_TIER_SETTINGS['normal'])
+            requests = tier_config['rate_limit']['requests_per_hour']
+            return f"user:{user_id}", {
+                'requests': requests,
+                'window': 3600,
+                'burst': int(requests * RATE_LIMIT_SETTINGS.get('burst_allowance', 1)),
+            }
+
+        return f"{self.get_client_ip(request)}:{path}", self.default_rate_limit
+
+    def get_user_identity(self, request):
+        """
+        Get the (user id, tier) a request is made as, or None if anonymous
+
+        Session users are read from request.user. Bearer-token requests are
+        read from the validated access token's claims, without loading the
+        user; a missing or invalid token counts as anonymous.
+        """
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk, getattr(user, 'tier', 'normal')
+
+        header = self.jwt_authentication.get_header(request)
+        if header is None:
+            return None
+        try:
+            raw_token = self.jwt_authentication.get_raw_token(header)
+            if raw_token is None:
+                return None
+            token = self.jwt_authentication.get_validated_token(raw_token)
+        except (AuthenticationFailed, TokenError):
+            return None
+
+        user_id = token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return None
+        return user_id, token.get('user_tier', 'normal')
+
+    def _is_enabled(self, request):
+        if not RATE_LIMIT_SETTINGS.get('enable_rate_limiting', True):
+            return False
+        return self.get_client_ip(request) not in RATE_LIMIT_SETTINGS.get('whitelist_ips', [])
+
+    def _add_headers(self, response, result):
+        if RATE_LIMIT_SETTINGS.get('rate_limit_header'):
+            response['X-RateLimit-Limit'] = str(result.limit)
+            response['X-RateLimit-Remaining'] = str(result.remaining)
+
     def get_client_ip(self, request):
         """Get client IP address"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
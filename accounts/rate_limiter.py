@@ -0,0 +1,226 @@
+# Shared Rate Limiter
+"""
+GCRA rate limiting shared by every worker process.
+
+The Generic Cell Rate Algorithm stores a single "theoretical arrival time"
+(TAT) per key: a request is allowed when it does not arrive earlier than
+TAT - tolerance, and each allowed request pushes TAT forward by one
+emission interval (period / requests). That behaves like a token bucket of
+`burst` tokens refilled at requests/period, in O(1) time and memory per key.
+
+The Redis backend runs the check as one Lua script (a single round-trip,
+atomic across workers, using the Redis clock). The local backend keeps
+TATs in lock-sharded dictionaries and is used for tests, when Redis is not
+configured, and as a fallback when Redis is unreachable.
+"""
+
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMITER_SETTINGS = {
+    'BACKEND': 'redis',
+    'REDIS_URL': None,  # Defaults to settings.REDIS_URL
+    'KEY_PREFIX': 'rate_limit',
+    'LOCAL_SHARDS': 64,
+}
+
+
+CLOCK_EPSILON = 1e-6
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a rate limit check"""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # Seconds until the next request would be allowed
+
+
+def gcra(tat: Optional[float], now: float, emission: float,
+         tolerance: float) -> Tuple[bool, float, float, int]:
+    """
+    Apply GCRA to a stored TAT
+
+    Returns (allowed, new TAT, retry_after seconds, remaining requests).
+    When the request is denied the returned TAT is the unchanged one.
+    """
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + emission
+    allow_at = new_tat - tolerance
+
+    # TAT is a running sum of floats; don't let rounding deny the last request
+    if allow_at - now > CLOCK_EPSILON:
+        return False, tat, allow_at - now, 0
+
+    return True, new_tat, 0.0, int((now - allow_at) / emission + CLOCK_EPSILON)
+
+
+class LocalRateLimitBackend:
+    """In-process TAT store split over independently locked shards"""
+
+    SWEEP_EVERY_WRITES = 1000
+
+    def __init__(self, shards: int = 64):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._writes = [0] * shards
+
+    def hit(self, key: str, emission: float, tolerance: float,
+            now: Optional[float] = None) -> Tuple[bool, float, int]:
+        """Check and record one request; returns (allowed, retry_after, remaining)"""
+        now = time.time() if now is None else now
+        index = hash(key) % len(self._shards)
+        tats, lock = self._shards[index]
+
+        with lock:
+            allowed, new_tat, retry_after, remaining = gcra(
+                tats.get(key), now, emission, tolerance
+            )
+            if allowed:
+                tats[key] = new_tat
+                self._writes[index] += 1
+                if self._writes[index] >= self.SWEEP_EVERY_WRITES:
+                    self._writes[index] = 0
+                    self._sweep(tats, now)
+
+        return allowed, retry_after, remaining
+
+    @staticmethod
+    def _sweep(tats: Dict[str, float], now: float) -> None:
+        # A TAT in the past is the same as no entry at all
+        for key in [key for key, tat in tats.items() if tat <= now]:
+            del tats[key]
+
+    def __len__(self) -> int:
+        return sum(len(tats) for tats, _ in self._shards)
+
+    def clear(self) -> None:
+        """Forget all keys"""
+        for tats, lock in self._shards:
+            with lock:
+                tats.clear()
+
+
+class RedisRateLimitBackend:
+    """TAT store in Redis, checked and updated by one Lua script call"""
+
+    GCRA_SCRIPT = """
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+local new_tat = tat + emission
+local allow_at = new_tat - tolerance
+if allow_at - now > 0.000001 then
+    return {0, math.ceil((allow_at - now) * 1000), 0}
+end
+redis.call('SET', KEYS[1], string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, 0, math.floor((now - allow_at) / emission + 0.000001)}
+"""
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(
+            url, socket_timeout=0.25, socket_connect_timeout=0.25
+        )
+        self._script = self._client.register_script(self.GCRA_SCRIPT)
+
+    def hit(self, key: str, emission: float, tolerance: float) -> Tuple[bool, float, int]:
+        """Check and record one request; returns (allowed, retry_after, remaining)"""
+        allowed, retry_after_ms, remaining = self._script(
+            keys=[key], args=[repr(emission), repr(tolerance)]
+        )
+        return bool(allowed), retry_after_ms / 1000.0, int(remaining)
+
+
+class RateLimiter:
+    """
+    Rate limiter with a shared Redis backend and a local fallback
+
+    Settings come from RATE_LIMITER_SETTINGS. If the Redis backend is
+    selected but fails, the request is checked against the local backend
+    so limits still apply per process instead of failing the request.
+    """
+
+    # After a Redis error, stay on the local backend this long before retrying
+    SHARED_RETRY_SECONDS = 30
+
+    def __init__(self):
+        config = self.get_config()
+        self.local = LocalRateLimitBackend(config['LOCAL_SHARDS'])
+        self._shared: Optional[RedisRateLimitBackend] = None
+        self._shared_retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_config(self) -> Dict:
+        """Get limiter settings merged over the defaults"""
+        return {**DEFAULT_RATE_LIMITER_SETTINGS, **getattr(settings, 'RATE_LIMITER_SETTINGS', {})}
+
+    def _get_shared_backend(self, config: Dict) -> Optional[RedisRateLimitBackend]:
+        if config['BACKEND'] != 'redis' or not REDIS_AVAILABLE:
+            return None
+        if time.monotonic() < self._shared_retry_at:
+            return None
+
+        if self._shared is None:
+            with self._lock:
+                if self._shared is None:
+                    url = config['REDIS_URL'] or getattr(settings, 'REDIS_URL', None)
+                    if not url:
+                        return None
+                    self._shared = RedisRateLimitBackend(url)
+
+        return self._shared
+
+    def check(self, key: str, requests: int, window: int,
+              burst: Optional[int] = None) -> RateLimitResult:
+        """
+        Count one request against `requests` per `window` seconds
+
+        `burst` is how many requests may arrive back to back and defaults
+        to `requests`, which matches a fixed "N per window" allowance.
+        """
+        config = self.get_config()
+        emission = window / requests
+        tolerance = emission * (burst or requests)
+        full_key = f"{config['KEY_PREFIX']}:{key}"
+
+        try:
+            shared = self._get_shared_backend(config)
+            if shared is not None:
+                allowed, retry_after, remaining = shared.hit(full_key, emission, tolerance)
+                return RateLimitResult(allowed, requests, remaining, retry_after)
+        except Exception as e:
+            self._shared_retry_at = time.monotonic() + self.SHARED_RETRY_SECONDS
+            logger.error(f"Shared rate limiter unavailable, using local limiter: {e}")
+
+        allowed, retry_after, remaining = self.local.hit(full_key, emission, tolerance)
+        return RateLimitResult(allowed, requests, remaining, retry_after)
+
+
+# Global rate limiter instance
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get global rate limiter instance"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
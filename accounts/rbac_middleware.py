@@ -7,9 +7,10 @@ permission checks.
 import logging
 import time
 import json
-from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
 from accounts.models import SecurityEvent
+from accounts.audit_sink import get_audit_sink
+from accounts.security_counters import get_security_counter
 
 logger = logging.getLogger(__name__)
 
@@ -87,19 +88,13 @@ class RBACauditMiddleware(MiddlewareMixin):
         try:
             # Extract request data (currently not persisted, used for future)
             self._extract_request_data(request)
-            # Normalize session id for JWT-only requests (no Django session)
-            session_id = self._get_session_id_safe(request)
-            
-            SecurityEvent.objects.create(
-                user=request.user if request.user.is_authenticated else None,
+            self._record_event(
+                request,
                 event_type='request_start',
                 severity='low',
                 description=(
                     f"Request started: {request.method} {request.path}"
                 ),
-                ip_address=self._get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                session_id=session_id,
             )
         except Exception as e:
             logger.error(f"Failed to log request start: {e}")
@@ -107,18 +102,14 @@ class RBACauditMiddleware(MiddlewareMixin):
     def _log_request_complete(self, request, response, duration):
         """Log request completion details"""
         try:
-            session_id = self._get_session_id_safe(request)
-            SecurityEvent.objects.create(
-                user=request.user if request.user.is_authenticated else None,
+            self._record_event(
+                request,
                 event_type='request_complete',
                 severity='low',
                 description=(
                     f"Request completed: {request.method} "
                     f"{request.path} - {response.status_code}"
                 ),
-                ip_address=self._get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                session_id=session_id,
             )
         except Exception as e:
             logger.error(f"Failed to log request completion: {e}")
@@ -126,22 +117,32 @@ class RBACauditMiddleware(MiddlewareMixin):
     def _log_request_exception(self, request, exception):
         """Log request exceptions"""
         try:
-            session_id = self._get_session_id_safe(request)
-            SecurityEvent.objects.create(
-                user=request.user if request.user.is_authenticated else None,
+            self._record_event(
+                request,
                 event_type='request_exception',
                 severity='high',
                 description=(
                     f"Request exception: {request.method} "
                     f"{request.path} - {str(exception)}"
                 ),
-                ip_address=self._get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                session_id=session_id,
             )
         except Exception as e:
             logger.error(f"Failed to log request exception: {e}")
     
+    def _record_event(self, request, event_type, severity, description):
+        """Hand a SecurityEvent to the audit sink instead of inserting it here"""
+        user = getattr(request, 'user', None)
+        get_audit_sink().record(SecurityEvent(
+            user=user if user is not None and user.is_authenticated else None,
+            event_type=event_type,
+            severity=severity,
+            description=description,
+            ip_address=self._get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            # Normalize session id for JWT-only requests (no Django session)
+            session_id=self._get_session_id_safe(request),
+        ))
+    
     def _extract_request_data(self, request):
         """Extract and sanitize request data"""
         data = {}
@@ -236,29 +237,19 @@ class SecurityMonitoringMiddleware(MiddlewareMixin):
         try:
             ip_address = self._get_client_ip(request)
             
-            # Count recent auth failures from this IP
-            recent_failures = SecurityEvent.objects.filter(
-                ip_address=ip_address,
-                event_type='multiple_failed_logins',
-                created_at__gte=timezone.now() - timezone.timedelta(hours=1)
-            ).count()
-            
-            if (
-                recent_failures
-                >= self.RATE_LIMIT_THRESHOLDS['failed_auth_per_hour']
+            if get_security_counter().check(
+                'failed_auth', ip_address,
+                self.RATE_LIMIT_THRESHOLDS['failed_auth_per_hour'],
+                window_seconds=3600
             ):
-                SecurityEvent.objects.create(
-                    user=(
-                        request.user if request.user.is_authenticated else None
-                    ),
+                self._record_event(
+                    request,
                     event_type='multiple_failed_logins',
                     severity='high',
                     description=(
                         "Excessive authentication failures from IP: "
                         f"{ip_address}"
                     ),
-                    ip_address=ip_address,
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 )
         except Exception as e:
             logger.error(f"Failed to check auth failures: {e}")
@@ -268,29 +259,19 @@ class SecurityMonitoringMiddleware(MiddlewareMixin):
         try:
             ip_address = self._get_client_ip(request)
             
-            # Count recent permission denials from this IP
-            recent_denials = SecurityEvent.objects.filter(
-                ip_address=ip_address,
-                event_type='suspicious_login',
-                created_at__gte=timezone.now() - timezone.timedelta(hours=1)
-            ).count()
-            
-            if (
-                recent_denials
-                >= self.RATE_LIMIT_THRESHOLDS['permission_denied_per_hour']
+            if get_security_counter().check(
+                'permission_denied', ip_address,
+                self.RATE_LIMIT_THRESHOLDS['permission_denied_per_hour'],
+                window_seconds=3600
             ):
-                SecurityEvent.objects.create(
-                    user=(
-                        request.user if request.user.is_authenticated else None
-                    ),
+                self._record_event(
+                    request,
                     event_type='suspicious_login',
                     severity='medium',
                     description=(
                         "Excessive permission denials from IP: "
                         f"{ip_address}"
                     ),
-                    ip_address=ip_address,
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 )
         except Exception as e:
             logger.error(f"Failed to check permission denials: {e}")
@@ -300,32 +281,34 @@ class SecurityMonitoringMiddleware(MiddlewareMixin):
         try:
             ip_address = self._get_client_ip(request)
             
-            # Count requests from this IP in the last minute
-            recent_requests = SecurityEvent.objects.filter(
-                ip_address=ip_address,
-                event_type='suspicious_login',
-                created_at__gte=timezone.now() - timezone.timedelta(minutes=1)
-            ).count()
-            
-            if (
-                recent_requests
-                >= self.RATE_LIMIT_THRESHOLDS['requests_per_minute']
+            if get_security_counter().check(
+                'requests', ip_address,
+                self.RATE_LIMIT_THRESHOLDS['requests_per_minute'],
+                window_seconds=60
             ):
-                SecurityEvent.objects.create(
-                    user=(
-                        request.user if request.user.is_authenticated else None
-                    ),
+                self._record_event(
+                    request,
                     event_type='rate_limit_exceeded',
                     severity='medium',
                     description=(
                         "Rate limit exceeded from IP: " f"{ip_address}"
                     ),
-                    ip_address=ip_address,
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 )
         except Exception as e:
             logger.error(f"Failed to check rate limits: {e}")
     
+    def _record_event(self, request, event_type, severity, description):
+        """Hand a threshold SecurityEvent to the audit sink"""
+        user = getattr(request, 'user', None)
+        get_audit_sink().record(SecurityEvent(
+            user=user if user is not None and user.is_authenticated else None,
+            event_type=event_type,
+            severity=severity,
+            description=description,
+            ip_address=self._get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ))
+    
     def _get_client_ip(self, request):
         """Get client IP address"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
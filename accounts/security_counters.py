@@ -0,0 +1,164 @@
+# Security Event Counters
+"""
+Sliding-window counters behind SecurityMonitoringMiddleware thresholds.
+
+Each counter key (event kind + client IP) keeps two fixed buckets, the
+current window and the previous one, and estimates the sliding-window
+count as current + previous * (unused fraction of the previous window).
+That is O(1) time and memory per key and replaces the COUNT(*) queries
+over security_events the middleware used to run on every response.
+
+The cache backend stores the buckets in the shared Django cache (Redis in
+production) so all workers see the same counts; the local backend keeps
+them in process memory and is used for tests or when the cache is down.
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def _window_position(now: float, window_seconds: int) -> Tuple[int, float]:
+    """Get the current bucket number and how far into it we are (0..1)"""
+    bucket = int(now // window_seconds)
+    return bucket, (now - bucket * window_seconds) / window_seconds
+
+
+class LocalWindowCounter:
+    """In-process sliding-window counters with periodic eviction of idle keys"""
+
+    SWEEP_INTERVAL_SECONDS = 60
+
+    def __init__(self):
+        # key -> [bucket number, current count, previous count, window seconds]
+        self._counters: Dict[str, list] = {}
+        # key -> monotonic deadline until which no new alert is raised
+        self._alerts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def hit(self, key: str, window_seconds: int, now: Optional[float] = None) -> float:
+        """Count one event and return the sliding-window estimate"""
+        now = time.time() if now is None else now
+        bucket, elapsed = _window_position(now, window_seconds)
+
+        with self._lock:
+            self._maybe_sweep(now)
+            state = self._counters.get(key)
+            if state is None:
+                state = self._counters[key] = [bucket, 0, 0, window_seconds]
+            elif state[0] != bucket:
+                # Roll forward; a gap of more than one window empties both buckets
+                state[2] = state[1] if state[0] == bucket - 1 else 0
+                state[1] = 0
+                state[0] = bucket
+
+            state[1] += 1
+            return state[1] + state[2] * (1.0 - elapsed)
+
+    def claim_alert(self, key: str, cooldown_seconds: int) -> bool:
+        """Return True once per cooldown period for a key"""
+        now = time.monotonic()
+        with self._lock:
+            if self._alerts.get(key, 0) > now:
+                return False
+            self._alerts[key] = now + cooldown_seconds
+            return True
+
+    def _maybe_sweep(self, now: float) -> None:
+        monotonic_now = time.monotonic()
+        if monotonic_now - self._swept_at < self.SWEEP_INTERVAL_SECONDS:
+            return
+        self._swept_at = monotonic_now
+
+        self._counters = {
+            key: state for key, state in self._counters.items()
+            if int(now // state[3]) - state[0] <= 1
+        }
+        self._alerts = {
+            key: deadline for key, deadline in self._alerts.items()
+            if deadline > monotonic_now
+        }
+
+    def clear(self) -> None:
+        """Forget all counters and alerts"""
+        with self._lock:
+            self._counters.clear()
+            self._alerts.clear()
+
+
+class CacheWindowCounter:
+    """Sliding-window counters kept in the shared Django cache"""
+
+    KEY_PREFIX = 'security_counter'
+
+    def hit(self, key: str, window_seconds: int, now: Optional[float] = None) -> float:
+        """Count one event and return the sliding-window estimate"""
+        now = time.time() if now is None else now
+        bucket, elapsed = _window_position(now, window_seconds)
+        current_key = f'{self.KEY_PREFIX}:{key}:{bucket}'
+        previous_key = f'{self.KEY_PREFIX}:{key}:{bucket - 1}'
+
+        # Buckets outlive their window so they can serve as the previous bucket
+        cache.add(current_key, 0, timeout=window_seconds * 2)
+        current = cache.incr(current_key)
+        previous = cache.get(previous_key, 0)
+        return current + previous * (1.0 - elapsed)
+
+    def claim_alert(self, key: str, cooldown_seconds: int) -> bool:
+        """Return True once per cooldown period for a key, across all workers"""
+        return cache.add(f'{self.KEY_PREFIX}_alert:{key}', 1, timeout=cooldown_seconds)
+
+
+class SecurityCounter:
+    """
+    Threshold checks over sliding-window counters
+
+    Uses the backend named by RBAC_SETTINGS['SECURITY_COUNTER_BACKEND']
+    ('cache' or 'local') and falls back to the local backend whenever the
+    shared cache raises, so monitoring never fails a request.
+    """
+
+    def __init__(self):
+        self.local = LocalWindowCounter()
+        self.shared = CacheWindowCounter()
+
+    def _backend_name(self) -> str:
+        return getattr(settings, 'RBAC_SETTINGS', {}).get('SECURITY_COUNTER_BACKEND', 'cache')
+
+    def check(self, kind: str, identifier: str, threshold: int, window_seconds: int) -> bool:
+        """
+        Count an event and report whether its threshold was just crossed
+
+        Returns True at most once per window for a kind/identifier pair,
+        the first time the sliding-window count reaches the threshold.
+        """
+        key = f'{kind}:{identifier}'
+
+        if self._backend_name() == 'cache':
+            try:
+                count = self.shared.hit(key, window_seconds)
+                return count >= threshold and self.shared.claim_alert(key, window_seconds)
+            except Exception as e:
+                logger.error(f"Shared security counter unavailable, using local counter: {e}")
+
+        count = self.local.hit(key, window_seconds)
+        return count >= threshold and self.local.claim_alert(key, window_seconds)
+
+
+# Global security counter instance
+_security_counter: Optional[SecurityCounter] = None
+
+
+def get_security_counter() -> SecurityCounter:
+    """Get global security counter instance"""
+    global _security_counter
+    if _security_counter is None:
+        _security_counter = SecurityCounter()
+    return _security_counter
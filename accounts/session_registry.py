@@ -0,0 +1,169 @@
+# Session Registry
+"""
+Cached view of each user's active sessions for JWT verification.
+
+TierBasedAccessToken.verify used to count UserSession rows on every
+authenticated request. The registry keeps one cache entry per user that maps
+active session ids to (created_at, expires_at) timestamps, so the active
+session count and both blacklist flags come back from a single get_many.
+The entry is rebuilt from the database on a miss and dropped whenever one of
+the user's sessions is created, rotated, revoked or evicted.
+"""
+
+import time
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_TIMEOUT_SECONDS = 86400  # 24 hours
+
+
+def blacklisted_token_key(token_id) -> str:
+    return f'blacklisted_token:{token_id}'
+
+
+def blacklisted_session_key(session_id) -> str:
+    return f'blacklisted_session:{session_id}'
+
+
+class SessionRegistry:
+    """Per-user active session maps kept in the shared cache"""
+
+    KEY_PREFIX = 'session_registry'
+    MAX_TTL_SECONDS = 300  # Upper bound on how long a rebuilt map is trusted
+
+    def _key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:{user_id}'
+
+    def lookup(self, user_id, session_id: Optional[str],
+               token_id: Optional[str]) -> Tuple[bool, bool, Dict]:
+        """
+        Read blacklist flags and the active sessions of a user in one round-trip
+
+        Returns (token blacklisted, session blacklisted, {session_id:
+        (created_ts, expires_ts)}). The session map is loaded from the
+        database only when it is not cached.
+        """
+        token_key = blacklisted_token_key(token_id)
+        session_key = blacklisted_session_key(session_id)
+        registry_key = self._key(user_id)
+
+        try:
+            values = cache.get_many([token_key, session_key, registry_key])
+        except Exception as e:
+            logger.error(f"Failed to read session registry for user {user_id}: {e}")
+            values = {}
+
+        sessions = values.get(registry_key)
+        if sessions is None:
+            sessions = self.load(user_id)
+
+        return (
+            bool(token_id and values.get(token_key)),
+            bool(session_id and values.get(session_key)),
+            sessions
+        )
+
+    def load(self, user_id) -> Dict:
+        """Rebuild and cache the active session map of a user from the database"""
+        from .models import UserSession
+
+        now = timezone.now()
+        sessions = {
+            session_id: (created_at.timestamp(), expires_at.timestamp())
+            for session_id, created_at, expires_at in UserSession.objects.filter(
+                user_id=user_id,
+                is_active=True,
+                expires_at__gt=now
+            ).values_list('session_id', 'created_at', 'expires_at')
+        }
+
+        # Don't keep the map past the first expiry so counts stay exact
+        timeout = self.MAX_TTL_SECONDS
+        if sessions:
+            first_expiry = min(expires_ts for _, expires_ts in sessions.values())
+            timeout = max(1, min(timeout, int(first_expiry - now.timestamp())))
+
+        try:
+            cache.set(self._key(user_id), sessions, timeout=timeout)
+        except Exception as e:
+            logger.error(f"Failed to cache session registry for user {user_id}: {e}")
+
+        return sessions
+
+    @staticmethod
+    def active_count(sessions: Dict, now: Optional[float] = None) -> int:
+        """Count sessions in a map that have not expired"""
+        now = time.time() if now is None else now
+        return sum(1 for _, expires_ts in sessions.values() if expires_ts > now)
+
+    def invalidate(self, user_id) -> None:
+        """Drop a user's cached session map so the next lookup reloads it"""
+        try:
+            cache.delete(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Failed to invalidate session registry for user {user_id}: {e}")
+
+    def revoke(self, user_id, session_ids: Iterable[str]) -> int:
+        """Deactivate sessions in one update and blacklist them in one cache write"""
+        from .models import UserSession
+
+        session_ids = list(session_ids)
+        if not session_ids:
+            return 0
+
+        updated = UserSession.objects.filter(
+            session_id__in=session_ids
+        ).update(is_active=False)
+
+        try:
+            cache.set_many(
+                {blacklisted_session_key(session_id): True for session_id in session_ids},
+                timeout=BLACKLIST_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            logger.error(f"Failed to blacklist sessions for user {user_id}: {e}")
+
+        self.invalidate(user_id)
+        return updated
+
+    def enforce_limit(self, user_id, current_session_id: str, sessions: Dict,
+                      max_sessions: int) -> int:
+        """
+        Evict the oldest sessions beyond max_sessions
+
+        The session being verified is never evicted. Returns the number of
+        sessions revoked; nothing touches the database unless the limit is
+        exceeded.
+        """
+        now = time.time()
+        active = [
+            (created_ts, session_id)
+            for session_id, (created_ts, expires_ts) in sessions.items()
+            if expires_ts > now
+        ]
+        excess = len(active) - max_sessions
+        if excess <= 0:
+            return 0
+
+        evictable = sorted(
+            (created_ts, session_id) for created_ts, session_id in active
+            if session_id != current_session_id
+        )
+        return self.revoke(user_id, [session_id for _, session_id in evictable[:excess]])
+
+
+# Global session registry instance
+_session_registry: Optional[SessionRegistry] = None
+
+
+def get_session_registry() -> SessionRegistry:
+    """Get global session registry instance"""
+    global _session_registry
+    if _session_registry is None:
+        _session_registry = SessionRegistry()
+    return _session_registry
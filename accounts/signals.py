@@ -0,0 +1,22 @@
+# accounts/signals.py
+"""
+Account signals keeping the cached session registry current
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserSession
+from .session_registry import get_session_registry
+
+
+@receiver(post_save, sender=UserSession)
+def user_session_saved(sender, instance, **kwargs):
+    """Reload the user's active sessions after a login, rotation or logout"""
+    get_session_registry().invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=UserSession)
+def user_session_deleted(sender, instance, **kwargs):
+    """Reload the user's active sessions after a session is removed"""
+    get_session_registry().invalidate(instance.user_id)
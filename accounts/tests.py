@@ -1,11 +1,26 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 import json
+from datetime import timedelta
+from unittest import mock
 
-from .models import User
+from .models import User, SecurityEvent, UserSession
+from .audit_sink import SecurityAuditSink
+from .rate_limit_middleware import RateLimitMiddleware
+from .rate_limiter import LocalRateLimitBackend, RateLimiter
+from .rbac_middleware import RBACauditMiddleware, SecurityMonitoringMiddleware
+from .security_counters import LocalWindowCounter, SecurityCounter
+from .session_registry import get_session_registry
+from .tokens import TierBasedAccessToken
 
 User = get_user_model()
 
@@ -192,3 +207,299 @@ class RBACTestCase(TestCase):
         
         # Drivers should have access to ride management
         # but not user-specific features
+
+
+# Flushes in these tests are explicit, never from the background thread
+MANUAL_FLUSH_AUDIT = {'FLUSH_INTERVAL_MS': 60000}
+SYNC_AUDIT = {'ASYNC_ENABLED': False}
+
+
+@override_settings(RBAC_AUDIT_SETTINGS=MANUAL_FLUSH_AUDIT)
+class SecurityAuditSinkTestCase(TestCase):
+    """Test buffered SecurityEvent writes from the RBAC audit middleware"""
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.sink = SecurityAuditSink()
+    
+    def _event(self, severity='low', event_type='request_start'):
+        return SecurityEvent(
+            event_type=event_type,
+            severity=severity,
+            description='test event',
+            ip_address='10.0.0.1',
+        )
+    
+    def test_queued_events_written_in_bulk_on_flush(self):
+        """Routine events are buffered and written together"""
+        for _ in range(5):
+            self.sink.record(self._event())
+        
+        self.assertEqual(SecurityEvent.objects.count(), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.sink.flush(), 5)
+        self.assertEqual(SecurityEvent.objects.count(), 5)
+    
+    @override_settings(RBAC_AUDIT_SETTINGS={**MANUAL_FLUSH_AUDIT, 'LOW_SEVERITY_SAMPLE_RATE': 0.0})
+    def test_high_severity_bypasses_sampling_and_queue(self):
+        """High-severity events are saved before record returns"""
+        self.sink.record(self._event())
+        self.sink.record(self._event('high', 'request_exception'))
+        
+        self.assertEqual(
+            list(SecurityEvent.objects.values_list('event_type', flat=True)),
+            ['request_exception']
+        )
+        self.assertEqual(self.sink.get_stats()['sampled_out'], 1)
+    
+    @override_settings(RBAC_AUDIT_SETTINGS={**MANUAL_FLUSH_AUDIT, 'MAX_QUEUE_SIZE': 2})
+    def test_full_queue_drops_routine_events(self):
+        """A full queue drops routine events instead of blocking"""
+        for _ in range(3):
+            self.sink.record(self._event('medium'))
+        
+        self.assertEqual(self.sink.get_stats()['dropped'], 1)
+        self.assertEqual(self.sink.flush(), 2)
+    
+    @override_settings(RBAC_AUDIT_SETTINGS=SYNC_AUDIT)
+    def test_middleware_records_request_events(self):
+        """Middleware writes request start and completion events via the sink"""
+        middleware = RBACauditMiddleware(lambda request: HttpResponse())
+        request = self.factory.get('/api/v1/rides/')
+        request.user = AnonymousUser()
+        
+        with mock.patch('accounts.rbac_middleware.get_audit_sink', return_value=self.sink):
+            middleware(request)
+        
+        self.assertEqual(
+            sorted(SecurityEvent.objects.values_list('event_type', flat=True)),
+            ['request_complete', 'request_start']
+        )
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RBAC_AUDIT_SETTINGS=SYNC_AUDIT)
+class SecurityMonitoringCounterTestCase(TestCase):
+    """Test sliding-window thresholds of SecurityMonitoringMiddleware"""
+    
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.counter = SecurityCounter()
+    
+    def test_local_counter_weights_previous_window(self):
+        """The estimate decays the previous bucket over the current window"""
+        counter = LocalWindowCounter()
+        for _ in range(10):
+            counter.hit('requests:1.2.3.4', 60, now=600.0)
+        
+        # Halfway through the next window half the old hits still count
+        self.assertEqual(counter.hit('requests:1.2.3.4', 60, now=690.0), 6.0)
+        # Two windows later nothing from the first burst is left
+        self.assertEqual(counter.hit('requests:1.2.3.4', 60, now=800.0), 1.0)
+    
+    def test_threshold_reported_once_per_window(self):
+        """check() fires only when the threshold is first reached"""
+        for backend in ['cache', 'local']:
+            with self.subTest(backend=backend), override_settings(
+                RBAC_SETTINGS={'SECURITY_COUNTER_BACKEND': backend}
+            ):
+                results = [
+                    self.counter.check('failed_auth', backend, 3, 3600)
+                    for _ in range(6)
+                ]
+                self.assertEqual(results, [False, False, True, False, False, False])
+    
+    def test_middleware_writes_event_only_when_threshold_crossed(self):
+        """Unauthorized responses are counted without querying security_events"""
+        middleware = SecurityMonitoringMiddleware(
+            lambda request: HttpResponse(status=401)
+        )
+        threshold = middleware.RATE_LIMIT_THRESHOLDS['failed_auth_per_hour']
+        
+        with mock.patch('accounts.rbac_middleware.get_security_counter', return_value=self.counter):
+            with self.assertNumQueries(0):
+                for _ in range(threshold - 1):
+                    request = self.factory.get('/api/v1/accounts/profile/')
+                    request.user = AnonymousUser()
+                    middleware(request)
+            
+            for _ in range(3):
+                request = self.factory.get('/api/v1/accounts/profile/')
+                request.user = AnonymousUser()
+                middleware(request)
+        
+        self.assertEqual(
+            list(SecurityEvent.objects.values_list('event_type', flat=True)),
+            ['multiple_failed_logins']
+        )
+
+
+@override_settings(RATE_LIMITER_SETTINGS={'BACKEND': 'local'})
+class SharedRateLimiterTestCase(TestCase):
+    """Test the GCRA rate limiter and the middleware using it"""
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.limiter = RateLimiter()
+    
+    def test_gcra_allows_burst_then_spaces_requests(self):
+        """N requests pass back to back, then one per emission interval"""
+        backend = LocalRateLimitBackend(shards=4)
+        results = [backend.hit('ip:login', 30.0, 300.0, now=1000.0) for _ in range(11)]
+        
+        self.assertEqual([allowed for allowed, _, _ in results], [True] * 10 + [False])
+        self.assertEqual(results[0][2], 9)
+        self.assertEqual(results[-1][1], 30.0)
+        self.assertTrue(backend.hit('ip:login', 30.0, 300.0, now=1030.0)[0])
+    
+    def test_idle_keys_are_swept(self):
+        """Keys whose TAT has passed are dropped, keeping memory bounded"""
+        backend = LocalRateLimitBackend(shards=1)
+        backend.SWEEP_EVERY_WRITES = 3
+        backend.hit('a', 1.0, 5.0, now=0.0)
+        backend.hit('b', 1.0, 5.0, now=0.0)
+        backend.hit('c', 1.0, 5.0, now=10.0)
+        
+        self.assertEqual(len(backend), 1)
+    
+    @override_settings(RATE_LIMITER_SETTINGS={'BACKEND': 'redis', 'REDIS_URL': 'redis://unused'})
+    def test_falls_back_to_local_backend_when_redis_fails(self):
+        """A Redis error degrades to per-process limiting instead of failing"""
+        shared = mock.Mock()
+        shared.hit.side_effect = ConnectionError('redis down')
+        
+        with mock.patch.object(self.limiter, '_get_shared_backend', return_value=shared):
+            result = self.limiter.check('ip:path', 2, 60)
+        
+        self.assertTrue(result.allowed)
+        self.assertEqual(result.remaining, 1)
+        self.assertEqual(len(self.limiter.local), 1)
+    
+    def test_middleware_limits_login_attempts(self):
+        """Sensitive endpoints return 429 with Retry-After once exhausted"""
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        
+        with mock.patch('accounts.rate_limit_middleware.get_rate_limiter', return_value=self.limiter):
+            statuses = []
+            for _ in range(11):
+                request = self.factory.post('/api/v1/accounts/login/')
+                request.user = AnonymousUser()
+                statuses.append(middleware(request))
+        
+        self.assertEqual([r.status_code for r in statuses], [200] * 10 + [429])
+        self.assertIn('Retry-After', statuses[-1])
+    
+    def test_authenticated_users_limited_by_tier(self):
+        """Authenticated requests share one per-user tier allowance"""
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        request = self.factory.get('/api/v1/rides/')
+        request.user = mock.Mock(is_authenticated=True, pk=42, tier='vip')
+        
+        key, rate_limit = middleware.get_rate_limit(request)
+        
+        self.assertEqual(key, 'user:42')
+        self.assertEqual(rate_limit['requests'], 5000)
+        self.assertEqual(rate_limit['window'], 3600)
+    
+    def test_bearer_token_clients_limited_by_tier(self):
+        """API clients are keyed by their access token before DRF authenticates them"""
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        token = AccessToken()
+        token['user_id'] = 42
+        token['user_tier'] = 'vip'
+        request = self.factory.get('/api/v1/rides/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        request.user = AnonymousUser()
+        
+        key, rate_limit = middleware.get_rate_limit(request)
+        
+        self.assertEqual(key, 'user:42')
+        self.assertEqual(rate_limit['requests'], 5000)
+        
+        request = self.factory.get('/api/v1/rides/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        request.user = AnonymousUser()
+        self.assertEqual(middleware.get_rate_limit(request)[0], '127.0.0.1:/api/v1/rides/')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SessionRegistryTestCase(TestCase):
+    """Test cached session-limit enforcement in TierBasedAccessToken.verify"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='sessions@example.com',
+            password='test123',
+            phone_number='+2348000000001'
+        )
+        base = timezone.now()
+        self.sessions = []
+        for minutes in range(5):
+            session = UserSession.objects.create(
+                user=self.user,
+                session_id=f'session-{minutes}',
+                ip_address='10.0.0.1',
+                expires_at=base + timedelta(days=1),
+            )
+            # Oldest first: session-0 was created five minutes before session-4
+            UserSession.objects.filter(pk=session.pk).update(
+                created_at=base - timedelta(minutes=5 - minutes)
+            )
+            self.sessions.append(session)
+        get_session_registry().invalidate(self.user.id)
+    
+    def _token(self, session_id='session-4'):
+        token = TierBasedAccessToken()
+        token['user_id'] = self.user.id
+        token['user_tier'] = 'normal'
+        token['session_id'] = session_id
+        return token
+    
+    def test_verify_uses_cached_registry(self):
+        """After the first lookup verify runs without SQL queries"""
+        self.user.sessions.filter(session_id__in=['session-0', 'session-1']).delete()
+        token = self._token()
+        token.verify()
+        
+        with self.assertNumQueries(0):
+            token.verify()
+    
+    def test_oldest_sessions_evicted_in_bulk(self):
+        """Sessions over the tier limit are revoked with one update"""
+        token = self._token()
+        
+        with self.assertNumQueries(3):
+            # Registry load, bulk deactivation, registry reload afterwards
+            token.verify()
+            token.verify()
+        
+        self.assertEqual(
+            sorted(UserSession.objects.filter(is_active=False).values_list('session_id', flat=True)),
+            ['session-0', 'session-1']
+        )
+        with self.assertRaises(TokenError):
+            self._token('session-0').verify()
+    
+    def test_blacklisted_token_rejected(self):
+        """A blacklisted jti is rejected from the same cache read"""
+        token = self._token()
+        cache.set(f"blacklisted_token:{token['jti']}", True)
+        
+        with self.assertRaises(TokenError):
+            token.verify()
+    
+    def test_new_session_invalidates_registry(self):
+        """Creating a session makes the next lookup reload from the database"""
+        registry = get_session_registry()
+        self.assertEqual(registry.active_count(registry.lookup(self.user.id, None, None)[2]), 5)
+        
+        UserSession.objects.create(
+            user=self.user,
+            session_id='session-new',
+            ip_address='10.0.0.2',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        
+        self.assertEqual(registry.active_count(registry.lookup(self.user.id, None, None)[2]), 6)
@@ -16,6 +16,7 @@ from django.utils import timezone
 
 from .jwt_config import USER_TIER_SETTINGS, MFA_SETTINGS
 from .models import UserSession, MFAToken
+from .session_registry import blacklisted_token_key, get_session_registry
 
 User = get_user_model()
 
@@ -72,12 +73,24 @@ class TierBasedAccessToken(AccessToken):
 
     def verify(self, verify_signature=True):
         """Enhanced verification with security checks"""
-        super().verify(verify_signature)
+        super().verify()
         
-        # Check if token is blacklisted
+        # Blacklist flags and active sessions come back in one cache round-trip
         token_id = self.get('jti')
-        if cache.get(f'blacklisted_token:{token_id}'):
+        user_id = self.get('user_id')
+        session_id = self.get('session_id')
+        if user_id:
+            token_blacklisted, session_blacklisted, sessions = (
+                get_session_registry().lookup(user_id, session_id, token_id)
+            )
+        else:
+            token_blacklisted = bool(cache.get(blacklisted_token_key(token_id)))
+            session_blacklisted, sessions = False, {}
+        
+        if token_blacklisted:
             raise TokenError('Token is blacklisted')
+        if session_blacklisted:
+            raise TokenError('Session has been revoked')
         
         # Verify MFA for VIP users if required
         user_tier = self.get('user_tier', 'normal')
@@ -89,12 +102,11 @@ class TierBasedAccessToken(AccessToken):
             raise TokenError('MFA verification required for VIP users')
         
         # Check concurrent session limits
-        user_id = self.get('user_id')
-        session_id = self.get('session_id')
         if user_id and session_id:
-            self._check_session_limits(user_id, session_id, user_tier)
+            self._check_session_limits(user_id, session_id, user_tier, sessions)
 
-    def _check_session_limits(self, user_id: str, session_id: str, user_tier: str):
+    def _check_session_limits(self, user_id: str, session_id: str, user_tier: str,
+                              sessions: Dict = None):
         """Check concurrent session limits based on user tier"""
         from .jwt_config import SECURITY_SETTINGS
         
@@ -102,29 +114,13 @@ class TierBasedAccessToken(AccessToken):
             user_tier, 3
         )
         
-        # Count active sessions for user
-        active_sessions = UserSession.objects.filter(
-            user_id=user_id,
-            is_active=True,
-            expires_at__gt=timezone.now()
-        ).count()
-        
-        if active_sessions > max_sessions:
-            # Deactivate oldest sessions
-            oldest_sessions = UserSession.objects.filter(
-                user_id=user_id,
-                is_active=True
-            ).order_by('created_at')[:-max_sessions]
-            
-            for session in oldest_sessions:
-                session.is_active = False
-                session.save()
-                # Blacklist associated tokens
-                cache.set(
-                    f'blacklisted_session:{session.session_id}',
-                    True,
-                    timeout=86400  # 24 hours
-                )
+        registry = get_session_registry()
+        if sessions is None:
+            sessions = registry.lookup(user_id, session_id, None)[2]
+        
+        # Deactivate oldest sessions in bulk, only when over the limit
+        if registry.active_count(sessions) > max_sessions:
+            registry.enforce_limit(user_id, session_id, sessions, max_sessions)
 
 
 class TierBasedRefreshToken(RefreshToken):
@@ -169,7 +165,7 @@ class TierBasedRefreshToken(RefreshToken):
         tier_config = USER_TIER_SETTINGS.get(user.tier, USER_TIER_SETTINGS['normal'])
         token.set_exp(lifetime=tier_config['refresh_token_lifetime'])
         
-        # Create user session record
+        # Create user session record (its post_save refreshes the session registry)
         UserSession.objects.create(
             user=user,
             session_id=token['session_id'],
@@ -215,15 +211,7 @@ class TierBasedRefreshToken(RefreshToken):
         # Blacklist session
         session_id = self.get('session_id')
         if session_id:
-            UserSession.objects.filter(
-                session_id=session_id
-            ).update(is_active=False)
-            
-            cache.set(
-                f'blacklisted_session:{session_id}',
-                True,
-                timeout=86400  # 24 hours
-            )
+            get_session_registry().revoke(self.get('user_id'), [session_id])
 
 
 class VIPSecureToken(TierBasedAccessToken):
@@ -261,7 +249,7 @@ class VIPSecureToken(TierBasedAccessToken):
 
     def verify(self, verify_signature=True):
         """Enhanced verification for VIP tokens"""
-        super().verify(verify_signature)
+        super().verify()
         
         # Additional VIP security checks
         user_id = self.get('user_id')
@@ -0,0 +1,174 @@
+# Buffered Bulk Writer
+"""
+Background writer that keeps audit-style inserts off the request path.
+
+Callers enqueue unsaved model instances; a daemon thread writes them with
+bulk_create every FLUSH_INTERVAL_MS or as soon as BATCH_SIZE rows are
+waiting. When the queue is full new rows are dropped instead of blocking
+the caller. Subclasses name their model, settings and sampling policy.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WRITER_SETTINGS = {
+    'ASYNC_ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL_MS': 500,
+    'MAX_QUEUE_SIZE': 10000,
+}
+
+
+class BufferedBulkWriter:
+    """
+    Queue of unsaved model instances flushed with bulk_create
+
+    Subclasses set settings_name, the Django setting merged over
+    default_settings on every enqueue so writers can be tuned without a
+    restart, and implement get_model(). With ASYNC_ENABLED off rows are
+    written before enqueue() returns. The worker thread is restarted in
+    forked worker processes, and queued rows are flushed when a worker
+    shuts down cleanly.
+    """
+
+    settings_name = ''
+    default_settings: Dict = DEFAULT_WRITER_SETTINGS
+    thread_name = 'buffered-bulk-writer'
+    label = 'Buffered writer'
+    stat_names: Tuple[str, ...] = ('dropped', 'written', 'failed')
+
+    def __init__(self):
+        self._queue: Optional[queue.Queue] = None
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._exit_flush_registered = False
+        self.stats = {name: 0 for name in self.stat_names}
+
+    def get_model(self):
+        """Get the model class whose rows are written"""
+        raise NotImplementedError
+
+    def after_write(self, rows: List) -> None:
+        """Hook run after a batch is written"""
+
+    def get_config(self) -> Dict:
+        """Get writer settings merged over the defaults"""
+        return {**self.default_settings, **getattr(settings, self.settings_name, {})}
+
+    def enqueue(self, rows: Iterable, config: Dict) -> None:
+        """Queue rows for writing, or write them now when async writes are off"""
+        rows = list(rows)
+        if not rows:
+            return
+
+        if not config['ASYNC_ENABLED']:
+            self._write(rows, config['BATCH_SIZE'])
+            return
+
+        row_queue = self._ensure_worker(config)
+        dropped = 0
+        for row in rows:
+            try:
+                row_queue.put_nowait(row)
+            except queue.Full:
+                dropped += 1
+
+        if dropped:
+            self._count('dropped', dropped)
+            logger.warning(f"{self.label} queue full, dropped {dropped} rows")
+
+        if row_queue.qsize() >= config['BATCH_SIZE']:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write everything currently queued; returns the number of rows written"""
+        if self._queue is None:
+            return 0
+
+        batch_size = self.get_config()['BATCH_SIZE']
+        written = 0
+
+        with self._flush_lock:
+            while True:
+                batch = self._drain(batch_size)
+                if not batch:
+                    break
+                written += self._write(batch, batch_size)
+
+        return written
+
+    def _drain(self, limit: int) -> List:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows: List, batch_size: int) -> int:
+        try:
+            self.get_model().objects.bulk_create(rows, batch_size=batch_size)
+            self.after_write(rows)
+            self._count('written', len(rows))
+            return len(rows)
+        except Exception as e:
+            self._count('failed', len(rows))
+            logger.error(f"{self.label} failed to write {len(rows)} rows: {e}")
+            return 0
+
+    def _ensure_worker(self, config: Dict) -> queue.Queue:
+        """Start the flush thread, restarting it in forked worker processes"""
+        if self._thread is not None and self._pid == os.getpid():
+            return self._queue
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=config['MAX_QUEUE_SIZE'])
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name=self.thread_name, daemon=True
+                )
+                self._thread.start()
+                # Forked children inherit the handler, so register only once
+                if not self._exit_flush_registered:
+                    atexit.register(self.flush)
+                    self._exit_flush_registered = True
+
+        return self._queue
+
+    def _run(self) -> None:
+        while True:
+            interval = self.get_config()['FLUSH_INTERVAL_MS'] / 1000.0
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"{self.label} flush failed: {e}")
+            finally:
+                close_old_connections()
+
+    def _count(self, key: str, amount: int) -> None:
+        if amount:
+            with self._lock:
+                self.stats[key] += amount
+
+    def get_stats(self) -> Dict:
+        """Get writer statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
@@ -80,6 +80,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'core.gps_tasks.process_data_retention',
         'schedule': 3600.0,  # Every hour
     },
+    'maintain-gps-partitions': {
+        'task': 'core.gps_tasks.maintain_gps_partitions',
+        'schedule': 21600.0,  # Every 6 hours
+    },
     'monitor-gps-encryption-performance': {
         'task': 'core.gps_tasks.monitor_encryption_performance',
         'schedule': 900.0,  # Every 15 minutes
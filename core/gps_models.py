@@ -87,7 +87,10 @@ class EncryptedGPSData(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='encrypted_gps_data'
+        null=True,
+        blank=True,
+        related_name='encrypted_gps_data',
+        help_text="Cleared when retention anonymizes the data"
     )
     
     # Additional encrypted fields (optional)
@@ -111,7 +114,8 @@ class EncryptedGPSData(models.Model):
         ordering = ['timestamp']
     
     def __str__(self):
-        return f"Encrypted GPS data for {self.user.email} at {self.timestamp}"
+        owner = self.user.email if self.user else 'anonymized user'
+        return f"Encrypted GPS data for {owner} at {self.timestamp}"
 
 
 class GPSDecryptionLog(models.Model):
@@ -126,9 +130,11 @@ class GPSDecryptionLog(models.Model):
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # No database constraint: encrypted_gps_data is partitioned on PostgreSQL
     gps_data = models.ForeignKey(
         EncryptedGPSData,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name='decryption_logs'
     )
     
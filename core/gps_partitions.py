@@ -0,0 +1,72 @@
+# GPS Table Partitioning
+"""
+Partition maintenance for the time-partitioned GPS tables
+
+On PostgreSQL, database/10_gps_partitioning.sql turns gps_locations and
+encrypted_gps_data into daily range partitions. These helpers call its
+functions to create upcoming partitions and to retire expired ones whole.
+On other databases, or before the script has run, is_partitioned() is
+False and callers fall back to row-level queries.
+"""
+
+import logging
+from datetime import datetime
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ('gps_locations', 'encrypted_gps_data')
+
+
+def is_partitioned(table: str) -> bool:
+    """Check whether a GPS table is a partitioned PostgreSQL table"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def ensure_partitions(table: str, days_ahead: int = 7) -> int:
+    """Create the daily partitions of a table from today to days_ahead days ahead"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT public.create_gps_partitions(%s, %s)", [table, days_ahead])
+        return cursor.fetchone()[0]
+
+
+def default_partition_rows(table: str) -> int:
+    """
+    Count the rows of a table that sit in its default partition
+
+    ensure_partitions moves a day's rows out of the default partition when
+    it creates that day, so rows left here have timestamps outside every
+    created day (e.g. a device clock far in the future). They are never
+    retired by drop_partitions_before.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM public."{table}_default"')
+        return cursor.fetchone()[0]
+
+
+def drop_partitions_before(table: str, cutoff: datetime, segment: str = None,
+                           archive: bool = False) -> int:
+    """
+    Retire the daily partitions of a table that end on or before cutoff
+
+    Partitions are detached and dropped, or moved to the archive schema
+    when archive is set. segment retires only the 'std' (plain) or 'vip'
+    (encrypted) half of gps_locations days; a day with neither half left
+    is dropped too. Rows from the cutoff's own day stay until that whole
+    day has expired. Returns the number of rows retired.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT public.drop_gps_partitions_before(%s, %s, %s, %s)",
+            [table, cutoff.date(), segment, archive]
+        )
+        return cursor.fetchone()[0]
@@ -17,6 +17,13 @@ from core.gps_models import (
     GPSEncryptionAudit,
     GPSDataRetentionSchedule
 )
+from core.gps_partitions import (
+    PARTITIONED_TABLES,
+    default_partition_rows,
+    drop_partitions_before,
+    ensure_partitions,
+    is_partitioned
+)
 
 logger = logging.getLogger(__name__)
 
@@ -107,25 +114,36 @@ def process_data_retention(self, schedule_id=None):
                 processed_count = 0
                 failed_count = 0
                 
+                # Whole expired partitions are retired without touching rows
+                whole_table = schedule.applies_to_all or not schedule.user_tier
+                use_partitions = whole_table and is_partitioned('encrypted_gps_data')
+                
                 # Process data according to retention action
                 if schedule.action == 'delete':
-                    deleted_count = data_query.delete()[0]
-                    processed_count = deleted_count
+                    if use_partitions:
+                        processed_count = drop_partitions_before(
+                            'encrypted_gps_data', cutoff_date
+                        )
+                    else:
+                        processed_count = data_query.delete()[0]
                     
                 elif schedule.action == 'anonymize':
-                    # Anonymize GPS data (remove user association)
-                    for data_item in data_query.iterator(chunk_size=100):
-                        try:
-                            data_item.user = None
-                            data_item.save()
-                            processed_count += 1
-                        except Exception as e:
-                            logger.error(f"Failed to anonymize data {data_item.id}: {e}")
-                            failed_count += 1
+                    # Anonymize GPS data (remove user association) in one statement
+                    try:
+                        processed_count = data_query.update(user=None)
+                    except Exception as e:
+                        logger.error(f"Failed to anonymize data for schedule {schedule.id}: {e}")
+                        failed_count = data_count
                 
                 elif schedule.action == 'archive':
-                    # Move to archive storage (implement as needed)
-                    logger.info(f"Archive action not implemented for schedule {schedule.id}")
+                    if use_partitions:
+                        processed_count = drop_partitions_before(
+                            'encrypted_gps_data', cutoff_date, archive=True
+                        )
+                    else:
+                        logger.info(
+                            f"Archive action needs partitioned storage for schedule {schedule.id}"
+                        )
                 
                 # Update schedule statistics
                 schedule.records_processed += processed_count
@@ -168,6 +186,28 @@ def process_data_retention(self, schedule_id=None):
         raise self.retry(exc=exc)
 
 
+@shared_task(bind=True, max_retries=3, default_retry_delay=300)
+def maintain_gps_partitions(self, days_ahead=7):
+    """Create the upcoming daily partitions of the partitioned GPS tables"""
+    try:
+        created = {}
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(table):
+                created[table] = ensure_partitions(table, days_ahead)
+                stray_rows = default_partition_rows(table)
+                if stray_rows:
+                    logger.warning(
+                        f"{stray_rows} {table} rows are in the default partition "
+                        f"and outside every daily partition"
+                    )
+        
+        return {'partitioned_tables': created}
+        
+    except Exception as exc:
+        logger.error(f"GPS partition maintenance failed: {exc}")
+        raise self.retry(exc=exc)
+
+
 @shared_task(bind=True, max_retries=5, default_retry_delay=30)
 def encrypt_gps_batch(self, gps_data_batch, session_id):
     """Encrypt a batch of GPS coordinates in background"""
@@ -486,6 +526,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'core.gps_tasks.process_data_retention',
         'schedule': 3600.0,  # Every hour
     },
+    'maintain-gps-partitions': {
+        'task': 'core.gps_tasks.maintain_gps_partitions',
+        'schedule': 21600.0,  # Every 6 hours
+    },
     'monitor-gps-encryption-performance': {
         'task': 'core.gps_tasks.monitor_encryption_performance',
         'schedule': 900.0,  # Every 15 minutes
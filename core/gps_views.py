@@ -451,7 +451,7 @@ class GPSDecryptionView(APIView):
                             'bearing': gps_coords.bearing,
                             'altitude': gps_coords.altitude,
                             'accuracy': gps_coords.accuracy,
-                            'user_email': encrypted_gps.user.email,
+                            'user_email': encrypted_gps.user.email if encrypted_gps.user else None,
                             'recorded_at': encrypted_gps.recorded_at,
                             'source_device': encrypted_gps.source_device
                         })
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='encryptedgpsdata',
+            name='user',
+            field=models.ForeignKey(blank=True, help_text='Cleared when retention anonymizes the data', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='encrypted_gps_data', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='gpsdecryptionlog',
+            name='gps_data',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='decryption_logs', to='core.encryptedgpsdata'),
+        ),
+    ]
@@ -0,0 +1,231 @@
+-- Time-Partitioned GPS Storage
+-- Daily partitions for the Django-managed GPS tables (gps_locations, encrypted_gps_data).
+-- Retention drops or archives whole partitions instead of deleting rows.
+--
+-- Run once, in a maintenance window, after `python manage.py migrate` (the
+-- migrations drop the foreign keys that point into these tables, which a
+-- partitioned table cannot serve). Partition bounds are UTC days.
+--
+-- gps_locations is range partitioned by server_timestamp and every day is
+-- split by whether the row is encrypted, so plain (Normal/Premium) and VIP
+-- locations can be retired on different schedules:
+--   gps_locations_2025_01_31        FOR VALUES FROM ('2025-01-31 00:00 UTC') TO ('2025-02-01 00:00 UTC')
+--     gps_locations_2025_01_31_std  encrypted_coordinates IS NULL
+--     gps_locations_2025_01_31_vip  encrypted_coordinates IS NOT NULL
+-- encrypted_gps_data is range partitioned by recorded_at.
+
+-- Create the partition(s) of a GPS table for one UTC day
+-- Rows that already landed in the default partition for that day would
+-- block CREATE TABLE ... PARTITION OF, so the default partition is
+-- detached, the day is created, its rows are moved over and the default
+-- partition is reattached, all in the caller's transaction.
+CREATE OR REPLACE FUNCTION public.create_daily_gps_partition(parent_table TEXT, partition_date DATE)
+RETURNS VOID AS $$
+DECLARE
+    partition_name TEXT;
+    default_name TEXT;
+    key_column TEXT;
+    lower_bound TEXT;
+    upper_bound TEXT;
+    has_stray_rows BOOLEAN := FALSE;
+BEGIN
+    partition_name := parent_table || '_' || to_char(partition_date, 'YYYY_MM_DD');
+    default_name := parent_table || '_default';
+    -- Bounds are UTC midnights whatever the session TimeZone is
+    lower_bound := format('((%L::date)::timestamp AT TIME ZONE ''UTC'')', partition_date);
+    upper_bound := format('((%L::date)::timestamp AT TIME ZONE ''UTC'')', partition_date + 1);
+
+    IF parent_table = 'gps_locations' THEN
+        key_column := 'server_timestamp';
+    ELSIF parent_table = 'encrypted_gps_data' THEN
+        key_column := 'recorded_at';
+    ELSE
+        RAISE EXCEPTION 'Unknown partitioned GPS table: %', parent_table;
+    END IF;
+
+    IF to_regclass(format('public.%I', partition_name)) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    IF to_regclass(format('public.%I', default_name)) IS NOT NULL THEN
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM public.%I WHERE %I >= %s AND %I < %s)',
+                       default_name, key_column, lower_bound, key_column, upper_bound)
+            INTO has_stray_rows;
+    END IF;
+    IF has_stray_rows THEN
+        EXECUTE format('ALTER TABLE public.%I DETACH PARTITION public.%I', parent_table, default_name);
+    END IF;
+
+    IF parent_table = 'gps_locations' THEN
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.gps_locations
+                        FOR VALUES FROM (%s) TO (%s)
+                        PARTITION BY LIST ((encrypted_coordinates IS NOT NULL))',
+                       partition_name, lower_bound, upper_bound);
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES IN (FALSE)',
+                       partition_name || '_std', partition_name);
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES IN (TRUE)',
+                       partition_name || '_vip', partition_name);
+        -- Expression partitioning rules out a parent primary key, so ids are unique per leaf
+        EXECUTE format('CREATE UNIQUE INDEX %I ON public.%I(id)',
+                       partition_name || '_std_id', partition_name || '_std');
+        EXECUTE format('CREATE UNIQUE INDEX %I ON public.%I(id)',
+                       partition_name || '_vip_id', partition_name || '_vip');
+    ELSE
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.encrypted_gps_data
+                        FOR VALUES FROM (%s) TO (%s)',
+                       partition_name, lower_bound, upper_bound);
+    END IF;
+
+    IF has_stray_rows THEN
+        EXECUTE format('WITH moved AS (DELETE FROM public.%I WHERE %I >= %s AND %I < %s RETURNING *)
+                        INSERT INTO public.%I SELECT * FROM moved',
+                       default_name, key_column, lower_bound, key_column, upper_bound, parent_table);
+        EXECUTE format('ALTER TABLE public.%I ATTACH PARTITION public.%I DEFAULT', parent_table, default_name);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create the daily partitions from today up to days_ahead days ahead
+CREATE OR REPLACE FUNCTION public.create_gps_partitions(parent_table TEXT, days_ahead INTEGER DEFAULT 7)
+RETURNS INTEGER AS $$
+DECLARE
+    day_offset INTEGER;
+BEGIN
+    FOR day_offset IN 0..days_ahead LOOP
+        PERFORM public.create_daily_gps_partition(parent_table, (NOW() AT TIME ZONE 'UTC')::DATE + day_offset);
+    END LOOP;
+    RETURN days_ahead + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retire the daily partitions that end on or before cutoff
+-- segment: NULL for whole days, 'std' or 'vip' for one half of a gps_locations day;
+--          a day whose halves are both retired is dropped as well.
+-- archive: move the partitions to the archive schema instead of dropping them.
+-- Returns the number of rows retired.
+CREATE OR REPLACE FUNCTION public.drop_gps_partitions_before(
+    parent_table TEXT,
+    cutoff DATE,
+    segment TEXT DEFAULT NULL,
+    archive BOOLEAN DEFAULT FALSE
+)
+RETURNS BIGINT AS $$
+DECLARE
+    partition_name TEXT;
+    target_name TEXT;
+    partition_rows BIGINT;
+    retired_rows BIGINT := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = parent_table
+          AND child.relname ~ ('^' || parent_table || '_[0-9]{4}_[0-9]{2}_[0-9]{2}$')
+          AND to_date(right(child.relname, 10), 'YYYY_MM_DD') + 1 <= cutoff
+        ORDER BY child.relname
+    LOOP
+        target_name := CASE WHEN segment IS NULL THEN partition_name
+                            ELSE partition_name || '_' || segment END;
+
+        -- A segment may already be retired; its day can still need dropping below
+        IF to_regclass(format('public.%I', target_name)) IS NOT NULL THEN
+            EXECUTE format('SELECT count(*) FROM public.%I', target_name) INTO partition_rows;
+            EXECUTE format('ALTER TABLE public.%I DETACH PARTITION public.%I',
+                           CASE WHEN segment IS NULL THEN parent_table ELSE partition_name END,
+                           target_name);
+            IF archive THEN
+                EXECUTE format('ALTER TABLE public.%I SET SCHEMA archive', target_name);
+            ELSE
+                EXECUTE format('DROP TABLE public.%I', target_name);
+            END IF;
+            retired_rows := retired_rows + partition_rows;
+        END IF;
+
+        -- Once both halves of a day are gone, drop the empty day table itself
+        IF segment IS NOT NULL
+           AND to_regclass(format('public.%I', partition_name || '_std')) IS NULL
+           AND to_regclass(format('public.%I', partition_name || '_vip')) IS NULL THEN
+            EXECUTE format('ALTER TABLE public.%I DETACH PARTITION public.%I',
+                           parent_table, partition_name);
+            EXECUTE format('DROP TABLE public.%I', partition_name);
+        END IF;
+    END LOOP;
+
+    RETURN retired_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Convert gps_locations
+BEGIN;
+
+ALTER TABLE public.gps_locations RENAME TO gps_locations_unpartitioned;
+
+CREATE TABLE public.gps_locations (
+    LIKE public.gps_locations_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (server_timestamp);
+
+-- Catches rows if partition creation ever falls behind; create_daily_gps_partition
+-- moves them into their day once it exists
+CREATE TABLE public.gps_locations_default PARTITION OF public.gps_locations DEFAULT;
+
+SELECT public.create_daily_gps_partition('gps_locations', day::DATE)
+FROM generate_series(
+    COALESCE((SELECT min(server_timestamp) FROM public.gps_locations_unpartitioned), NOW()) AT TIME ZONE 'UTC',
+    (NOW() AT TIME ZONE 'UTC') + INTERVAL '7 days',
+    INTERVAL '1 day'
+) AS day;
+
+INSERT INTO public.gps_locations SELECT * FROM public.gps_locations_unpartitioned;
+DROP TABLE public.gps_locations_unpartitioned;
+
+ALTER TABLE public.gps_locations
+    ADD FOREIGN KEY (user_id) REFERENCES public.users(id) DEFERRABLE INITIALLY DEFERRED,
+    ADD FOREIGN KEY (ride_id) REFERENCES public.rides(id) DEFERRABLE INITIALLY DEFERRED;
+
+-- Same names as the Django model indexes
+CREATE INDEX gps_locatio_user_id_f23ab7_idx ON public.gps_locations(user_id, server_timestamp DESC);
+CREATE INDEX gps_locatio_ride_id_fa0341_idx ON public.gps_locations(ride_id, server_timestamp DESC);
+CREATE INDEX gps_locatio_device__1f4509_idx ON public.gps_locations(device_timestamp);
+CREATE INDEX gps_locatio_sync_st_f94c9d_idx ON public.gps_locations(sync_status);
+
+COMMIT;
+
+-- Convert encrypted_gps_data
+BEGIN;
+
+ALTER TABLE public.encrypted_gps_data RENAME TO encrypted_gps_data_unpartitioned;
+
+CREATE TABLE public.encrypted_gps_data (
+    LIKE public.encrypted_gps_data_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+    PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+CREATE TABLE public.encrypted_gps_data_default PARTITION OF public.encrypted_gps_data DEFAULT;
+
+SELECT public.create_daily_gps_partition('encrypted_gps_data', day::DATE)
+FROM generate_series(
+    COALESCE((SELECT min(recorded_at) FROM public.encrypted_gps_data_unpartitioned), NOW()) AT TIME ZONE 'UTC',
+    (NOW() AT TIME ZONE 'UTC') + INTERVAL '7 days',
+    INTERVAL '1 day'
+) AS day;
+
+INSERT INTO public.encrypted_gps_data SELECT * FROM public.encrypted_gps_data_unpartitioned;
+DROP TABLE public.encrypted_gps_data_unpartitioned;
+
+ALTER TABLE public.encrypted_gps_data
+    ADD FOREIGN KEY (user_id) REFERENCES public.users(id) DEFERRABLE INITIALLY DEFERRED,
+    ADD FOREIGN KEY (session_id) REFERENCES public.gps_encryption_sessions(id) DEFERRABLE INITIALLY DEFERRED;
+
+CREATE INDEX encrypted_g_session_b0acb0_idx ON public.encrypted_gps_data(session_id, timestamp);
+CREATE INDEX encrypted_g_user_id_674a6d_idx ON public.encrypted_gps_data(user_id, recorded_at);
+CREATE INDEX encrypted_g_timesta_03c8b9_idx ON public.encrypted_gps_data(timestamp);
+CREATE INDEX encrypted_g_recorde_3c765b_idx ON public.encrypted_gps_data(recorded_at);
+
+COMMIT;
+
+-- Comments
+COMMENT ON TABLE public.gps_locations IS 'Daily partitions by server_timestamp, split into plain and encrypted rows';
+COMMENT ON TABLE public.encrypted_gps_data IS 'Daily partitions by recorded_at';
+COMMENT ON FUNCTION public.drop_gps_partitions_before(TEXT, DATE, TEXT, BOOLEAN) IS 'GPS retention by dropping or archiving whole partitions';
@@ -0,0 +1,148 @@
+"""
+Location Broadcast Fan-out for Real-time Tracking
+Coalesces live location broadcasts per user and group before they hit the channel layer
+"""
+
+import asyncio
+import time
+import logging
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTROL_CENTER_VIP_GROUP = 'control_center_vip'
+
+
+def encode_batch(updates: Dict[str, Tuple[str, float]]) -> Dict:
+    """
+    Encode {user_id: (location_id, epoch seconds)} as a compact batch frame
+
+    Rows are [user_id, location_id, ms after base_ts] so a frame carries one
+    absolute timestamp and small integer deltas.
+    """
+    base_ts = int(min(timestamp for _, timestamp in updates.values()) * 1000)
+    return {
+        'base_ts': base_ts,
+        'updates': [
+            [user_id, location_id, int(timestamp * 1000) - base_ts]
+            for user_id, (location_id, timestamp) in updates.items()
+        ]
+    }
+
+
+def decode_batch(frame: Dict) -> List[Dict]:
+    """Expand a batch frame into one dict per user update"""
+    base_ts = frame['base_ts']
+    return [
+        {
+            'user_id': user_id,
+            'location_id': location_id,
+            'timestamp': datetime.fromtimestamp(
+                (base_ts + delta_ms) / 1000, tz=dt_timezone.utc
+            ).isoformat()
+        }
+        for user_id, location_id, delta_ms in frame['updates']
+    ]
+
+
+class LocationFanout:
+    """
+    Per-process, latest-wins coalescing of location broadcasts
+
+    Each group gets at most one channel-layer send per window. Updates
+    published in between replace earlier ones from the same user, so the
+    latest position of every user is always delivered. The control center
+    group receives a single 'vip_location_batch' frame per window; ride
+    groups keep receiving one 'ride_location_update' per user.
+    """
+
+    DEFAULT_CONTROL_CENTER_WINDOW_MS = 1000
+    DEFAULT_RIDE_WINDOW_MS = 250
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Tuple[str, float]]] = {}
+        self._handles: Dict[str, asyncio.TimerHandle] = {}
+        # The loop only holds tasks weakly; keep running sends alive
+        self._send_tasks: Set[asyncio.Task] = set()
+        self.stats = {'published': 0, 'coalesced': 0, 'sends': 0, 'send_errors': 0}
+
+    def _window_seconds(self, setting_name: str, default_ms: int) -> float:
+        return getattr(settings, 'GPS_TRACKING', {}).get(setting_name, default_ms) / 1000.0
+
+    def publish_vip(self, user_id: str, location_id: str, timestamp: float = None) -> None:
+        """Queue a VIP location update for the control center"""
+        self._publish(
+            CONTROL_CENTER_VIP_GROUP, user_id, location_id, timestamp,
+            self._window_seconds('CONTROL_CENTER_BROADCAST_WINDOW_MS',
+                                 self.DEFAULT_CONTROL_CENTER_WINDOW_MS)
+        )
+
+    def publish_ride(self, ride_id: str, user_id: str, location_id: str,
+                     timestamp: float = None) -> None:
+        """Queue a location update for the participants of a ride"""
+        self._publish(
+            f"ride_{ride_id}", user_id, location_id, timestamp,
+            self._window_seconds('RIDE_BROADCAST_WINDOW_MS', self.DEFAULT_RIDE_WINDOW_MS)
+        )
+
+    def _publish(self, group: str, user_id: str, location_id: str,
+                 timestamp: Optional[float], window_seconds: float) -> None:
+        updates = self._pending.setdefault(group, {})
+        if user_id in updates:
+            self.stats['coalesced'] += 1
+        updates[user_id] = (location_id, timestamp or time.time())
+        self.stats['published'] += 1
+
+        if group not in self._handles:
+            self._handles[group] = asyncio.get_running_loop().call_later(
+                window_seconds, self._start_flush, group
+            )
+
+    def _start_flush(self, group: str) -> None:
+        self._handles.pop(group, None)
+        updates = self._pending.pop(group, None)
+        if updates:
+            task = asyncio.ensure_future(self._send(group, updates))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, group: str, updates: Dict[str, Tuple[str, float]]) -> None:
+        channel_layer = get_channel_layer()
+        try:
+            if group == CONTROL_CENTER_VIP_GROUP:
+                await channel_layer.group_send(group, {
+                    'type': 'vip_location_batch',
+                    **encode_batch(updates)
+                })
+                self.stats['sends'] += 1
+                return
+
+            for update in decode_batch(encode_batch(updates)):
+                await channel_layer.group_send(group, {
+                    'type': 'ride_location_update',
+                    **update
+                })
+                self.stats['sends'] += 1
+        except Exception as e:
+            self.stats['send_errors'] += 1
+            logger.error(f"Location broadcast to {group} failed: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        """Get fan-out statistics"""
+        return {**self.stats, 'pending_groups': len(self._pending)}
+
+
+# Global location fan-out instance
+_location_fanout: Optional[LocationFanout] = None
+
+
+def get_location_fanout() -> LocationFanout:
+    """Get global location fan-out instance"""
+    global _location_fanout
+    if _location_fanout is None:
+        _location_fanout = LocationFanout()
+    return _location_fanout
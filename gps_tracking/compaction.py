@@ -0,0 +1,234 @@
+"""
+Ride Trajectory Compaction
+Collapses the raw GPS rows of finished rides into one compressed trajectory per user
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from rides.models import Ride, RideStatus
+
+from .eta import learn_segment_speeds
+from .models import GPSLocation, RideTrajectory
+from .polyline import simplify_path
+
+logger = logging.getLogger(__name__)
+
+# Disputed rides keep their raw rows as evidence until the dispute is resolved
+FINISHED_RIDE_STATUSES = [
+    RideStatus.COMPLETED,
+    RideStatus.CANCELLED_BY_RIDER,
+    RideStatus.CANCELLED_BY_DRIVER,
+    RideStatus.CANCELLED_BY_SYSTEM,
+    RideStatus.PAYMENT_PENDING,
+    RideStatus.PAYMENT_FAILED,
+    RideStatus.PAYMENT_COMPLETED,
+    RideStatus.REFUNDED,
+]
+
+# Rides that ran to the drop-off, whose driving feeds the learned segment speeds
+COMPLETED_RIDE_STATUSES = [
+    RideStatus.COMPLETED,
+    RideStatus.PAYMENT_PENDING,
+    RideStatus.PAYMENT_FAILED,
+    RideStatus.PAYMENT_COMPLETED,
+]
+
+
+def _gps_setting(name: str, default):
+    return getattr(settings, 'GPS_TRACKING', {}).get(name, default)
+
+
+def compact_ride(ride, tolerance_meters: float = None) -> List[RideTrajectory]:
+    """
+    Replace a ride's raw GPS rows with one compacted trajectory per user
+
+    Each user's points are ordered by device time, simplified with
+    Douglas-Peucker at tolerance_meters and encoded into a RideTrajectory.
+    Rows that arrive after a ride was compacted are merged into the
+    existing trajectory on the next run. Only the rows whose coordinates
+    went into a saved trajectory are deleted, in the same transaction that
+    saves it; rows that fail to decrypt are kept for a later run. Each
+    returned trajectory carries compacted_points, the simplified path of
+    just the rows compacted by this call.
+    """
+    if tolerance_meters is None:
+        tolerance_meters = _gps_setting('TRAJECTORY_TOLERANCE_METERS', 5)
+
+    locations = GPSLocation.objects.decrypt_coordinates(
+        GPSLocation.objects.filter(ride=ride).select_related('user').order_by('device_timestamp')
+    )
+    if not locations:
+        return []
+
+    by_user = defaultdict(list)
+    for location in locations:
+        by_user[location.user_id].append(location)
+
+    existing = {
+        trajectory.user_id: trajectory
+        for trajectory in RideTrajectory.objects.filter(ride=ride, user_id__in=list(by_user))
+    }
+
+    trajectories = []
+    compacted_ids = []
+    undecryptable = 0
+    for user_id, user_locations in by_user.items():
+        points = []
+        location_ids = []
+        for location in user_locations:
+            lat, lng = location.coordinates
+            if lat is None or lng is None:
+                undecryptable += 1
+                continue
+            points.append((float(lat), float(lng), location.device_timestamp.timestamp()))
+            location_ids.append(location.id)
+        if not points:
+            continue
+
+        compacted_points = simplify_path(points, tolerance_meters)
+        trajectory = existing.get(user_id)
+        if trajectory is None:
+            trajectory = RideTrajectory(
+                ride=ride,
+                user=user_locations[0].user,
+                is_encrypted=any(location.encrypted_coordinates for location in user_locations)
+            )
+            simplified = compacted_points
+        else:
+            points.extend(trajectory.get_points())
+            points.sort(key=lambda point: point[2])
+            simplified = simplify_path(points, tolerance_meters)
+
+        trajectory.set_points(simplified)
+        trajectory.raw_point_count += len(location_ids)
+        trajectory.tolerance_meters = tolerance_meters
+        trajectory.distance_km = trajectory.path_distance_km(simplified)
+        trajectory.started_at = datetime.fromtimestamp(simplified[0][2], tz=dt_timezone.utc)
+        trajectory.ended_at = datetime.fromtimestamp(simplified[-1][2], tz=dt_timezone.utc)
+        trajectory.compacted_points = compacted_points
+        trajectories.append(trajectory)
+        compacted_ids.extend(location_ids)
+
+    if undecryptable:
+        logger.error(
+            f"Kept {undecryptable} undecryptable GPS rows of ride {ride.id} out of its trajectory"
+        )
+
+    with transaction.atomic():
+        for trajectory in trajectories:
+            trajectory.save()
+        GPSLocation.objects.filter(id__in=compacted_ids).delete()
+
+    return trajectories
+
+
+def compact_finished_rides(batch_size: int = None) -> Dict:
+    """
+    Compact finished rides that still have raw GPS rows
+
+    Rides are picked up once they have been finished for
+    TRAJECTORY_COMPACTION_DELAY_MINUTES, so late offline uploads land
+    before the first pass. A ride that fails is logged and left for the
+    next run. The driver points of completed rides are added to the
+    learned segment speeds used for ETAs once, when they are compacted;
+    encrypted (VIP) paths are skipped so a sparse cell can't reveal a
+    VIP's movements.
+    """
+    batch_size = batch_size or _gps_setting('TRAJECTORY_COMPACTION_BATCH_SIZE', 100)
+    cutoff = timezone.now() - timedelta(
+        minutes=_gps_setting('TRAJECTORY_COMPACTION_DELAY_MINUTES', 30)
+    )
+
+    ride_ids = list(
+        GPSLocation.objects.filter(
+            ride__status__in=FINISHED_RIDE_STATUSES,
+            ride__updated_at__lt=cutoff
+        ).order_by('ride_id').values_list('ride_id', flat=True).distinct()[:batch_size]
+    )
+
+    stats = {'rides': 0, 'failed_rides': 0, 'raw_points': 0, 'stored_points': 0,
+             'learned_cells': 0}
+    for ride in Ride.objects.select_related('driver').filter(id__in=ride_ids):
+        try:
+            trajectories = compact_ride(ride)
+        except Exception as e:
+            stats['failed_rides'] += 1
+            logger.error(f"Trajectory compaction failed for ride {ride.id}: {str(e)}")
+            continue
+        stats['rides'] += 1
+        stats['raw_points'] += sum(trajectory.raw_point_count for trajectory in trajectories)
+        stats['stored_points'] += sum(trajectory.point_count for trajectory in trajectories)
+
+        if ride.status in COMPLETED_RIDE_STATUSES and ride.driver_id:
+            try:
+                stats['learned_cells'] += learn_segment_speeds(
+                    trajectory.compacted_points for trajectory in trajectories
+                    if trajectory.user_id == ride.driver.user_id and not trajectory.is_encrypted
+                )
+            except Exception as e:
+                logger.error(f"Segment speed learning failed for ride {ride.id}: {str(e)}")
+
+    return stats
+
+
+def ride_replay(ride) -> Dict[str, List[Dict]]:
+    """
+    Get the path of every tracked user of a ride, oldest point first
+
+    Reads the compacted trajectories; points of a ride that has not been
+    compacted yet come from its raw rows.
+    """
+    paths = {
+        str(trajectory.user_id): [
+            _replay_point(lat, lng, timestamp)
+            for lat, lng, timestamp in trajectory.get_points()
+        ]
+        for trajectory in RideTrajectory.objects.filter(ride=ride).select_related('user')
+    }
+
+    locations = GPSLocation.objects.decrypt_coordinates(
+        GPSLocation.objects.filter(ride=ride).select_related('user').order_by('device_timestamp')
+    )
+    for location in locations:
+        lat, lng = location.coordinates
+        if lat is not None and lng is not None:
+            paths.setdefault(str(location.user_id), []).append(
+                _replay_point(float(lat), float(lng), location.device_timestamp.timestamp())
+            )
+
+    for path in paths.values():
+        path.sort(key=lambda point: point['timestamp'])
+    return paths
+
+
+def _replay_point(lat: float, lng: float, timestamp: float) -> Dict:
+    return {
+        'latitude': lat,
+        'longitude': lng,
+        'timestamp': datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).isoformat()
+    }
+
+
+def ride_distance_km(ride) -> Optional[float]:
+    """
+    Distance driven on a ride, recomputed from its compacted trajectory
+
+    Uses the driver's trajectory, or the rider's when the driver was not
+    tracked. Returns None for rides without a compacted trajectory.
+    """
+    trajectories = {
+        trajectory.user_id: trajectory
+        for trajectory in RideTrajectory.objects.filter(ride=ride).select_related('user')
+    }
+    driver_user_id = ride.driver.user_id if ride.driver_id else None
+    trajectory = trajectories.get(driver_user_id) or trajectories.get(ride.rider_id)
+    if trajectory is None:
+        return None
+    return trajectory.path_distance_km()
@@ -5,10 +5,9 @@ Handles live location updates, geofencing events, and VIP tracking
 
 import json
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
 # from django.contrib.gis.geos import Point  # Removed GeoDjango dependency
 from django.utils import timezone
@@ -16,8 +15,19 @@ from django.core.cache import cache
 from decimal import Decimal
 import logging
 
-from .models import GPSLocation, GeofenceZone, GeofenceEvent, RouteOptimization
-from .services import GPSValidationService, GeofenceService, RouteOptimizationService
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+from .models import GeofenceZone, GeofenceEvent, RouteOptimization
+from .services import GPSValidationService, RouteOptimizationService
+from .broadcast import decode_batch, get_location_fanout
+from .ingest import get_ingest_batcher
+from .location_store import get_location_store
+from .tasks import sync_offline_gps_buffer
+from .trajectory import parse_device_timestamp
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -32,6 +42,10 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
         self.user_id = str(self.user.id)
         self.room_group_name = f"gps_tracking_{self.user_id}"
         
+        # Per-connection (per-device) trajectory used to validate fixes
+        self.validation_service = GPSValidationService()
+        self.trajectory = None
+        
         # Authentication check
         if not self.user.is_authenticated:
             await self.close(code=4001)
@@ -106,33 +120,36 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
                 await self.send_error('Missing required location data')
                 return
             
-            # Validate GPS accuracy
-            validation_service = GPSValidationService()
-            is_valid, accuracy_level = await validation_service.validate_location(
-                latitude, longitude, accuracy
-            )
+            fix_timestamp = parse_device_timestamp(device_timestamp)
+            if fix_timestamp is None:
+                await self.send_error('Invalid location timestamp')
+                return
+            
+            # Validate against this device's trajectory, seeded from the last known location
+            if self.trajectory is None:
+                self.trajectory = self.validation_service.trajectory_state(
+                    self.user, get_location_store().get(self.user.pk)
+                )
+            is_valid, accuracy_level, reason = self.validation_service.validate_fixes([{
+                'lat': float(latitude),
+                'lng': float(longitude),
+                'accuracy': float(accuracy or 0),
+                'device_timestamp': fix_timestamp
+            }], self.user, self.trajectory)[0]
             
             if not is_valid:
-                await self.send_error('GPS location validation failed')
+                await self.send_error('GPS location validation failed', reason)
                 return
             
-            # Create GPS location record
-            gps_location = await self.create_gps_location(
-                latitude=latitude,
-                longitude=longitude,
-                accuracy_meters=accuracy,
-                accuracy_level=accuracy_level,
-                device_timestamp=device_timestamp,
-                location_data=location_data
+            # Store through the batched ingest (geofencing and ETA included)
+            result = await get_ingest_batcher().submit(
+                self.user,
+                location_data,
+                accuracy_level,
+                ride_id=data.get('ride_id')
             )
-            
-            # Check geofencing
-            geofence_events = await self.check_geofencing(gps_location)
-            
-            # Update route optimization if in active ride
-            ride_id = data.get('ride_id')
-            if ride_id:
-                await self.update_route_optimization(ride_id, gps_location)
+            gps_location = result['location']
+            geofence_events = result['geofence_events']
             
             # Send confirmation with processed data
             await self.send(text_data=json.dumps({
@@ -202,16 +219,26 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
                 await self.send_error('No buffered locations to sync')
                 return
             
-            # Process offline GPS buffer
-            created_locations, errors = await self.process_offline_buffer(
-                buffered_locations, device_id
-            )
+            # Store the buffer and sync it in a Celery job that reports progress
+            offline_buffer = await self.create_offline_buffer(buffered_locations, device_id)
+            try:
+                sync_offline_gps_buffer.delay(str(offline_buffer.id))
+            except Exception as e:
+                logger.error(f"Could not queue offline sync, processing inline: {str(e)}")
+                created_locations, errors = await self.process_offline_buffer(offline_buffer)
+                await self.offline_sync_complete({
+                    'buffer_id': str(offline_buffer.id),
+                    'synced_count': len(created_locations),
+                    'error_count': len(errors),
+                    'errors': errors[:5],  # Send first 5 errors only
+                    'success': len(errors) == 0
+                })
+                return
             
             await self.send(text_data=json.dumps({
-                'type': 'offline_sync_complete',
-                'synced_count': len(created_locations),
-                'error_count': len(errors),
-                'errors': errors[:5],  # Send first 5 errors only
+                'type': 'offline_sync_queued',
+                'buffer_id': str(offline_buffer.id),
+                'total': len(buffered_locations),
                 'timestamp': timezone.now().isoformat()
             }))
             
@@ -231,32 +258,6 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
         
         await self.send(text_data=json.dumps(error_data))
     
-    @database_sync_to_async
-    def create_gps_location(self, **kwargs):
-        """Create GPS location record in database"""
-        return GPSLocation.objects.create_encrypted_location(
-            user=self.user,
-            **kwargs
-        )
-    
-    @database_sync_to_async
-    def check_geofencing(self, gps_location):
-        """Check geofence boundaries and create events"""
-        geofence_service = GeofenceService()
-        return geofence_service.check_location_geofences(gps_location)
-    
-    @database_sync_to_async
-    def update_route_optimization(self, ride_id, gps_location):
-        """Update route optimization with new location"""
-        try:
-            route_optimization = RouteOptimization.objects.select_related('ride').get(
-                ride_id=ride_id
-            )
-            route_service = RouteOptimizationService()
-            route_service.update_eta_real_time(route_optimization, gps_location)
-        except RouteOptimization.DoesNotExist:
-            pass
-    
     @database_sync_to_async
     def get_route_optimization(self, ride_id):
         """Get route optimization for ride"""
@@ -268,12 +269,11 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
             return None
     
     @database_sync_to_async
-    def process_offline_buffer(self, buffered_locations, device_id):
-        """Process offline GPS buffer"""
+    def create_offline_buffer(self, buffered_locations, device_id):
+        """Create the offline buffer record to sync"""
         from .models import OfflineGPSBuffer
         
-        # Create offline buffer record
-        offline_buffer = OfflineGPSBuffer.objects.create(
+        return OfflineGPSBuffer.objects.create(
             user=self.user,
             device_id=device_id,
             buffered_locations=buffered_locations,
@@ -283,8 +283,10 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
             app_version="1.0.0",
             device_info={}
         )
-        
-        # Process buffered locations
+    
+    @database_sync_to_async
+    def process_offline_buffer(self, offline_buffer):
+        """Process offline GPS buffer"""
         return offline_buffer.process_buffered_locations()
     
     @database_sync_to_async
@@ -293,34 +295,17 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
         cache.set(f"gps_last_seen_{self.user_id}", timezone.now(), timeout=300)
     
     async def broadcast_location_update(self, gps_location, original_data):
-        """Broadcast location update to relevant groups"""
-        channel_layer = get_channel_layer()
+        """Broadcast location update to relevant groups (coalesced per window)"""
+        fanout = get_location_fanout()
         
         # Broadcast to control center if VIP user
         if hasattr(self.user, 'tier') and self.user.tier == 'VIP':
-            await channel_layer.group_send(
-                "control_center_vip",
-                {
-                    'type': 'vip_location_update',
-                    'user_id': self.user_id,
-                    'location_id': str(gps_location.id),
-                    'encrypted': True,
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
+            fanout.publish_vip(self.user_id, str(gps_location.id))
         
         # Broadcast to active ride participants
         ride_id = original_data.get('ride_id')
         if ride_id:
-            await channel_layer.group_send(
-                f"ride_{ride_id}",
-                {
-                    'type': 'ride_location_update',
-                    'user_id': self.user_id,
-                    'location_id': str(gps_location.id),
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
+            fanout.publish_ride(ride_id, self.user_id, str(gps_location.id))
     
     # Message handlers for group messages
     async def vip_location_update(self, event):
@@ -342,6 +327,27 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp']
         }))
     
+    async def offline_sync_progress(self, event):
+        """Handle offline sync progress from the sync job"""
+        await self.send(text_data=json.dumps({
+            'type': 'offline_sync_progress',
+            'buffer_id': event['buffer_id'],
+            'processed': event['processed'],
+            'total': event['total'],
+            'timestamp': timezone.now().isoformat()
+        }))
+    
+    async def offline_sync_complete(self, event):
+        """Handle offline sync completion from the sync job"""
+        await self.send(text_data=json.dumps({
+            'type': 'offline_sync_complete',
+            'buffer_id': event['buffer_id'],
+            'synced_count': event['synced_count'],
+            'error_count': event['error_count'],
+            'errors': event.get('errors', []),
+            'timestamp': timezone.now().isoformat()
+        }))
+    
     async def geofence_alert(self, event):
         """Handle geofence alert from group"""
         await self.send(text_data=json.dumps({
@@ -365,6 +371,9 @@ class ControlCenterConsumer(AsyncWebsocketConsumer):
             await self.close(code=4003)
             return
         
+        # Batched VIP frames are sent as JSON objects until the client asks otherwise
+        self.broadcast_format = 'json'
+        
         # Join control center groups
         await self.channel_layer.group_add("control_center_vip", self.channel_name)
         await self.channel_layer.group_add("control_center_alerts", self.channel_name)
@@ -396,6 +405,8 @@ class ControlCenterConsumer(AsyncWebsocketConsumer):
                 await self.handle_emergency_alert(data)
             elif message_type == 'geofence_monitor':
                 await self.handle_geofence_monitor(data)
+            elif message_type == 'set_broadcast_format':
+                await self.handle_set_broadcast_format(data)
                 
         except json.JSONDecodeError:
             await self.send_error('Invalid JSON format')
@@ -418,8 +429,46 @@ class ControlCenterConsumer(AsyncWebsocketConsumer):
     
     async def handle_vip_locations_request(self, data):
         """Handle request for VIP user locations"""
-        # Implementation for getting VIP locations
-        pass
+        user_ids = data.get('user_ids') or []
+        if not isinstance(user_ids, list):
+            await self.send_error('user_ids must be a list')
+            return
+        
+        # Served from the last known location store; VIP coordinates stay encrypted
+        entries = get_location_store().get_many(user_ids)
+        await self.send(text_data=json.dumps({
+            'type': 'vip_locations',
+            'locations': [
+                {
+                    'user_id': str(user_id),
+                    'encrypted': 'encrypted' in entry,
+                    'latitude': entry.get('lat'),
+                    'longitude': entry.get('lng'),
+                    'speed_kmh': entry.get('speed_kmh'),
+                    'bearing': entry.get('bearing'),
+                    'timestamp': datetime.fromtimestamp(
+                        entry['timestamp'], tz=dt_timezone.utc
+                    ).isoformat()
+                }
+                for user_id, entry in entries.items()
+            ],
+            'timestamp': timezone.now().isoformat()
+        }))
+    
+    async def handle_set_broadcast_format(self, data):
+        """Choose how batched VIP location frames are sent to this client"""
+        formats = ['json', 'compact'] + (['msgpack'] if MSGPACK_AVAILABLE else [])
+        broadcast_format = data.get('format')
+        if broadcast_format not in formats:
+            await self.send_error(f"Unsupported format, use one of: {', '.join(formats)}")
+            return
+        
+        self.broadcast_format = broadcast_format
+        await self.send(text_data=json.dumps({
+            'type': 'broadcast_format_set',
+            'format': broadcast_format,
+            'timestamp': timezone.now().isoformat()
+        }))
     
     async def handle_emergency_alert(self, data):
         """Handle emergency alert from control center"""
@@ -444,6 +493,29 @@ class ControlCenterConsumer(AsyncWebsocketConsumer):
         """Forward VIP location update to control center"""
         await self.send(text_data=json.dumps(event))
     
+    async def vip_location_batch(self, event):
+        """Send a coalesced batch of VIP location updates in the client's format"""
+        if self.broadcast_format == 'json':
+            await self.send(text_data=json.dumps({
+                'type': 'vip_location_batch',
+                'updates': [
+                    {**update, 'encrypted': True} for update in decode_batch(event)
+                ],
+                'timestamp': timezone.now().isoformat()
+            }))
+            return
+        
+        # Compact frames keep the [user_id, location_id, ms after base_ts] rows
+        frame = {
+            'type': 'vip_location_batch',
+            'base_ts': event['base_ts'],
+            'updates': event['updates']
+        }
+        if self.broadcast_format == 'msgpack':
+            await self.send(bytes_data=msgpack.packb(frame))
+        else:
+            await self.send(text_data=json.dumps(frame, separators=(',', ':')))
+    
     async def emergency_alert(self, event):
         """Forward emergency alert to control center"""
         await self.send(text_data=json.dumps(event))
@@ -0,0 +1,379 @@
+"""
+ETA Engine for Active Rides
+Smoothed ride speeds and learned cell/hour speeds applied along the planned route
+"""
+
+import math
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SegmentSpeed
+from .polyline import METERS_PER_DEGREE, decode_polyline
+from .trajectory import MAX_REASONABLE_SPEED_KMH, haversine_km
+
+logger = logging.getLogger(__name__)
+
+CELL_SIZE_DEGREES = 0.01  # ~1.1km
+PIECE_KM = 0.5  # Longer segments are split so each piece lands in the right cell
+MAX_SEGMENT_SECONDS = 600  # Longer gaps say nothing about driving speed
+STATIONARY_METERS = 5
+STATIONARY_SECONDS = 60  # Standing still this long is waiting, not traffic
+
+
+def cell_key(latitude: float, longitude: float) -> str:
+    """Grid cell of a point as 'row:col'"""
+    return (f"{math.floor(latitude / CELL_SIZE_DEGREES)}:"
+            f"{math.floor(longitude / CELL_SIZE_DEGREES)}")
+
+
+def local_hour(timestamp: float) -> int:
+    """Hour of day, in the platform's time zone, of an epoch timestamp"""
+    return timezone.localtime(datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)).hour
+
+
+def _pieces(lat1: float, lng1: float, lat2: float, lng2: float):
+    """Split a segment into pieces of at most PIECE_KM: yields (mid lat, mid lng, km, fraction)"""
+    distance = haversine_km(lat1, lng1, lat2, lng2)
+    count = max(1, math.ceil(distance / PIECE_KM))
+    for i in range(count):
+        fraction = (i + 0.5) / count
+        yield (lat1 + (lat2 - lat1) * fraction, lng1 + (lng2 - lng1) * fraction,
+               distance / count, fraction)
+
+
+def segment_samples(points: List[Tuple[float, float, float]]) -> Dict[Tuple[str, int], List[float]]:
+    """
+    Split a timed path into {(cell, hour): [distance_km, hours, samples]}
+
+    Gaps longer than MAX_SEGMENT_SECONDS, impossible speeds and long
+    stops (waiting at pickup) are left out.
+    """
+    samples = {}
+    for (lat1, lng1, t1), (lat2, lng2, t2) in zip(points, points[1:]):
+        seconds = t2 - t1
+        if seconds <= 0 or seconds > MAX_SEGMENT_SECONDS:
+            continue
+        distance = haversine_km(lat1, lng1, lat2, lng2)
+        if distance * 1000 < STATIONARY_METERS and seconds > STATIONARY_SECONDS:
+            continue
+        if distance / (seconds / 3600) > MAX_REASONABLE_SPEED_KMH:
+            continue
+
+        for lat, lng, piece_km, fraction in _pieces(lat1, lng1, lat2, lng2):
+            piece_hours = seconds / 3600 * piece_km / distance if distance else seconds / 3600
+            sample = samples.setdefault(
+                (cell_key(lat, lng), local_hour(t1 + seconds * fraction)), [0.0, 0.0, 0]
+            )
+            sample[0] += piece_km
+            sample[1] += piece_hours
+            sample[2] += 1
+    return samples
+
+
+def learn_segment_speeds(paths: Iterable[List[Tuple[float, float, float]]]) -> int:
+    """
+    Add the timed paths of completed rides to the historical speeds
+
+    Callers pass each path once, and leave out encrypted (VIP) paths so a
+    sparse cell can't reveal a VIP's movements. Missing (cell, hour) rows
+    are created first and every row is then incremented in the database,
+    so overlapping runs add up instead of overwriting each other. Returns
+    the number of (cell, hour) rows touched.
+    """
+    samples = {}
+    for points in paths:
+        for key, (distance_km, hours, count) in segment_samples(points).items():
+            sample = samples.setdefault(key, [0.0, 0.0, 0])
+            sample[0] += distance_km
+            sample[1] += hours
+            sample[2] += count
+    if not samples:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        SegmentSpeed.objects.bulk_create(
+            [SegmentSpeed(cell=cell, hour=hour) for cell, hour in samples],
+            update_conflicts=True,
+            unique_fields=['cell', 'hour'],
+            update_fields=['updated_at']
+        )
+        for (cell, hour), (distance_km, hours, count) in samples.items():
+            SegmentSpeed.objects.filter(cell=cell, hour=hour).update(
+                distance_km=F('distance_km') + distance_km,
+                duration_hours=F('duration_hours') + hours,
+                sample_count=F('sample_count') + count,
+                updated_at=now
+            )
+    return len(samples)
+
+
+class SegmentSpeedTable:
+    """
+    Per-process cache of the learned speeds for each hour of day
+
+    Each hour's {cell: speed_kmh} map is loaded with one query and reused
+    for CACHE_SECONDS. Cells with fewer than MIN_SAMPLES samples are left
+    out so one odd ride does not set a cell's speed.
+    """
+
+    CACHE_SECONDS = 900
+    MIN_SAMPLES = 3
+
+    def __init__(self):
+        self._hours: Dict[int, Tuple[float, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def speeds_for_hour(self, hour: int) -> Dict[str, float]:
+        """Get {cell: speed_kmh} for an hour of day"""
+        with self._lock:
+            cached = self._hours.get(hour)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+        speeds = {}
+        try:
+            for cell, distance_km, hours in SegmentSpeed.objects.filter(
+                hour=hour, sample_count__gte=self.MIN_SAMPLES, duration_hours__gt=0
+            ).values_list('cell', 'distance_km', 'duration_hours'):
+                speeds[cell] = distance_km / hours
+        except Exception as e:
+            logger.error(f"Failed to load segment speeds for hour {hour}: {e}")
+
+        with self._lock:
+            self._hours[hour] = (time.monotonic() + self.CACHE_SECONDS, speeds)
+        return speeds
+
+    def clear(self) -> None:
+        """Drop all cached hours"""
+        with self._lock:
+            self._hours.clear()
+
+
+@lru_cache(maxsize=1024)
+def _route_points(encoded: str) -> Tuple[Tuple[float, float], ...]:
+    return tuple(decode_polyline(encoded)) if encoded else ()
+
+
+class ETAEngine:
+    """
+    Estimates the remaining time of active rides from their GPS pings
+
+    Each ride keeps a small state: its last position, an exponentially
+    weighted moving average of its speed (time constant
+    SPEED_TIME_CONSTANT_SECONDS, so bursts of pings don't weigh more) and
+    how far along the route polyline it has got. The remaining route is
+    cut into pieces; near the car a piece is driven at the ride's smoothed
+    speed, further out at the learned speed of its cell for the current
+    hour (or a default for the route's traffic level). A ride off its
+    polyline, or without one, is estimated along the straight line.
+
+    State lives in the shared cache (ETA_STATE_BACKEND 'cache', the
+    default) or a bounded in-process map ('local', also the fallback when
+    the cache fails).
+    """
+
+    KEY_PREFIX = 'ride_eta'
+    STATE_TTL_SECONDS = 7200
+    LOCAL_MAX_RIDES = 20000
+    SPEED_TIME_CONSTANT_SECONDS = 60
+    MIN_SPEED_KMH = 5  # Floor for the smoothed speed, so a red light doesn't explode the ETA
+    NEAR_DISTANCE_KM = 1.0  # How far ahead the ride's own speed dominates
+    OFF_ROUTE_METERS = 500
+    STRAIGHT_LINE_DETOUR = 1.3  # Same factor as the fallback route calculation
+    DEFAULT_SPEEDS_KMH = {'LOW': 40, 'MODERATE': 30, 'HEAVY': 20, 'SEVERE': 12}
+    DEFAULT_THRESHOLD_SECONDS = 30
+
+    def __init__(self, speed_table: SegmentSpeedTable = None):
+        self.speed_table = speed_table or get_segment_speed_table()
+        self._local: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _backend_name(self) -> str:
+        return getattr(settings, 'GPS_TRACKING', {}).get('ETA_STATE_BACKEND', 'cache')
+
+    def _key(self, ride_id) -> str:
+        return f'{self.KEY_PREFIX}:{ride_id}'
+
+    def get_state(self, ride_id) -> Optional[Dict]:
+        """Get a ride's ETA state"""
+        if self._backend_name() == 'cache':
+            try:
+                return cache.get(self._key(ride_id))
+            except Exception as e:
+                logger.error(f"Failed to read ETA state for ride {ride_id}: {e}")
+
+        with self._lock:
+            stored = self._local.get(self._key(ride_id))
+        if stored is not None and stored[1] > time.monotonic():
+            return stored[0]
+        return None
+
+    def set_state(self, ride_id, state: Dict) -> None:
+        """Store a ride's ETA state"""
+        if self._backend_name() == 'cache':
+            try:
+                cache.set(self._key(ride_id), state, timeout=self.STATE_TTL_SECONDS)
+                return
+            except Exception as e:
+                logger.error(f"Failed to store ETA state for ride {ride_id}: {e}")
+
+        with self._lock:
+            self._local[self._key(ride_id)] = (state, time.monotonic() + self.STATE_TTL_SECONDS)
+            self._local.move_to_end(self._key(ride_id))
+            while len(self._local) > self.LOCAL_MAX_RIDES:
+                self._local.popitem(last=False)
+
+    def observe(self, state: Optional[Dict], latitude: float, longitude: float,
+                timestamp: float, reported_speed_kmh: Optional[float] = None) -> Dict:
+        """Fold a ping into a ride's state and return the new state"""
+        state = dict(state or {})
+        speed = state.get('speed_kmh')
+        elapsed = timestamp - state['timestamp'] if 'timestamp' in state else None
+
+        sample = reported_speed_kmh
+        if sample is None and elapsed:
+            sample = haversine_km(state['lat'], state['lng'], latitude, longitude) / (elapsed / 3600)
+
+        if sample is not None and 0 <= sample <= MAX_REASONABLE_SPEED_KMH:
+            if speed is None:
+                speed = sample
+            elif elapsed and elapsed > 0:
+                weight = 1 - math.exp(-elapsed / self.SPEED_TIME_CONSTANT_SECONDS)
+                speed += weight * (sample - speed)
+
+        state.update({
+            'lat': latitude, 'lng': longitude, 'speed_kmh': speed,
+            'timestamp': max(timestamp, state.get('timestamp', timestamp)),
+        })
+        return state
+
+    def remaining_seconds(self, route_optimization, latitude: float, longitude: float,
+                          state: Dict, hour: int = None) -> float:
+        """Estimate the time left to the drop-off, updating the state's route progress"""
+        dropoff = route_optimization.dropoff_point
+        route = _route_points(route_optimization.route_polyline or '')
+        detour = 1.0
+        path = None
+        if len(route) >= 2:
+            index, off_route_meters = self._nearest_segment(
+                route, state.get('segment', 0), latitude, longitude
+            )
+            if off_route_meters <= self.OFF_ROUTE_METERS:
+                state['segment'] = index
+                path = [(latitude, longitude)] + list(route[index + 1:])
+        if path is None:
+            path = [(latitude, longitude), (dropoff['latitude'], dropoff['longitude'])]
+            detour = self.STRAIGHT_LINE_DETOUR
+
+        hour = local_hour(time.time()) if hour is None else hour
+        cell_speeds = self.speed_table.speeds_for_hour(hour)
+        default_speed = self.DEFAULT_SPEEDS_KMH.get(route_optimization.traffic_level, 30)
+        ride_speed = state.get('speed_kmh')
+
+        seconds = 0.0
+        travelled_km = 0.0
+        for (lat1, lng1), (lat2, lng2) in zip(path, path[1:]):
+            for lat, lng, piece_km, _ in _pieces(lat1, lng1, lat2, lng2):
+                piece_km *= detour
+                learned = cell_speeds.get(cell_key(lat, lng), default_speed)
+                speed = learned
+                if ride_speed is not None:
+                    weight = math.exp(-(travelled_km + piece_km / 2) / self.NEAR_DISTANCE_KM)
+                    speed = weight * max(ride_speed, self.MIN_SPEED_KMH) + (1 - weight) * learned
+                seconds += piece_km / max(speed, self.MIN_SPEED_KMH) * 3600
+                travelled_km += piece_km
+        return seconds
+
+    @staticmethod
+    def _nearest_segment(route, start: int, latitude: float, longitude: float) -> Tuple[int, float]:
+        """Closest route segment at or after start, and the distance to it in meters"""
+        lng_scale = math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+
+        def project(point):
+            return ((point[1] - longitude) * lng_scale, (point[0] - latitude) * METERS_PER_DEGREE)
+
+        best_index, best_distance = start, float('inf')
+        start = min(start, len(route) - 2)
+        previous = project(route[start])
+        for index in range(start, len(route) - 1):
+            current = project(route[index + 1])
+            dx, dy = current[0] - previous[0], current[1] - previous[1]
+            length = dx * dx + dy * dy
+            t = 0.0 if length == 0 else max(0.0, min(1.0, -(previous[0] * dx + previous[1] * dy) / length))
+            distance = math.hypot(previous[0] + t * dx, previous[1] + t * dy)
+            if distance < best_distance:
+                best_index, best_distance = index, distance
+            previous = current
+        return best_index, best_distance
+
+    def update(self, route_optimization, gps_location) -> bool:
+        """
+        Update a ride's ETA from a GPS location
+
+        The state is always updated; current_eta is only saved when it
+        moves by more than ETA_UPDATE_THRESHOLD_SECONDS. Returns whether
+        the route optimization was saved.
+        """
+        point = gps_location.point
+        if not point:
+            return False
+
+        server_timestamp = getattr(gps_location, 'server_timestamp', None)
+        timestamp = server_timestamp.timestamp() if server_timestamp else time.time()
+        ride_id = route_optimization.ride_id
+
+        state = self.observe(
+            self.get_state(ride_id), point['latitude'], point['longitude'],
+            timestamp, gps_location.speed_kmh
+        )
+        seconds = self.remaining_seconds(
+            route_optimization, point['latitude'], point['longitude'], state
+        )
+        self.set_state(ride_id, state)
+
+        new_eta = timezone.now() + timedelta(seconds=seconds)
+        threshold = getattr(settings, 'GPS_TRACKING', {}).get(
+            'ETA_UPDATE_THRESHOLD_SECONDS', self.DEFAULT_THRESHOLD_SECONDS
+        )
+        current_eta = route_optimization.current_eta
+        if current_eta and abs((new_eta - current_eta).total_seconds()) <= threshold:
+            return False
+
+        route_optimization.current_eta = new_eta
+        route_optimization.save(update_fields=['current_eta', 'updated_at'])
+        return True
+
+
+# Global segment speed table instance
+_segment_speed_table: Optional[SegmentSpeedTable] = None
+
+# Global ETA engine instance
+_eta_engine: Optional[ETAEngine] = None
+
+
+def get_segment_speed_table() -> SegmentSpeedTable:
+    """Get global segment speed table instance"""
+    global _segment_speed_table
+    if _segment_speed_table is None:
+        _segment_speed_table = SegmentSpeedTable()
+    return _segment_speed_table
+
+
+def get_eta_engine() -> ETAEngine:
+    """Get global ETA engine instance"""
+    global _eta_engine
+    if _eta_engine is None:
+        _eta_engine = ETAEngine()
+    return _eta_engine
@@ -0,0 +1,210 @@
+"""
+Geofence Index for GPS Tracking
+Process-local grid index of active geofence zones with bounding-box prefilter
+"""
+
+import math
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def point_in_polygon(x: float, y: float, xs: Sequence[float], ys: Sequence[float]) -> bool:
+    """Ray-casting point-in-polygon test over pre-parsed vertex coordinates"""
+    n = len(xs)
+    inside = False
+
+    p1x, p1y = xs[0], ys[0]
+    for i in range(1, n + 1):
+        p2x, p2y = xs[i % n], ys[i % n]
+        if y > min(p1y, p2y):
+            if y <= max(p1y, p2y):
+                if x <= max(p1x, p2x):
+                    xinters = None
+                    if p1y != p2y:
+                        xinters = ((y - p1y) * (p2x - p1x) /
+                                   (p2y - p1y) + p1x)
+                    if p1x == p2x or (xinters and x <= xinters):
+                        inside = not inside
+        p1x, p1y = p2x, p2y
+
+    return inside
+
+
+class CompiledZone:
+    """A geofence zone with its polygon parsed into float arrays and a bounding box"""
+
+    __slots__ = ('zone', 'xs', 'ys', 'min_x', 'min_y', 'max_x', 'max_y')
+
+    def __init__(self, zone, polygon):
+        self.zone = zone
+        self.xs = tuple(float(vertex[0]) for vertex in polygon)
+        self.ys = tuple(float(vertex[1]) for vertex in polygon)
+        self.min_x, self.max_x = min(self.xs), max(self.xs)
+        self.min_y, self.max_y = min(self.ys), max(self.ys)
+
+    def contains(self, x: float, y: float) -> bool:
+        """Bounding-box reject, then the exact polygon test"""
+        if not (self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y):
+            return False
+        return point_in_polygon(x, y, self.xs, self.ys)
+
+
+class GeofenceIndex:
+    """
+    Uniform grid over the bounding boxes of active geofence zones
+
+    Polygon vertices are stored as [x, y] pairs exactly as
+    GeofenceZone.contains_point reads them. Each grid cell lists the zones
+    whose bounding box overlaps it; zones spanning more than
+    MAX_CELLS_PER_ZONE cells are kept in a short list checked for every
+    point. A lookup reads one cell, rejects zones by bounding box and only
+    then runs point-in-polygon, so it returns the same zones as calling
+    contains_point on every active zone.
+
+    The index is rebuilt after invalidate() in this process, when another
+    process bumps the version number in the shared cache (checked at most
+    every VERSION_CHECK_INTERVAL_SECONDS) or after REBUILD_INTERVAL_SECONDS.
+    """
+
+    CELL_SIZE_DEGREES = 0.01  # ~1.1km cells around the equator
+    MAX_CELLS_PER_ZONE = 400
+    VERSION_CACHE_KEY = 'geofence_index_version'
+    VERSION_CHECK_INTERVAL_SECONDS = 5
+    REBUILD_INTERVAL_SECONDS = 300
+
+    def __init__(self, cell_size_degrees: float = None):
+        self.cell_size = cell_size_degrees or self.CELL_SIZE_DEGREES
+        self._cells: Dict[Tuple[int, int], List[CompiledZone]] = {}
+        self._large: List[CompiledZone] = []
+        self._zones_by_id: Dict = {}
+        self._version = None
+        self._built_at: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _cell_range(self, low: float, high: float) -> range:
+        return range(
+            int(math.floor(low / self.cell_size)),
+            int(math.floor(high / self.cell_size)) + 1
+        )
+
+    def build(self, zones) -> None:
+        """Build the index from an iterable of GeofenceZone instances"""
+        cells: Dict[Tuple[int, int], List[CompiledZone]] = {}
+        large = []
+        zones_by_id = {}
+
+        for zone in zones:
+            zones_by_id[zone.pk] = zone
+            if not zone.boundary_coordinates:
+                continue
+
+            try:
+                compiled = CompiledZone(zone, zone.boundary_coordinates)
+            except (TypeError, ValueError, IndexError) as e:
+                logger.error(f"Skipping geofence zone {zone.pk} with invalid boundary: {e}")
+                continue
+
+            x_cells = self._cell_range(compiled.min_x, compiled.max_x)
+            y_cells = self._cell_range(compiled.min_y, compiled.max_y)
+            if len(x_cells) * len(y_cells) > self.MAX_CELLS_PER_ZONE:
+                large.append(compiled)
+                continue
+
+            for cx in x_cells:
+                for cy in y_cells:
+                    cells.setdefault((cx, cy), []).append(compiled)
+
+        self._cells = cells
+        self._large = large
+        self._zones_by_id = zones_by_id
+        self._built_at = time.monotonic()
+
+    def lookup(self, x: float, y: float) -> List:
+        """Get the zones of the built index that contain a point"""
+        cell = (
+            int(math.floor(x / self.cell_size)),
+            int(math.floor(y / self.cell_size))
+        )
+        return [
+            compiled.zone
+            for compiled in self._cells.get(cell, []) + self._large
+            if compiled.contains(x, y)
+        ]
+
+    def zones_containing(self, point: Dict) -> List:
+        """Get active zones containing a {'latitude', 'longitude'} point"""
+        self.ensure_current()
+        return self.lookup(float(point['longitude']), float(point['latitude']))
+
+    def get_zone(self, zone_id):
+        """Get an active zone by id from the index"""
+        self.ensure_current()
+        return self._zones_by_id.get(zone_id)
+
+    def ensure_current(self) -> None:
+        """Rebuild from the database if invalidated, stale or changed elsewhere"""
+        now = time.monotonic()
+        if (self._built_at is not None and
+                now - self._built_at < self.REBUILD_INTERVAL_SECONDS and
+                now - self._checked_at < self.VERSION_CHECK_INTERVAL_SECONDS):
+            return
+
+        with self._lock:
+            shared_version = self._get_shared_version()
+            self._checked_at = now
+            if (self._built_at is not None and
+                    now - self._built_at < self.REBUILD_INTERVAL_SECONDS and
+                    shared_version == self._version):
+                return
+
+            from .models import GeofenceZone
+            self.build(GeofenceZone.objects.filter(is_active=True))
+            self._version = shared_version
+            logger.debug(f"Geofence index rebuilt with {len(self._zones_by_id)} zones")
+
+    def invalidate(self) -> None:
+        """Drop the built index here and signal other processes to rebuild"""
+        self._built_at = None
+        try:
+            try:
+                cache.incr(self.VERSION_CACHE_KEY)
+            except ValueError:
+                cache.set(self.VERSION_CACHE_KEY, 1, None)
+        except Exception as e:
+            logger.error(f"Failed to publish geofence index version: {e}")
+
+    def _get_shared_version(self):
+        try:
+            return cache.get(self.VERSION_CACHE_KEY)
+        except Exception as e:
+            logger.error(f"Failed to read geofence index version: {e}")
+            return self._version
+
+    def get_stats(self) -> Dict:
+        """Get index statistics"""
+        return {
+            'zones_indexed': len(self._zones_by_id),
+            'occupied_cells': len(self._cells),
+            'large_zones': len(self._large),
+            'is_built': self._built_at is not None,
+            'version': self._version
+        }
+
+
+# Global geofence index instance
+_geofence_index: Optional[GeofenceIndex] = None
+
+
+def get_geofence_index() -> GeofenceIndex:
+    """Get global geofence index instance"""
+    global _geofence_index
+    if _geofence_index is None:
+        _geofence_index = GeofenceIndex()
+    return _geofence_index
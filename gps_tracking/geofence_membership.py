@@ -0,0 +1,147 @@
+"""
+Geofence Membership State for GPS Tracking
+Per-user set of occupied geofence zones used to detect entries and exits
+"""
+
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class GeofenceMembershipStore:
+    """
+    Maps each user to {zone_id: entered_at timestamp} for zones they are in
+
+    Pings are diffed against this state, so entries and exits are found
+    without reading GeofenceEvent history. The state lives in the shared
+    cache (backend 'cache', the default) so every worker sees the same
+    memberships, or in a bounded in-process LRU (backend 'local', also the
+    fallback when the cache fails). A user with no stored state is seeded
+    once from their geofence events of the last MEMBERSHIP_TTL_SECONDS;
+    every ping restarts that expiry, so only users who stop pinging lose
+    their state.
+    """
+
+    KEY_PREFIX = 'geofence_membership'
+    MEMBERSHIP_TTL_SECONDS = 3600  # Memberships without pings expire, as entries did after an hour
+    LOCAL_MAX_USERS = 50000
+
+    def __init__(self):
+        self._local: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _backend_name(self) -> str:
+        return getattr(settings, 'GPS_TRACKING', {}).get('GEOFENCE_STATE_BACKEND', 'cache')
+
+    def _key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:{user_id}'
+
+    def get(self, user_id) -> Dict:
+        """Get the zones a user is currently inside with their entry timestamps"""
+        memberships = None
+        if self._backend_name() == 'cache':
+            try:
+                memberships = cache.get(self._key(user_id))
+            except Exception as e:
+                logger.error(f"Failed to read geofence membership for user {user_id}: {e}")
+                memberships = self._get_local(user_id)
+        else:
+            memberships = self._get_local(user_id)
+
+        if memberships is None:
+            memberships = self.load(user_id)
+            self.set(user_id, memberships)
+
+        return memberships
+
+    def set(self, user_id, memberships: Dict) -> None:
+        """Store the zones a user is inside"""
+        if self._backend_name() == 'cache':
+            try:
+                cache.set(self._key(user_id), memberships, timeout=self.MEMBERSHIP_TTL_SECONDS)
+                return
+            except Exception as e:
+                logger.error(f"Failed to store geofence membership for user {user_id}: {e}")
+
+        with self._lock:
+            self._local[self._key(user_id)] = (
+                memberships, time.monotonic() + self.MEMBERSHIP_TTL_SECONDS
+            )
+            self._local.move_to_end(self._key(user_id))
+            while len(self._local) > self.LOCAL_MAX_USERS:
+                self._local.popitem(last=False)
+
+    def touch(self, user_id) -> None:
+        """Restart the expiry of a user's memberships without rewriting them"""
+        if self._backend_name() == 'cache':
+            try:
+                cache.touch(self._key(user_id), timeout=self.MEMBERSHIP_TTL_SECONDS)
+                return
+            except Exception as e:
+                logger.error(f"Failed to refresh geofence membership for user {user_id}: {e}")
+
+        with self._lock:
+            entry = self._local.get(self._key(user_id))
+            if entry is not None:
+                self._local[self._key(user_id)] = (
+                    entry[0], time.monotonic() + self.MEMBERSHIP_TTL_SECONDS
+                )
+
+    def _get_local(self, user_id) -> Optional[Dict]:
+        with self._lock:
+            entry = self._local.get(self._key(user_id))
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._local[self._key(user_id)]
+                return None
+            self._local.move_to_end(self._key(user_id))
+            return entry[0]
+
+    def load(self, user_id) -> Dict:
+        """Seed a user's memberships from their recent geofence events (one query)"""
+        from .models import GeofenceEvent
+
+        latest = {}
+        for zone_id, event_type, event_timestamp in GeofenceEvent.objects.filter(
+            user_id=user_id,
+            event_type__in=['ENTER', 'EXIT'],
+            event_timestamp__gte=timezone.now() - timedelta(seconds=self.MEMBERSHIP_TTL_SECONDS)
+        ).order_by('event_timestamp').values_list('geofence_zone_id', 'event_type', 'event_timestamp'):
+            latest[zone_id] = (event_type, event_timestamp)
+
+        return {
+            zone_id: event_timestamp.timestamp()
+            for zone_id, (event_type, event_timestamp) in latest.items()
+            if event_type == 'ENTER'
+        }
+
+    def clear(self, user_id) -> None:
+        """Forget a user's memberships"""
+        with self._lock:
+            self._local.pop(self._key(user_id), None)
+        try:
+            cache.delete(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Failed to clear geofence membership for user {user_id}: {e}")
+
+
+# Global geofence membership store instance
+_membership_store: Optional[GeofenceMembershipStore] = None
+
+
+def get_membership_store() -> GeofenceMembershipStore:
+    """Get global geofence membership store instance"""
+    global _membership_store
+    if _membership_store is None:
+        _membership_store = GeofenceMembershipStore()
+    return _membership_store
@@ -0,0 +1,206 @@
+"""
+Batched GPS Ingest for Real-time Tracking
+Buffers live location updates for a short window and stores them in one pass
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .location_store import get_location_store
+from .models import GPSLocation, RouteOptimization
+from .services import GeofenceService, RouteOptimizationService
+
+logger = logging.getLogger(__name__)
+
+
+class GPSIngestItem:
+    """One validated location update waiting to be stored"""
+
+    __slots__ = ('user', 'location_data', 'accuracy_level', 'ride_id')
+
+    def __init__(self, user, location_data: Dict, accuracy_level: str,
+                 ride_id: Optional[str] = None):
+        self.user = user
+        self.location_data = location_data
+        self.accuracy_level = accuracy_level
+        self.ride_id = ride_id
+
+
+def build_location(item: GPSIngestItem) -> GPSLocation:
+    """Build the unsaved GPSLocation for an update, encrypted for VIP users"""
+    location_data = item.location_data
+    return GPSLocation.objects.build_encrypted_location(
+        user=item.user,
+        latitude=location_data.get('latitude'),
+        longitude=location_data.get('longitude'),
+        accuracy_meters=location_data.get('accuracy', 0),
+        accuracy_level=item.accuracy_level,
+        device_timestamp=location_data.get('timestamp'),
+        altitude=location_data.get('altitude'),
+        bearing=location_data.get('bearing'),
+        speed_kmh=location_data.get('speed_kmh', location_data.get('speed')),
+        battery_level=location_data.get('battery_level'),
+    )
+
+
+def ingest_batch(items: List[GPSIngestItem]) -> List:
+    """
+    Store a batch of location updates and run geofencing and ETA updates
+
+    Locations are written with one bulk_create; if that fails the batch is
+    retried row by row so one bad update does not drop the others. The
+    stored rows become each user's last known location. Each
+    route optimization is loaded once and updated from the newest location
+    of its ride. Returns, per item, either {'location', 'geofence_events'}
+    or the exception that stopped it.
+    """
+    results: List = [None] * len(items)
+    locations = {}
+    for i, item in enumerate(items):
+        try:
+            locations[i] = build_location(item)
+        except Exception as e:
+            results[i] = e
+
+    try:
+        with transaction.atomic():
+            GPSLocation.objects.bulk_create(list(locations.values()))
+    except Exception as e:
+        logger.error(f"Bulk GPS insert failed, saving {len(locations)} rows individually: {e}")
+        for i, location in list(locations.items()):
+            try:
+                with transaction.atomic():
+                    location.save(force_insert=True)
+            except Exception as row_error:
+                results[i] = row_error
+                del locations[i]
+
+    try:
+        get_location_store().update(locations.values())
+    except Exception as e:
+        logger.error(f"Last known location update error: {str(e)}")
+
+    check_geofences = getattr(settings, 'GPS_TRACKING', {}).get('GEOFENCE_CHECK_ENABLED', True)
+    geofence_service = GeofenceService()
+    for i, location in locations.items():
+        results[i] = {
+            'location': location,
+            'geofence_events': (
+                geofence_service.check_location_geofences(location)
+                if check_geofences else []
+            )
+        }
+
+    # Only the newest location of each ride matters for its ETA
+    latest_by_ride = {}
+    for i, location in locations.items():
+        if items[i].ride_id:
+            latest_by_ride[str(items[i].ride_id)] = location
+
+    if latest_by_ride:
+        try:
+            route_service = RouteOptimizationService()
+            for route_optimization in RouteOptimization.objects.select_related('ride').filter(
+                ride_id__in=list(latest_by_ride)
+            ):
+                route_service.update_eta_real_time(
+                    route_optimization, latest_by_ride[str(route_optimization.ride_id)]
+                )
+        except Exception as e:
+            logger.error(f"Batched ETA update error: {str(e)}")
+
+    return results
+
+
+class GPSIngestBatcher:
+    """
+    Per-process micro-batcher for live GPS updates
+
+    Consumers await submit() for each update. Updates from every consumer
+    in the process are collected for INGEST_BATCH_WINDOW_MS (or until
+    INGEST_BATCH_SIZE are waiting) and stored by a single ingest_batch call
+    in the database thread, after which each submit() returns its own
+    result so the consumer can acknowledge the message.
+    """
+
+    DEFAULT_WINDOW_MS = 200
+    DEFAULT_BATCH_SIZE = 200
+
+    def __init__(self, window_ms: int = None, max_batch_size: int = None):
+        gps_settings = getattr(settings, 'GPS_TRACKING', {})
+        self.window_ms = window_ms or gps_settings.get(
+            'INGEST_BATCH_WINDOW_MS', self.DEFAULT_WINDOW_MS
+        )
+        self.max_batch_size = max_batch_size or gps_settings.get(
+            'INGEST_BATCH_SIZE', self.DEFAULT_BATCH_SIZE
+        )
+        self._pending = []
+        self._flush_handle = None
+        # The loop only holds tasks weakly; keep running flushes alive
+        self._flush_tasks = set()
+        self.stats = {'batches': 0, 'updates': 0, 'failed_updates': 0}
+
+    async def submit(self, user, location_data: Dict, accuracy_level: str,
+                     ride_id: Optional[str] = None) -> Dict:
+        """Queue an update and wait for the batch that stores it"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((GPSIngestItem(user, location_data, accuracy_level, ride_id), future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000.0, self._start_flush)
+
+        return await future
+
+    def _start_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch) -> None:
+        items = [item for item, _ in batch]
+        try:
+            results = await database_sync_to_async(ingest_batch)(items)
+        except Exception as e:
+            logger.error(f"GPS ingest batch failed: {str(e)}")
+            results = [e] * len(batch)
+
+        self.stats['batches'] += 1
+        self.stats['updates'] += len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue  # Consumer went away while the batch was stored
+            if isinstance(result, Exception):
+                self.stats['failed_updates'] += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        """Get batcher statistics"""
+        return {**self.stats, 'pending': len(self._pending)}
+
+
+# Global GPS ingest batcher instance
+_ingest_batcher: Optional[GPSIngestBatcher] = None
+
+
+def get_ingest_batcher() -> GPSIngestBatcher:
+    """Get global GPS ingest batcher instance"""
+    global _ingest_batcher
+    if _ingest_batcher is None:
+        _ingest_batcher = GPSIngestBatcher()
+    return _ingest_batcher
@@ -0,0 +1,182 @@
+"""
+Derived Key Cache for VIP GPS Encryption
+Keeps PBKDF2-derived per-user keys in memory so the KDF runs once per user
+"""
+
+import hashlib
+import threading
+import time
+import base64
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PBKDF2_ITERATIONS = 100000
+
+
+def derive_master_key(salt: bytes, user_key: str) -> bytes:
+    """Run the PBKDF2 derivation used for stored VIP coordinates"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=PBKDF2_ITERATIONS,
+    )
+    return kdf.derive(user_key.encode())
+
+
+def derive_subkey(master_key: bytes, context: str) -> bytes:
+    """Derive a 32-byte subkey for a context (e.g. a tracking session) with HKDF-Expand"""
+    return HKDFExpand(
+        algorithm=hashes.SHA256(),
+        length=32,
+        info=f'vip_gps_subkey:{context}'.encode(),
+    ).derive(master_key)
+
+
+class _KeyEntry:
+    """Cached master key with the Fernet cipher built from it"""
+
+    __slots__ = ('key', 'cipher', 'expires_at')
+
+    def __init__(self, key: bytes, ttl_seconds: float):
+        self.key = bytearray(key)
+        self.cipher = Fernet(base64.urlsafe_b64encode(bytes(self.key)))
+        self.expires_at = time.monotonic() + ttl_seconds
+
+    def wipe(self) -> None:
+        """Overwrite the cached key material before the entry is dropped"""
+        for i in range(len(self.key)):
+            self.key[i] = 0
+        self.cipher = None
+
+
+class DerivedKeyCache:
+    """
+    Bounded LRU cache of PBKDF2-derived VIP encryption keys
+
+    Entries are keyed by the KDF salt (the user id) and a SHA-256 digest of
+    the user key, so a changed key source never reuses a stale key. Entries
+    expire after a TTL, the least recently used entry is evicted when the
+    cache is full, and evicted key bytes are zeroed. Session subkeys are
+    derived from the cached master key with HKDF-Expand, which is cheap
+    enough to do per call.
+    """
+
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_TTL_SECONDS = 900
+
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[Tuple[bytes, bytes], _KeyEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'GPS_TRACKING', {}).get(
+            'ENCRYPTION_KEY_CACHE_SIZE', self.DEFAULT_MAX_ENTRIES
+        )
+
+    @property
+    def ttl_seconds(self) -> int:
+        if self._ttl_seconds is not None:
+            return self._ttl_seconds
+        return getattr(settings, 'GPS_TRACKING', {}).get(
+            'ENCRYPTION_KEY_CACHE_TTL_SECONDS', self.DEFAULT_TTL_SECONDS
+        )
+
+    def _cache_key(self, salt: bytes, user_key: str) -> Tuple[bytes, bytes]:
+        return salt, hashlib.sha256(user_key.encode()).digest()
+
+    def _lookup(self, salt: bytes, user_key: str, with_key: bool = False) -> Tuple[Fernet, Optional[bytes]]:
+        """
+        Get (cipher, master key bytes if requested), deriving the key on a miss
+
+        Both are read under the lock so a concurrent eviction can never
+        hand out wiped key material.
+        """
+        cache_key = self._cache_key(salt, user_key)
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                self.stats['hits'] += 1
+                return entry.cipher, bytes(entry.key) if with_key else None
+            if entry is not None:
+                self._discard(cache_key)
+
+        # Derive outside the lock so one slow KDF doesn't block other users
+        new_entry = _KeyEntry(derive_master_key(salt, user_key), self.ttl_seconds)
+
+        with self._lock:
+            self.stats['misses'] += 1
+            existing = self._entries.get(cache_key)
+            if existing is not None and existing.expires_at > time.monotonic():
+                new_entry.wipe()
+                entry = existing
+            else:
+                self._entries[cache_key] = entry = new_entry
+                while len(self._entries) > max(1, self.max_entries):
+                    self._discard(next(iter(self._entries)))
+
+            return entry.cipher, bytes(entry.key) if with_key else None
+
+    def _discard(self, cache_key) -> None:
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            entry.wipe()
+            self.stats['evictions'] += 1
+
+    def get_cipher(self, salt: bytes, user_key: str) -> Fernet:
+        """Get the Fernet cipher for a user's PBKDF2 master key"""
+        return self._lookup(salt, user_key)[0]
+
+    def get_subkey_cipher(self, salt: bytes, user_key: str, context: str) -> Fernet:
+        """Get a Fernet cipher for a subkey of the user's master key"""
+        master_key = self._lookup(salt, user_key, with_key=True)[1]
+        subkey = derive_subkey(master_key, context)
+        return Fernet(base64.urlsafe_b64encode(subkey))
+
+    def evict(self, salt: bytes) -> int:
+        """Drop every cached key derived with a salt (e.g. when a user is deleted)"""
+        with self._lock:
+            matching = [key for key in self._entries if key[0] == salt]
+            for cache_key in matching:
+                self._discard(cache_key)
+        return len(matching)
+
+    def clear(self) -> None:
+        """Drop and wipe every cached key"""
+        with self._lock:
+            for cache_key in list(self._entries):
+                self._discard(cache_key)
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries)}
+
+
+# Global derived key cache instance
+_key_cache: Optional[DerivedKeyCache] = None
+
+
+def get_key_cache() -> DerivedKeyCache:
+    """Get global derived key cache instance"""
+    global _key_cache
+    if _key_cache is None:
+        _key_cache = DerivedKeyCache()
+    return _key_cache
@@ -0,0 +1,158 @@
+"""
+Last-Known Location Store for GPS Tracking
+Newest position of every tracked user, kept out of the gps_locations table
+"""
+
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class LastLocationStore:
+    """
+    Maps each user id to their newest location entry
+
+    An entry is a dict with 'lat', 'lng', 'speed_kmh', 'bearing' and
+    'timestamp' (server time in epoch seconds). For VIP users the
+    coordinates stay encrypted: the entry carries the row's
+    'encrypted' ciphertext instead of lat/lng and coordinates() decrypts it
+    with the user's cached key.
+
+    The GPS ingest path writes entries; matching, speed validation, ETA
+    updates and the control center read them. Entries live in the shared
+    cache (backend 'cache', the default) or in a bounded in-process map
+    (backend 'local', also the fallback when the cache fails), and expire
+    after TTL_SECONDS without a fresh ping.
+    """
+
+    KEY_PREFIX = 'last_location'
+    TTL_SECONDS = 600
+    LOCAL_MAX_USERS = 100000
+
+    def __init__(self):
+        self._local: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _backend_name(self) -> str:
+        return getattr(settings, 'GPS_TRACKING', {}).get('LAST_LOCATION_BACKEND', 'cache')
+
+    def _key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:{user_id}'
+
+    @staticmethod
+    def entry_from_location(location) -> Dict:
+        """Build a store entry from a saved GPSLocation"""
+        server_timestamp = getattr(location, 'server_timestamp', None)
+        entry = {
+            'speed_kmh': location.speed_kmh,
+            'bearing': location.bearing,
+            'timestamp': server_timestamp.timestamp() if server_timestamp else time.time(),
+        }
+        if location.encrypted_coordinates:
+            entry['encrypted'] = location.encrypted_coordinates
+        else:
+            entry['lat'] = float(location.latitude)
+            entry['lng'] = float(location.longitude)
+        return entry
+
+    def update(self, locations: Iterable) -> int:
+        """Store the newest of the given locations for each user in one write"""
+        entries = {}
+        for location in locations:
+            entry = self.entry_from_location(location)
+            previous = entries.get(location.user_id)
+            if previous is None or previous['timestamp'] <= entry['timestamp']:
+                entries[location.user_id] = entry
+
+        if entries:
+            self.set_many(entries)
+        return len(entries)
+
+    def set_many(self, entries: Dict) -> None:
+        """Store {user_id: entry}"""
+        if self._backend_name() == 'cache':
+            try:
+                cache.set_many(
+                    {self._key(user_id): entry for user_id, entry in entries.items()},
+                    timeout=self.TTL_SECONDS
+                )
+                return
+            except Exception as e:
+                logger.error(f"Failed to store last known locations: {e}")
+
+        expires_at = time.monotonic() + self.TTL_SECONDS
+        with self._lock:
+            for user_id, entry in entries.items():
+                self._local[self._key(user_id)] = (entry, expires_at)
+                self._local.move_to_end(self._key(user_id))
+            while len(self._local) > self.LOCAL_MAX_USERS:
+                self._local.popitem(last=False)
+
+    def get(self, user_id) -> Optional[Dict]:
+        """Get the newest location entry of a user, or None if unknown or stale"""
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids: Iterable) -> Dict:
+        """Get {user_id: entry} for the users with a known location in one read"""
+        keys = {self._key(user_id): user_id for user_id in user_ids}
+        if not keys:
+            return {}
+
+        if self._backend_name() == 'cache':
+            try:
+                found = cache.get_many(list(keys))
+                return {keys[key]: entry for key, entry in found.items()}
+            except Exception as e:
+                logger.error(f"Failed to read last known locations: {e}")
+
+        now = time.monotonic()
+        entries = {}
+        with self._lock:
+            for key, user_id in keys.items():
+                stored = self._local.get(key)
+                if stored is not None and stored[1] > now:
+                    entries[user_id] = stored[0]
+        return entries
+
+    @staticmethod
+    def coordinates(entry: Optional[Dict], user=None) -> Tuple[Optional[float], Optional[float]]:
+        """Get (lat, lng) of an entry, decrypting VIP entries when the user is given"""
+        if not entry:
+            return None, None
+        if 'encrypted' not in entry:
+            return entry['lat'], entry['lng']
+        if user is None:
+            return None, None
+
+        from .models import GPSLocation
+        return GPSLocation(
+            user=user, encrypted_coordinates=entry['encrypted']
+        ).get_decrypted_coordinates()
+
+    def clear(self, user_id) -> None:
+        """Forget a user's last known location"""
+        with self._lock:
+            self._local.pop(self._key(user_id), None)
+        try:
+            cache.delete(self._key(user_id))
+        except Exception as e:
+            logger.error(f"Failed to clear last known location for user {user_id}: {e}")
+
+
+# Global last known location store instance
+_location_store: Optional[LastLocationStore] = None
+
+
+def get_location_store() -> LastLocationStore:
+    """Get global last known location store instance"""
+    global _location_store
+    if _location_store is None:
+        _location_store = LastLocationStore()
+    return _location_store
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:05
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_tracking', '0003_rename_gps_buffer_idx_buffered_lo_buffer__fec78f_idx_and_more'),
+        ('rides', '0003_alter_cancellationrecord_user_tier_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideTrajectory',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('encoded_path', models.TextField(help_text='Encoded (lat, lng, time) path')),
+                ('is_encrypted', models.BooleanField(default=False)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('raw_point_count', models.PositiveIntegerField(default=0)),
+                ('tolerance_meters', models.FloatField(default=0)),
+                ('distance_km', models.FloatField(default=0)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trajectories', to='rides.ride')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ride_trajectories', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ride_trajectories',
+                'ordering': ['started_at'],
+                'indexes': [models.Index(fields=['user', '-started_at'], name='ride_trajec_user_id_55772d_idx')],
+                'unique_together': {('ride', 'user')},
+            },
+        ),
+    ]
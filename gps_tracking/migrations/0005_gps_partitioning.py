@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_tracking', '0004_ridetrajectory'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geofenceevent',
+            name='gps_location',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to='gps_tracking.gpslocation'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-16 21:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_tracking', '0005_gps_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentSpeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cell', models.CharField(help_text="Grid cell as 'row:col'", max_length=24)),
+                ('hour', models.PositiveSmallIntegerField(validators=[django.core.validators.MaxValueValidator(23)])),
+                ('distance_km', models.FloatField(default=0)),
+                ('duration_hours', models.FloatField(default=0)),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'segment_speeds',
+                'indexes': [models.Index(fields=['hour', 'sample_count'], name='segment_spe_hour_311f7e_idx')],
+                'unique_together': {('cell', 'hour')},
+            },
+        ),
+    ]
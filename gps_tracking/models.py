@@ -7,23 +7,27 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
-from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
 import json
 import math
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
+from .geofence_index import point_in_polygon
+from .key_cache import get_key_cache
+from .polyline import decode_path, encode_path
+from .trajectory import haversine_km
+
 User = get_user_model()
 
 
 class GPSLocationManager(models.Manager):
     """Custom manager for GPS locations with encryption support"""
     
-    def create_encrypted_location(self, user, latitude, longitude, **kwargs):
-        """Create location with VIP encryption if user is VIP tier"""
+    def build_encrypted_location(self, user, latitude, longitude, **kwargs):
+        """Build an unsaved location with VIP encryption if user is VIP tier"""
         location = self.model(user=user, **kwargs)
         
         if hasattr(user, 'tier') and user.tier == 'VIP':
@@ -32,8 +36,63 @@ class GPSLocationManager(models.Manager):
             location.latitude = latitude
             location.longitude = longitude
             
+        return location
+    
+    def create_encrypted_location(self, user, latitude, longitude, **kwargs):
+        """Create location with VIP encryption if user is VIP tier"""
+        location = self.build_encrypted_location(user, latitude, longitude, **kwargs)
         location.save()
         return location
+    
+    def decrypt_coordinates(self, locations, max_workers=None):
+        """
+        Decrypt the coordinates of many locations, each row exactly once
+        
+        Users are loaded with one query for rows that don't have theirs
+        cached, each user's cipher is fetched once, and the results are
+        memoized on the instances so later .coordinates/.point reads are
+        free. With max_workers the Fernet work runs in a thread pool.
+        Returns the locations as a list.
+        """
+        locations = list(locations)
+        encrypted = [
+            location for location in locations
+            if location.encrypted_coordinates and
+            location._remembered_coordinates() is None
+        ]
+        if not encrypted:
+            return locations
+        
+        missing_user_ids = {
+            location.user_id for location in encrypted
+            if not self.model.user.is_cached(location)
+        }
+        if missing_user_ids:
+            users = User.objects.in_bulk(missing_user_ids)
+            for location in encrypted:
+                if location.user_id in users:
+                    location.user = users[location.user_id]
+        
+        ciphers = {}
+        for location in encrypted:
+            if location.user_id not in ciphers:
+                ciphers[location.user_id] = location._get_encryption_key(
+                    location._get_user_key()
+                )
+        
+        def decrypt(location):
+            return location._remember_coordinates(
+                location._decrypt_with(ciphers[location.user_id])
+            )
+        
+        if max_workers and len(encrypted) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(decrypt, encrypted))
+        else:
+            for location in encrypted:
+                decrypt(location)
+        
+        return locations
 
 
 class GPSLocation(models.Model):
@@ -145,17 +204,17 @@ class GPSLocation(models.Model):
         return f"GPS Location for {self.user} at {self.server_timestamp}"
     
     def _get_encryption_key(self, user_key):
-        """Generate encryption key from user-specific data"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=str(
-                getattr(self, 'user_id', None) or getattr(self.user, 'pk', '')
-            ).encode(),
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(user_key.encode()))
-        return Fernet(key)
+        """Get the Fernet cipher for the user's PBKDF2-derived key (cached per user)"""
+        salt = str(
+            getattr(self, 'user_id', None) or getattr(self.user, 'pk', '')
+        ).encode()
+        return get_key_cache().get_cipher(salt, user_key)
+    
+    def _get_user_key(self):
+        """Build the user-specific key material the encryption key is derived from"""
+        _joined = getattr(self.user, 'date_joined', timezone.now())
+        _uid = getattr(self, 'user_id', None) or getattr(self.user, 'pk', '')
+        return (f"vip_gps_{_uid}_" f"{_joined.isoformat()}")
     
     def set_encrypted_coordinates(self, lat_value, lng_value):
         """Encrypt coordinates for VIP users"""
@@ -163,10 +222,7 @@ class GPSLocation(models.Model):
             raise ValueError("Encryption only available for VIP users")
         
         # Use user-specific encryption key
-        _joined = getattr(self.user, 'date_joined', timezone.now())
-        _uid = getattr(self, 'user_id', None) or getattr(self.user, 'pk', '')
-        user_key = (f"vip_gps_{_uid}_" f"{_joined.isoformat()}")
-        cipher = self._get_encryption_key(user_key)
+        cipher = self._get_encryption_key(self._get_user_key())
         
         # Encrypt coordinates
         coordinates_data = {
@@ -182,17 +238,26 @@ class GPSLocation(models.Model):
         self.encryption_key_hash = base64.urlsafe_b64encode(
             hashes.Hash(hashes.SHA256()).finalize()
         ).decode()[:64]
+        
+        # The plaintext is known, so later reads need no decryption
+        self._remember_coordinates(
+            (coordinates_data['lat'], coordinates_data['lng'])
+        )
     
     def get_decrypted_coordinates(self):
-        """Decrypt coordinates for VIP users"""
+        """Decrypt coordinates for VIP users (once per ciphertext and instance)"""
         if not self.encrypted_coordinates:
             return self.latitude, self.longitude
-
-        _joined = getattr(self.user, 'date_joined', timezone.now())
-        _uid = getattr(self, 'user_id', None) or getattr(self.user, 'pk', '')
-        user_key = (f"vip_gps_{_uid}_" f"{_joined.isoformat()}")
-        cipher = self._get_encryption_key(user_key)
-
+        
+        remembered = self._remembered_coordinates()
+        if remembered is not None:
+            return remembered
+        
+        cipher = self._get_encryption_key(self._get_user_key())
+        return self._remember_coordinates(self._decrypt_with(cipher))
+    
+    def _decrypt_with(self, cipher):
+        """Decrypt the stored ciphertext with a given cipher"""
         try:
             encrypted_data = base64.urlsafe_b64decode(
                 self.encrypted_coordinates.encode()
@@ -203,6 +268,18 @@ class GPSLocation(models.Model):
         except Exception:
             return None, None
     
+    def _remembered_coordinates(self):
+        # Memo is tied to the ciphertext it came from, so reassigning
+        # encrypted_coordinates or refresh_from_db() never returns stale values
+        memo = self.__dict__.get('_decrypted_coordinates')
+        if memo is not None and memo[0] == self.encrypted_coordinates:
+            return memo[1]
+        return None
+    
+    def _remember_coordinates(self, coordinates):
+        self.__dict__['_decrypted_coordinates'] = (self.encrypted_coordinates, coordinates)
+        return coordinates
+    
     @property
     def coordinates(self):
         """Get coordinates (encrypted or plain)"""
@@ -307,27 +384,12 @@ class GeofenceZone(models.Model):
             latitude = float(point_or_latitude)
             longitude = float(longitude)
 
-        x, y = float(longitude), float(latitude)
         polygon = self.boundary_coordinates
-        
-        n = len(polygon)
-        inside = False
-        
-        p1x, p1y = polygon[0]
-        for i in range(1, n + 1):
-            p2x, p2y = polygon[i % n]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        xinters = None
-                        if p1y != p2y:
-                            xinters = ((y - p1y) * (p2x - p1x) /
-                                       (p2y - p1y) + p1x)
-                        if p1x == p2x or (xinters and x <= xinters):
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-        
-        return inside
+        return point_in_polygon(
+            float(longitude), float(latitude),
+            [float(vertex[0]) for vertex in polygon],
+            [float(vertex[1]) for vertex in polygon]
+        )
     
     def distance_to_point(self, latitude, longitude):
         """Calculate distance from center to point in meters"""
@@ -369,8 +431,10 @@ class GeofenceEvent(models.Model):
     geofence_zone = models.ForeignKey(
         GeofenceZone, on_delete=models.CASCADE, related_name='events'
     )
+    # No database constraint: gps_locations is partitioned on PostgreSQL
     gps_location = models.ForeignKey(
-        GPSLocation, on_delete=models.CASCADE, related_name='geofence_events'
+        GPSLocation, on_delete=models.CASCADE, db_constraint=False,
+        related_name='geofence_events'
     )
     
     event_type = models.CharField(max_length=10, choices=EVENT_TYPE_CHOICES)
@@ -589,13 +653,17 @@ class OfflineGPSBuffer(models.Model):
     def __str__(self):
         return f"Offline GPS Buffer for {self.user} ({self.total_locations} locations)"
     
-    def process_buffered_locations(self):
-        """Process and create GPSLocation objects from buffered data"""
-        if self.is_synced:
-            return
+    def process_buffered_locations(self, progress_callback=None):
+        """
+        Validate and bulk-create GPSLocation objects from buffered data
+        
+        progress_callback(processed, total) is called after each inserted
+        chunk (see gps_tracking.offline_sync.sync_points).
+        """
+        from .offline_sync import max_buffer_size, sync_points
         
-        created_locations = []
-        errors = []
+        if self.is_synced:
+            return [], []
         
         # Prefer normalized related rows if present
         # Access reverse relation via getattr to satisfy static analyzers
@@ -609,28 +677,11 @@ class OfflineGPSBuffer(models.Model):
                 'latitude', 'longitude', 'timestamp', 'accuracy',
                 'altitude', 'bearing', 'speed_kmh', 'battery_level'
             ))
-        locations_iter = normalized_points or self.buffered_locations
-
-        for location_data in locations_iter:
-            try:
-                gps_location = GPSLocation.objects.create(
-                    user=self.user,
-                    latitude=location_data.get('latitude'),
-                    longitude=location_data.get('longitude'),
-                    accuracy_meters=(
-                        location_data.get('accuracy')
-                        or location_data.get('accuracy_meters', 0)
-                    ),
-                    device_timestamp=location_data.get('timestamp'),
-                    is_offline_buffered=True,
-                    sync_status='SYNCED'
-                )
-                created_locations.append(gps_location.id)
-            except Exception as e:
-                errors.append({
-                    'location_data': location_data,
-                    'error': str(e)
-                })
+        locations = (normalized_points or self.buffered_locations)[-max_buffer_size():]
+        
+        created_locations, errors = sync_points(
+            self.user, locations, progress_callback=progress_callback
+        )
         
         self.is_synced = len(errors) == 0
         self.sync_timestamp = timezone.now()
@@ -662,3 +713,104 @@ class BufferedLocation(models.Model):
             models.Index(fields=['buffer']),
             models.Index(fields=['timestamp']),
         ]
+
+
+class RideTrajectory(models.Model):
+    """
+    Compacted GPS trajectory of one user during a finished ride
+    
+    Replaces the ride's raw gps_locations rows once the ride is over: the
+    Douglas-Peucker simplified path is stored as one encoded string of
+    (lat, lng, time) deltas. VIP trajectories are encrypted with the same
+    per-user key as their raw locations.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ride = models.ForeignKey(
+        'rides.Ride',
+        on_delete=models.CASCADE,
+        related_name='trajectories'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='ride_trajectories'
+    )
+    encoded_path = models.TextField(help_text="Encoded (lat, lng, time) path")
+    is_encrypted = models.BooleanField(default=False)
+    point_count = models.PositiveIntegerField(default=0)
+    raw_point_count = models.PositiveIntegerField(default=0)
+    tolerance_meters = models.FloatField(default=0)
+    distance_km = models.FloatField(default=0)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'ride_trajectories'
+        unique_together = [('ride', 'user')]
+        indexes = [
+            models.Index(fields=['user', '-started_at']),
+        ]
+        ordering = ['started_at']
+    
+    def __str__(self):
+        return f"Trajectory of {self.user} for ride {self.ride_id}"
+    
+    def _get_cipher(self):
+        location = GPSLocation(user=self.user)
+        return location._get_encryption_key(location._get_user_key())
+    
+    def set_points(self, points):
+        """Encode (lat, lng, epoch seconds) points, encrypting for VIP trajectories"""
+        encoded = encode_path(points)
+        if self.is_encrypted:
+            encoded = self._get_cipher().encrypt(encoded.encode()).decode()
+        self.encoded_path = encoded
+        self.point_count = len(points)
+    
+    def get_points(self):
+        """Decode the path into (lat, lng, epoch seconds) points"""
+        encoded = self.encoded_path
+        if self.is_encrypted:
+            encoded = self._get_cipher().decrypt(encoded.encode()).decode()
+        return decode_path(encoded)
+    
+    def path_distance_km(self, points=None):
+        """Length of the compacted path in kilometers"""
+        points = self.get_points() if points is None else points
+        return sum(
+            haversine_km(lat1, lng1, lat2, lng2)
+            for (lat1, lng1, _), (lat2, lng2, _) in zip(points, points[1:])
+        )
+
+
+class SegmentSpeed(models.Model):
+    """
+    Historical driving speed per grid cell and hour of day
+    
+    Learned from the trajectories of completed rides. Distance and time are
+    accumulated separately so speed_kmh is a time-weighted average.
+    """
+    cell = models.CharField(max_length=24, help_text="Grid cell as 'row:col'")
+    hour = models.PositiveSmallIntegerField(validators=[MaxValueValidator(23)])
+    distance_km = models.FloatField(default=0)
+    duration_hours = models.FloatField(default=0)
+    sample_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'segment_speeds'
+        unique_together = [('cell', 'hour')]
+        indexes = [
+            models.Index(fields=['hour', 'sample_count']),
+        ]
+    
+    def __str__(self):
+        return f"Speed in cell {self.cell} at {self.hour}:00"
+    
+    @property
+    def speed_kmh(self):
+        """Average speed in the cell at this hour"""
+        if not self.duration_hours:
+            return None
+        return self.distance_km / self.duration_hours
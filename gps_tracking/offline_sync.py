@@ -0,0 +1,141 @@
+"""
+Bulk Offline GPS Sync
+Validates a whole offline buffer as one trajectory and stores it with chunked bulk inserts
+"""
+
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import GPSLocation
+from .trajectory import TrajectoryValidator, parse_device_timestamp
+
+logger = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = 250
+
+LOCATION_FIELDS = ['altitude', 'bearing', 'speed_kmh', 'battery_level']
+
+
+def parse_points(buffered_locations: Sequence[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Normalize buffered points, sorted by device timestamp
+
+    Returns (points, errors). Each point carries its buffer 'index', float
+    'lat'/'lng'/'accuracy', the parsed 'device_timestamp' and its raw data.
+    """
+    points = []
+    errors = []
+    for index, location_data in enumerate(buffered_locations):
+        try:
+            latitude = location_data.get('latitude')
+            longitude = location_data.get('longitude')
+            if latitude is None or longitude is None:
+                errors.append({'index': index, 'error': 'Missing coordinates'})
+                continue
+
+            device_timestamp = parse_device_timestamp(location_data.get('timestamp'))
+            if device_timestamp is None:
+                errors.append({'index': index, 'error': 'Invalid timestamp'})
+                continue
+
+            points.append({
+                'index': index,
+                'lat': float(latitude),
+                'lng': float(longitude),
+                'accuracy': float(
+                    location_data.get('accuracy') or location_data.get('accuracy_meters') or 0
+                ),
+                'device_timestamp': device_timestamp,
+                'data': location_data
+            })
+        except (TypeError, ValueError, AttributeError) as e:
+            errors.append({'index': index, 'error': str(e)})
+
+    points.sort(key=lambda point: point['device_timestamp'])
+    return points, errors
+
+
+def validate_points(points: List[Dict], is_vip: bool = False) -> List[Tuple[bool, str, str]]:
+    """
+    Validate sorted points as one trajectory
+
+    A buffer is recorded while offline, so it starts its own trajectory
+    rather than continuing from the live connection. Returns
+    (is_valid, accuracy_level, reason) per point.
+    """
+    return TrajectoryValidator(is_vip=is_vip).score(points)
+
+
+def sync_points(user, buffered_locations: Sequence[Dict],
+                progress_callback: Optional[Callable[[int, int], None]] = None,
+                chunk_size: int = None) -> Tuple[List[str], List[Dict]]:
+    """
+    Validate and store buffered points for a user
+
+    Points are validated together, built as offline-buffered locations (the
+    VIP key is derived once and reused from the key cache) and inserted with
+    bulk_create in chunks. A chunk that fails is retried row by row.
+    progress_callback(processed, total) runs after each chunk. Returns
+    (created location ids, errors).
+    """
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    points, errors = parse_points(buffered_locations)
+    is_vip = getattr(user, 'tier', None) == 'VIP'
+    total = len(buffered_locations)
+
+    locations = []
+    for point, (is_valid, accuracy_level, reason) in zip(points, validate_points(points, is_vip)):
+        if not is_valid:
+            errors.append({'index': point['index'], 'error': reason})
+            continue
+        try:
+            locations.append((point['index'], GPSLocation.objects.build_encrypted_location(
+                user=user,
+                latitude=point['lat'],
+                longitude=point['lng'],
+                accuracy_meters=point['accuracy'],
+                accuracy_level=accuracy_level,
+                device_timestamp=point['device_timestamp'],
+                is_offline_buffered=True,
+                sync_status='SYNCED',
+                **{field: point['data'].get(field) for field in LOCATION_FIELDS
+                   if point['data'].get(field) is not None}
+            )))
+        except Exception as e:
+            errors.append({'index': point['index'], 'error': str(e)})
+
+    created = []
+    processed = total - len(locations)
+    for start in range(0, len(locations), chunk_size):
+        chunk = locations[start:start + chunk_size]
+        try:
+            with transaction.atomic():
+                GPSLocation.objects.bulk_create([location for _, location in chunk])
+            created.extend(str(location.id) for _, location in chunk)
+        except Exception as e:
+            logger.error(f"Offline GPS chunk insert failed, saving rows individually: {e}")
+            for index, location in chunk:
+                try:
+                    with transaction.atomic():
+                        location.save(force_insert=True)
+                    created.append(str(location.id))
+                except Exception as row_error:
+                    errors.append({'index': index, 'error': str(row_error)})
+
+        processed += len(chunk)
+        if progress_callback:
+            progress_callback(processed, total)
+
+    if not locations and progress_callback:
+        progress_callback(total, total)
+
+    errors.sort(key=lambda error: error['index'])
+    return created, errors
+
+
+def max_buffer_size() -> int:
+    """Largest number of points synced from one buffer"""
+    return getattr(settings, 'GPS_TRACKING', {}).get('OFFLINE_BUFFER_MAX_SIZE', 1000)
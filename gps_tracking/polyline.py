@@ -0,0 +1,138 @@
+"""
+Compact Path Encoding for GPS Trajectories
+Douglas-Peucker simplification and polyline encoding of timed points and routes
+"""
+
+import math
+from typing import List, Sequence, Tuple
+
+COORDINATE_PRECISION = 1e5  # ~1.1m, the precision of Google encoded polylines
+METERS_PER_DEGREE = 111320.0
+
+# (lat, lng, epoch seconds)
+TimedPoint = Tuple[float, float, float]
+
+
+def simplify_path(points: Sequence[TimedPoint], tolerance_meters: float) -> List[TimedPoint]:
+    """
+    Douglas-Peucker simplification of a timed path
+
+    Keeps the first and last points and every point that lies further than
+    tolerance_meters from the segment between the points kept around it.
+    Distances use an equirectangular projection around the path's first
+    point, which is accurate to well under a meter over a city ride.
+    """
+    if len(points) < 3 or tolerance_meters <= 0:
+        return list(points)
+
+    lng_scale = math.cos(math.radians(points[0][0])) * METERS_PER_DEGREE
+    projected = [(lng * lng_scale, lat * METERS_PER_DEGREE) for lat, lng, _ in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        max_distance, max_index = 0.0, None
+        for index in range(start + 1, end):
+            distance = _segment_distance(projected[index], projected[start], projected[end])
+            if distance > max_distance:
+                max_distance, max_index = distance, index
+        if max_index is not None and max_distance > tolerance_meters:
+            keep[max_index] = True
+            stack.append((start, max_index))
+            stack.append((max_index, end))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _segment_distance(point, start, end) -> float:
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(point[0] - start[0], point[1] - start[1])
+    t = max(0.0, min(1.0, ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) /
+                     (dx * dx + dy * dy)))
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+def encode_path(points: Sequence[TimedPoint]) -> str:
+    """
+    Encode timed points as one ASCII string
+
+    Uses the encoded polyline algorithm with a third value per point:
+    latitude and longitude at 1e-5 degrees and the time in whole seconds,
+    each stored as a zigzag varint delta from the previous point. A ride
+    point usually takes 6-10 characters.
+    """
+    chunks = []
+    previous = (0, 0, 0)
+    for lat, lng, timestamp in points:
+        current = (
+            int(round(lat * COORDINATE_PRECISION)),
+            int(round(lng * COORDINATE_PRECISION)),
+            int(round(timestamp)),
+        )
+        for value, last in zip(current, previous):
+            chunks.append(_encode_value(value - last))
+        previous = current
+    return ''.join(chunks)
+
+
+def encode_polyline(points: Sequence[Tuple[float, float]]) -> str:
+    """Encode (lat, lng) points as a standard encoded polyline"""
+    chunks = []
+    previous = (0, 0)
+    for lat, lng in points:
+        current = (int(round(lat * COORDINATE_PRECISION)), int(round(lng * COORDINATE_PRECISION)))
+        for value, last in zip(current, previous):
+            chunks.append(_encode_value(value - last))
+        previous = current
+    return ''.join(chunks)
+
+
+def decode_path(encoded: str) -> List[TimedPoint]:
+    """Decode a string from encode_path back into (lat, lng, epoch seconds) points"""
+    values = _decode_values(encoded)
+    points = []
+    lat = lng = timestamp = 0
+    for i in range(0, len(values) - 2, 3):
+        lat += values[i]
+        lng += values[i + 1]
+        timestamp += values[i + 2]
+        points.append((lat / COORDINATE_PRECISION, lng / COORDINATE_PRECISION, float(timestamp)))
+    return points
+
+
+def decode_polyline(encoded: str) -> List[Tuple[float, float]]:
+    """Decode a standard (lat, lng) encoded polyline, e.g. a Google Maps route"""
+    values = _decode_values(encoded)
+    points = []
+    lat = lng = 0
+    for i in range(0, len(values) - 1, 2):
+        lat += values[i]
+        lng += values[i + 1]
+        points.append((lat / COORDINATE_PRECISION, lng / COORDINATE_PRECISION))
+    return points
+
+
+def _decode_values(encoded: str) -> List[int]:
+    values = []
+    value, shift = 0, 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    return values
+
+
+def _encode_value(value: int) -> str:
+    value = ~(value << 1) if value < 0 else value << 1
+    chars = []
+    while value >= 0x20:
+        chars.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chars.append(chr(value + 63))
+    return ''.join(chars)
@@ -11,6 +11,15 @@ from .models import (
 )
 
 
+class GPSLocationListSerializer(serializers.ListSerializer):
+    """List serializer decrypting VIP coordinates of all rows in one pass"""
+    
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        locations = GPSLocation.objects.decrypt_coordinates(iterable)
+        return super().to_representation(locations)
+
+
 class GPSLocationSerializer(serializers.ModelSerializer):
     """Serializer for GPS location data"""
     
@@ -19,6 +28,7 @@ class GPSLocationSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = GPSLocation
+        list_serializer_class = GPSLocationListSerializer
         fields = [
             'id', 'user', 'coordinates', 'accuracy_meters', 
             'accuracy_level', 'altitude', 'bearing', 'speed_kmh',
@@ -10,15 +10,20 @@ from typing import Tuple, List, Dict, Optional
 # from django.contrib.gis.geos import Point, Polygon  # Removed GeoDjango dependency
 # from django.contrib.gis.measure import Distance  # Removed GeoDjango dependency
 from django.utils import timezone
-from django.core.cache import cache
 from django.conf import settings
 import googlemaps
 import logging
+from asgiref.sync import sync_to_async
 
 from .models import (
     GPSLocation, GeofenceZone, GeofenceEvent, 
     RouteOptimization, OfflineGPSBuffer
 )
+from .eta import get_eta_engine
+from .geofence_index import get_geofence_index
+from .geofence_membership import get_membership_store
+from .location_store import get_location_store
+from .trajectory import TrajectoryState, TrajectoryValidator, accuracy_level
 
 logger = logging.getLogger(__name__)
 
@@ -39,152 +44,62 @@ class GPSValidationService:
     MAX_WALKING_SPEED = 10      # Maximum walking speed
     
     def __init__(self):
-        self.gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY) if hasattr(settings, 'GOOGLE_MAPS_API_KEY') else None
+        self.gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY) if getattr(settings, 'GOOGLE_MAPS_API_KEY', None) else None
     
     async def validate_location(self, latitude: float, longitude: float, 
                               accuracy: float, user=None, 
-                              previous_location: GPSLocation = None) -> Tuple[bool, str]:
+                              previous_location: Dict = None,
+                              device_timestamp=None) -> Tuple[bool, str]:
         """
-        Validate GPS location for accuracy and authenticity
+        Validate a single GPS location for accuracy and authenticity
+        
+        previous_location is the user's last known location entry from the
+        location store; movement is measured from it. Streams of fixes
+        should use validate_fixes with a kept TrajectoryState instead.
         
         Returns:
             Tuple[bool, str]: (is_valid, accuracy_level)
         """
         try:
-            # Basic coordinate validation
-            if not self._validate_coordinates(latitude, longitude):
-                return False, 'UNKNOWN'
-            
-            # Accuracy level determination
-            accuracy_level = self._determine_accuracy_level(accuracy)
-            
-            # Speed validation if previous location exists
-            if previous_location:
-                is_speed_valid = await self._validate_speed(
-                    latitude, longitude, previous_location, user
-                )
-                if not is_speed_valid:
-                    return False, accuracy_level
-            
-            # Mock location detection (basic checks)
-            if await self._detect_mock_location(latitude, longitude, accuracy):
-                return False, accuracy_level
-            
-            # Additional validation for VIP users
-            if user and hasattr(user, 'tier') and user.tier == 'VIP':
-                is_vip_valid = await self._validate_vip_location(
-                    latitude, longitude, accuracy, user
-                )
-                if not is_vip_valid:
-                    return False, accuracy_level
-            
-            return True, accuracy_level
+            fix = {
+                'lat': float(latitude),
+                'lng': float(longitude),
+                'accuracy': float(accuracy or 0),
+                'device_timestamp': device_timestamp or timezone.now()
+            }
+            state = self.trajectory_state(user, previous_location)
+            is_valid, accuracy_level, _ = self.validate_fixes([fix], user, state)[0]
+            return is_valid, accuracy_level
             
         except Exception as e:
             logger.error(f"GPS validation error: {str(e)}")
             return False, 'UNKNOWN'
     
+    def validate_fixes(self, fixes: List[Dict], user=None,
+                       state: TrajectoryState = None) -> List[Tuple[bool, str, str]]:
+        """Score a device-time ordered batch of fixes against a device trajectory"""
+        is_vip = bool(user and getattr(user, 'tier', None) == 'VIP')
+        return TrajectoryValidator(is_vip=is_vip).score(fixes, state)
+    
+    def trajectory_state(self, user=None, previous_location: Dict = None) -> TrajectoryState:
+        """Start a device trajectory, from the last known location if there is one"""
+        lat, lng = get_location_store().coordinates(previous_location, user)
+        if lat is None or lng is None:
+            return TrajectoryState()
+        return TrajectoryState.from_fix(lat, lng, previous_location['timestamp'])
+    
     def _validate_coordinates(self, latitude: float, longitude: float) -> bool:
         """Validate coordinate ranges"""
         return (-90 <= latitude <= 90) and (-180 <= longitude <= 180)
     
     def _determine_accuracy_level(self, accuracy: float) -> str:
         """Determine accuracy level based on accuracy value"""
-        for level, threshold in self.ACCURACY_THRESHOLDS.items():
-            if accuracy <= threshold:
-                return level
-        return 'UNKNOWN'
-    
-    async def _validate_speed(self, latitude: float, longitude: float,
-                            previous_location: GPSLocation, user) -> bool:
-        """Validate movement speed between locations"""
-        try:
-            # Get previous coordinates
-            prev_lat, prev_lng = previous_location.coordinates
-            if prev_lat is None or prev_lng is None:
-                return True  # Cannot validate without previous coordinates
-            
-            # Calculate distance using Haversine formula
-            distance_km = self._calculate_distance(
-                prev_lat, prev_lng, latitude, longitude
-            )
-            
-            # Calculate time difference
-            time_diff = timezone.now() - previous_location.server_timestamp
-            time_hours = time_diff.total_seconds() / 3600
-            
-            if time_hours == 0:
-                return True  # Cannot calculate speed with zero time
-            
-            # Calculate speed
-            speed_kmh = distance_km / time_hours
-            
-            # Check against reasonable limits
-            if speed_kmh > self.MAX_REASONABLE_SPEED:
-                logger.warning(
-                    f"Unreasonable speed detected: {speed_kmh:.2f} km/h for user {user.id}"
-                )
-                return False
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Speed validation error: {str(e)}")
-            return True  # Default to valid if validation fails
-    
-    def _calculate_distance(self, lat1: float, lng1: float, 
-                          lat2: float, lng2: float) -> float:
-        """Calculate distance between two points using Haversine formula"""
-        R = 6371  # Earth's radius in kilometers
-        
-        dlat = math.radians(lat2 - lat1)
-        dlng = math.radians(lng2 - lng1)
-        
-        a = (math.sin(dlat / 2) ** 2 + 
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-             math.sin(dlng / 2) ** 2)
-        
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        distance = R * c
-        
-        return distance
-    
-    async def _detect_mock_location(self, latitude: float, longitude: float, 
-                                  accuracy: float) -> bool:
-        """Basic mock location detection"""
-        # Check for suspiciously perfect accuracy
-        if accuracy == 0 or accuracy < 1:
-            return True
-        
-        # Check for repeated exact coordinates
-        cache_key = f"gps_coords_{latitude}_{longitude}"
-        repeat_count = cache.get(cache_key, 0)
-        cache.set(cache_key, repeat_count + 1, timeout=300)  # 5 minutes
-        
-        if repeat_count > 10:  # Same coordinates reported too many times
-            return True
-        
-        return False
-    
-    async def _validate_vip_location(self, latitude: float, longitude: float,
-                                   accuracy: float, user) -> bool:
-        """Additional validation for VIP users"""
-        # VIP users require higher accuracy
-        if accuracy > 20:  # VIP requires accuracy within 20 meters
-            return False
-        
-        # Check if location is in a restricted area for VIP users
-        # (Implementation would check against restricted zones)
-        
-        return True
+        return accuracy_level(accuracy)
 
 
 class GeofenceService:
     """Service for managing geofencing operations"""
     
-    def __init__(self):
-        self.active_zones_cache_timeout = 300  # 5 minutes
-    
     def check_location_geofences(self, gps_location: GPSLocation) -> List[Dict]:
         """
         Check if location triggers any geofence events
@@ -197,128 +112,76 @@ class GeofenceService:
             if not point:
                 return []
             
-            # Get active geofence zones from cache or database
-            active_zones = self._get_active_geofence_zones()
+            # Only zones whose bounding box and polygon contain the point
+            geofence_index = get_geofence_index()
+            containing_zones = {
+                zone.pk: zone for zone in geofence_index.zones_containing(point)
+            }
             
-            events = []
-            for zone in active_zones:
-                # Check if point is within zone boundary
-                if zone.contains_point(point):
-                    event = self._handle_zone_entry(gps_location, zone)
-                    if event:
-                        events.append({
-                            'zone_id': str(zone.id),
-                            'zone_name': zone.name,
-                            'event_type': 'ENTER',
-                            'timestamp': timezone.now().isoformat()
-                        })
-                else:
-                    # Check if user was previously in this zone (exit event)
-                    exit_event = self._check_zone_exit(gps_location, zone)
-                    if exit_event:
-                        events.append({
-                            'zone_id': str(zone.id),
-                            'zone_name': zone.name,
-                            'event_type': 'EXIT',
-                            'timestamp': timezone.now().isoformat()
-                        })
+            # Diff against the zones the user is known to be inside
+            membership_store = get_membership_store()
+            user = gps_location.user
+            memberships = membership_store.get(user.pk)
+            entered_ids = [zone_id for zone_id in containing_zones if zone_id not in memberships]
+            exited_ids = [zone_id for zone_id in memberships if zone_id not in containing_zones]
             
-            return events
+            if not entered_ids and not exited_ids:
+                # Keep the memberships of users who stay put from expiring
+                membership_store.touch(user.pk)
+                return []
+            
+            now = timezone.now()
+            geofence_events = []
+            for zone_id in entered_ids:
+                zone = containing_zones[zone_id]
+                geofence_events.append(GeofenceEvent(
+                    user=user,
+                    geofence_zone=zone,
+                    gps_location=gps_location,
+                    event_type='ENTER',
+                    ride=gps_location.ride,
+                    triggered_actions=self._get_zone_actions(user, zone)
+                ))
+            
+            for zone_id in exited_ids:
+                zone = geofence_index.get_zone(zone_id)
+                if zone is None:
+                    continue  # Zone deactivated or deleted while the user was inside
+                geofence_events.append(GeofenceEvent(
+                    user=user,
+                    geofence_zone=zone,
+                    gps_location=gps_location,
+                    event_type='EXIT',
+                    ride=gps_location.ride,
+                    duration_seconds=max(0, int(now.timestamp() - memberships[zone_id]))
+                ))
+            
+            GeofenceEvent.objects.bulk_create(geofence_events)
+            
+            updated_memberships = {
+                zone_id: entered_at for zone_id, entered_at in memberships.items()
+                if zone_id in containing_zones
+            }
+            for zone_id in entered_ids:
+                updated_memberships[zone_id] = now.timestamp()
+            membership_store.set(user.pk, updated_memberships)
+            
+            return [
+                {
+                    'zone_id': str(event.geofence_zone.id),
+                    'zone_name': event.geofence_zone.name,
+                    'event_type': event.event_type,
+                    'timestamp': now.isoformat()
+                }
+                for event in geofence_events
+            ]
             
         except Exception as e:
             logger.error(f"Geofence checking error: {str(e)}")
             return []
     
-    def _get_active_geofence_zones(self) -> List[GeofenceZone]:
-        """Get active geofence zones with caching"""
-        cache_key = "active_geofence_zones"
-        zones = cache.get(cache_key)
-        
-        if zones is None:
-            zones = list(GeofenceZone.objects.filter(is_active=True))
-            cache.set(cache_key, zones, timeout=self.active_zones_cache_timeout)
-        
-        return zones
-    
-    def _handle_zone_entry(self, gps_location: GPSLocation, 
-                          zone: GeofenceZone) -> Optional[GeofenceEvent]:
-        """Handle geofence zone entry"""
-        try:
-            # Check if user was not already in this zone
-            recent_entry = GeofenceEvent.objects.filter(
-                user=gps_location.user,
-                geofence_zone=zone,
-                event_type='ENTER',
-                event_timestamp__gte=timezone.now() - timedelta(minutes=5)
-            ).exists()
-            
-            if recent_entry:
-                return None  # Already entered recently
-            
-            # Create entry event
-            event = GeofenceEvent.objects.create(
-                user=gps_location.user,
-                geofence_zone=zone,
-                gps_location=gps_location,
-                event_type='ENTER',
-                ride=gps_location.ride
-            )
-            
-            # Trigger zone-specific actions
-            self._trigger_zone_actions(event, zone)
-            
-            return event
-            
-        except Exception as e:
-            logger.error(f"Zone entry handling error: {str(e)}")
-            return None
-    
-    def _check_zone_exit(self, gps_location: GPSLocation, 
-                        zone: GeofenceZone) -> Optional[GeofenceEvent]:
-        """Check and handle geofence zone exit"""
-        try:
-            # Check if user was recently in this zone
-            recent_entry = GeofenceEvent.objects.filter(
-                user=gps_location.user,
-                geofence_zone=zone,
-                event_type='ENTER',
-                event_timestamp__gte=timezone.now() - timedelta(hours=1)
-            ).order_by('-event_timestamp').first()
-            
-            if not recent_entry:
-                return None  # User was not in this zone
-            
-            # Check if exit event already exists
-            exit_exists = GeofenceEvent.objects.filter(
-                user=gps_location.user,
-                geofence_zone=zone,
-                event_type='EXIT',
-                event_timestamp__gt=recent_entry.event_timestamp
-            ).exists()
-            
-            if exit_exists:
-                return None  # Exit already recorded
-            
-            # Create exit event
-            event = GeofenceEvent.objects.create(
-                user=gps_location.user,
-                geofence_zone=zone,
-                gps_location=gps_location,
-                event_type='EXIT',
-                ride=gps_location.ride,
-                duration_seconds=(
-                    timezone.now() - recent_entry.event_timestamp
-                ).total_seconds()
-            )
-            
-            return event
-            
-        except Exception as e:
-            logger.error(f"Zone exit checking error: {str(e)}")
-            return None
-    
-    def _trigger_zone_actions(self, event: GeofenceEvent, zone: GeofenceZone):
-        """Trigger actions based on geofence zone rules"""
+    def _get_zone_actions(self, user, zone: GeofenceZone) -> List[str]:
+        """Get the actions a zone entry triggers under the zone rules"""
         actions = []
         
         # Airport zone actions
@@ -328,7 +191,7 @@ class GeofenceService:
         
         # VIP zone actions
         elif zone.zone_type == 'VIP_ONLY' and not zone.requires_vip:
-            if not hasattr(event.user, 'tier') or event.user.tier != 'VIP':
+            if not hasattr(user, 'tier') or user.tier != 'VIP':
                 actions.append('unauthorized_vip_zone')
                 # Alert control center
         
@@ -342,16 +205,14 @@ class GeofenceService:
             actions.append('restricted_area_alert')
             # Alert control center and user
         
-        # Save triggered actions
-        event.triggered_actions = actions
-        event.save()
+        return actions
 
 
 class RouteOptimizationService:
     """Service for route optimization and ETA calculation"""
     
     def __init__(self):
-        self.gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY) if hasattr(settings, 'GOOGLE_MAPS_API_KEY') else None
+        self.gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY) if getattr(settings, 'GOOGLE_MAPS_API_KEY', None) else None
     
     async def calculate_optimized_route(self, pickup_point: dict,
                                       dropoff_point: dict,
@@ -479,18 +340,24 @@ class RouteOptimizationService:
                                    user) -> RouteOptimization:
         """Update route with real-time data"""
         try:
-            # Get user's current location
-            latest_location = GPSLocation.objects.filter(
-                user=user,
-                ride=route_optimization.ride
-            ).order_by('-server_timestamp').first()
-            
-            if not latest_location:
-                return route_optimization
-            
-            current_point = latest_location.point
-            if not current_point:
-                return route_optimization
+            # Get user's current location, from the table only if not tracked live
+            lat, lng = get_location_store().coordinates(
+                get_location_store().get(user.pk), user
+            )
+            if lat is not None and lng is not None:
+                current_point = {'latitude': lat, 'longitude': lng}
+            else:
+                latest_location = GPSLocation.objects.filter(
+                    user=user,
+                    ride=route_optimization.ride
+                ).order_by('-server_timestamp').first()
+                
+                if not latest_location:
+                    return route_optimization
+                
+                current_point = latest_location.point
+                if not current_point:
+                    return route_optimization
             
             # Recalculate route from current location to destination
             updated_route_data = await self.calculate_optimized_route(
@@ -519,39 +386,21 @@ class RouteOptimizationService:
             return route_optimization
     
     def update_eta_real_time(self, route_optimization: RouteOptimization, 
-                           gps_location: GPSLocation):
-        """Update ETA based on current GPS location"""
+                           gps_location: GPSLocation) -> bool:
+        """
+        Update ETA based on current GPS location
+        
+        Uses the ride's smoothed speed and learned segment speeds along the
+        route (see gps_tracking.eta). The route optimization is only saved
+        when the ETA moves by more than ETA_UPDATE_THRESHOLD_SECONDS.
+        Returns whether it was saved.
+        """
         try:
-            current_point = gps_location.point
-            if not current_point:
-                return
-            
-            # Calculate remaining distance to destination
-            remaining_distance = self._calculate_straight_line_distance(
-                current_point, route_optimization.dropoff_point
-            )
-            
-            # Estimate remaining time based on current speed and traffic
-            current_speed = gps_location.speed_kmh or 30  # Default 30 km/h
-            
-            # Adjust for traffic
-            traffic_multiplier = {
-                'LOW': 1.0,
-                'MODERATE': 1.2,
-                'HEAVY': 1.5,
-                'SEVERE': 2.0
-            }.get(route_optimization.traffic_level, 1.2)
-            
-            estimated_time_hours = (remaining_distance * traffic_multiplier) / current_speed
-            estimated_time_seconds = estimated_time_hours * 3600
-            
-            # Update ETA
-            new_eta = timezone.now() + timedelta(seconds=estimated_time_seconds)
-            route_optimization.current_eta = new_eta
-            route_optimization.save()
+            return get_eta_engine().update(route_optimization, gps_location)
             
         except Exception as e:
             logger.error(f"ETA update error: {str(e)}")
+            return False
 
 
 class OfflineGPSService:
@@ -566,6 +415,9 @@ class OfflineGPSService:
         """
         Process offline GPS buffer and create location records
         
+        The whole buffer is validated in one pass and inserted in chunks
+        (see gps_tracking.offline_sync), in the database thread.
+        
         Returns:
             Tuple of (created_location_ids, errors)
         """
@@ -573,80 +425,25 @@ class OfflineGPSService:
             if len(buffered_locations) > self.max_buffer_size:
                 buffered_locations = buffered_locations[-self.max_buffer_size:]
             
-            # Create offline buffer record
-            offline_buffer = OfflineGPSBuffer.objects.create(
-                user=user,
-                device_id=device_id,
-                buffered_locations=buffered_locations,
-                start_timestamp=timezone.now() - timedelta(hours=1),
-                end_timestamp=timezone.now(),
-                total_locations=len(buffered_locations),
-                app_version="1.0.0",
-                device_info={}
+            return await sync_to_async(self._store_and_sync)(
+                user, device_id, buffered_locations
             )
             
-            # Process each buffered location
-            created_locations = []
-            errors = []
-            
-            validation_service = GPSValidationService()
-            
-            for location_data in buffered_locations:
-                try:
-                    # Validate location data
-                    latitude = location_data.get('latitude')
-                    longitude = location_data.get('longitude')
-                    accuracy = location_data.get('accuracy', 0)
-                    
-                    if not all([latitude, longitude]):
-                        errors.append({
-                            'location_data': location_data,
-                            'error': 'Missing coordinates'
-                        })
-                        continue
-                    
-                    # Validate GPS accuracy
-                    is_valid, accuracy_level = await validation_service.validate_location(
-                        latitude, longitude, accuracy, user
-                    )
-                    
-                    if not is_valid:
-                        errors.append({
-                            'location_data': location_data,
-                            'error': 'Location validation failed'
-                        })
-                        continue
-                    
-                    # Create GPS location
-                    gps_location = GPSLocation.objects.create_encrypted_location(
-                        user=user,
-                        latitude=latitude,
-                        longitude=longitude,
-                        accuracy_meters=accuracy,
-                        accuracy_level=accuracy_level,
-                        device_timestamp=location_data.get('timestamp'),
-                        is_offline_buffered=True,
-                        sync_status='SYNCED',
-                        **{k: v for k, v in location_data.items() 
-                           if k in ['altitude', 'bearing', 'speed_kmh', 'battery_level']}
-                    )
-                    
-                    created_locations.append(str(gps_location.id))
-                    
-                except Exception as e:
-                    errors.append({
-                        'location_data': location_data,
-                        'error': str(e)
-                    })
-            
-            # Update buffer sync status
-            offline_buffer.is_synced = len(errors) == 0
-            offline_buffer.sync_timestamp = timezone.now()
-            offline_buffer.sync_errors = errors
-            offline_buffer.save()
-            
-            return created_locations, errors
-            
         except Exception as e:
             logger.error(f"Offline buffer processing error: {str(e)}")
             return [], [{'error': str(e)}]
+    
+    def _store_and_sync(self, user, device_id: str,
+                        buffered_locations: List[Dict]) -> Tuple[List, List]:
+        """Create the offline buffer record and sync its points"""
+        offline_buffer = OfflineGPSBuffer.objects.create(
+            user=user,
+            device_id=device_id,
+            buffered_locations=buffered_locations,
+            start_timestamp=timezone.now() - timedelta(hours=1),
+            end_timestamp=timezone.now(),
+            total_locations=len(buffered_locations),
+            app_version="1.0.0",
+            device_info={}
+        )
+        return offline_buffer.process_buffered_locations()
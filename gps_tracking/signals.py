@@ -0,0 +1,34 @@
+# gps_tracking/signals.py
+"""
+GPS tracking signals keeping in-memory encryption and geofence state current
+"""
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .geofence_index import get_geofence_index
+from .key_cache import get_key_cache
+from .location_store import get_location_store
+from .models import GeofenceZone
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """Wipe cached VIP location keys and the last known location of a deleted user"""
+    get_key_cache().evict(str(instance.pk).encode())
+    get_location_store().clear(instance.pk)
+
+
+@receiver(post_save, sender=GeofenceZone)
+def geofence_zone_saved(sender, instance, **kwargs):
+    """Rebuild the geofence index after a zone is created or changed"""
+    get_geofence_index().invalidate()
+
+
+@receiver(post_delete, sender=GeofenceZone)
+def geofence_zone_deleted(sender, instance, **kwargs):
+    """Rebuild the geofence index after a zone is removed"""
+    get_geofence_index().invalidate()
@@ -4,6 +4,7 @@ Celery tasks for GPS tracking and route optimization
 
 from celery import shared_task
 # from django.contrib.gis.geos import Point  # Removed GeoDjango dependency
+from django.conf import settings
 from django.utils import timezone
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -125,7 +126,8 @@ def update_route_eta_real_time(route_optimization_id, gps_location_id):
         gps_location = GPSLocation.objects.get(id=gps_location_id)
         
         route_service = RouteOptimizationService()
-        route_service.update_eta_real_time(route_optimization, gps_location)
+        if not route_service.update_eta_real_time(route_optimization, gps_location):
+            return  # ETA did not move enough to be worth saving or announcing
         
         # Notify WebSocket clients of ETA update
         async_to_sync(channel_layer.group_send)(
@@ -149,22 +151,38 @@ def update_route_eta_real_time(route_optimization_id, gps_location_id):
 @shared_task
 def sync_offline_gps_buffer(offline_buffer_id):
     """
-    Process offline GPS buffer asynchronously
+    Process offline GPS buffer asynchronously, reporting progress over the socket
     """
     try:
         from .models import OfflineGPSBuffer
         
-        offline_buffer = OfflineGPSBuffer.objects.get(id=offline_buffer_id)
-        created_locations, errors = offline_buffer.process_buffered_locations()
+        offline_buffer = OfflineGPSBuffer.objects.select_related('user').get(id=offline_buffer_id)
+        group_name = f"gps_tracking_{offline_buffer.user_id}"
+        
+        def report_progress(processed, total):
+            async_to_sync(channel_layer.group_send)(
+                group_name,
+                {
+                    'type': 'offline_sync_progress',
+                    'buffer_id': str(offline_buffer.id),
+                    'processed': processed,
+                    'total': total
+                }
+            )
+        
+        created_locations, errors = offline_buffer.process_buffered_locations(
+            progress_callback=report_progress
+        )
         
         # Notify user of sync completion
         async_to_sync(channel_layer.group_send)(
-            f"user_{offline_buffer.user.id}",
+            group_name,
             {
                 'type': 'offline_sync_complete',
                 'buffer_id': str(offline_buffer.id),
                 'synced_count': len(created_locations),
                 'error_count': len(errors),
+                'errors': errors[:5],
                 'success': len(errors) == 0
             }
         )
@@ -180,18 +198,41 @@ def sync_offline_gps_buffer(offline_buffer_id):
 def cleanup_old_gps_data():
     """
     Cleanup old GPS location data (older than 30 days for non-VIP users)
+    
+    Encrypted (VIP) locations are only removed once they are older than
+    VIP_LOCATION_RETENTION_DAYS, if that is set. When gps_locations is
+    partitioned, whole expired days are dropped instead of deleting rows.
     """
     try:
         from datetime import timedelta
+        from core.gps_partitions import drop_partitions_before, is_partitioned
         
-        cutoff_date = timezone.now() - timedelta(days=30)
+        gps_settings = getattr(settings, 'GPS_TRACKING', {})
+        cutoff_date = timezone.now() - timedelta(
+            days=gps_settings.get('LOCATION_RETENTION_DAYS', 30)
+        )
+        vip_retention_days = gps_settings.get('VIP_LOCATION_RETENTION_DAYS')
+        vip_cutoff_date = (
+            timezone.now() - timedelta(days=vip_retention_days)
+            if vip_retention_days else None
+        )
         
-        # Delete old GPS locations for non-VIP users
-        deleted_count = GPSLocation.objects.filter(
-            server_timestamp__lt=cutoff_date
-        ).exclude(
-            user__tier='VIP'  # Keep VIP data longer
-        ).delete()[0]
+        if is_partitioned('gps_locations'):
+            deleted_count = drop_partitions_before(
+                'gps_locations', cutoff_date, segment='std'
+            )
+            if vip_cutoff_date:
+                deleted_count += drop_partitions_before('gps_locations', vip_cutoff_date)
+        else:
+            # Delete old GPS locations for non-VIP users
+            deleted_count = GPSLocation.objects.filter(
+                server_timestamp__lt=cutoff_date,
+                encrypted_coordinates__isnull=True
+            ).delete()[0]
+            if vip_cutoff_date:
+                deleted_count += GPSLocation.objects.filter(
+                    server_timestamp__lt=vip_cutoff_date
+                ).delete()[0]
         
         # Delete old geofence events
         GeofenceEvent.objects.filter(
@@ -204,6 +245,25 @@ def cleanup_old_gps_data():
         logger.error(f"GPS cleanup error: {str(e)}")
 
 
+@shared_task
+def compact_ride_trajectories():
+    """
+    Collapse the raw GPS rows of finished rides into compressed trajectories
+    """
+    try:
+        from .compaction import compact_finished_rides
+        
+        stats = compact_finished_rides()
+        logger.info(
+            f"Compacted {stats['rides']} rides: {stats['raw_points']} GPS points "
+            f"stored as {stats['stored_points']}"
+        )
+        return stats
+        
+    except Exception as e:
+        logger.error(f"Trajectory compaction error: {str(e)}")
+
+
 @shared_task
 def monitor_vip_users():
     """
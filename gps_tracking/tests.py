@@ -1,11 +1,34 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal
 from unittest.mock import patch
+from cryptography.fernet import Fernet, InvalidToken
+import asyncio
+import base64
 import json
+import time
 
-from .models import GPSLocation, GeofenceZone
+from .broadcast import LocationFanout, decode_batch, encode_batch
+from .compaction import compact_finished_rides, compact_ride, ride_distance_km, ride_replay
+from .eta import ETAEngine, SegmentSpeedTable, learn_segment_speeds, local_hour
+from .consumers import ControlCenterConsumer
+from .geofence_index import GeofenceIndex, get_geofence_index
+from .geofence_membership import GeofenceMembershipStore, get_membership_store
+from .ingest import GPSIngestBatcher, GPSIngestItem, ingest_batch
+from .key_cache import DerivedKeyCache, derive_master_key, get_key_cache
+from .location_store import LastLocationStore, get_location_store
+from .polyline import decode_path, encode_path, encode_polyline, simplify_path
+from .trajectory import TrajectoryState, TrajectoryValidator
+from . import offline_sync
+from .models import (
+    GPSLocation, GeofenceEvent, GeofenceZone, OfflineGPSBuffer, RideTrajectory,
+    RouteOptimization, SegmentSpeed
+)
+from .services import GeofenceService, GPSValidationService
 from accounts.models import User
 
 User = get_user_model()
@@ -180,3 +203,944 @@ class GPSEncryptionTestCase(TestCase):
         # Normal users should have plain GPS data
         self.assertIsNotNone(location.latitude)
         self.assertIsNotNone(location.longitude)
+
+
+class DerivedKeyCacheTestCase(TestCase):
+    """Test cached PBKDF2 keys for VIP location encryption"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='vip-keys@example.com',
+            password='testpass123',
+            phone_number='+2348000000002'
+        )
+        self.user.tier = 'VIP'
+        get_key_cache().clear()
+    
+    def _location(self):
+        return GPSLocation(
+            user=self.user,
+            accuracy_meters=5.0,
+            device_timestamp=timezone.now()
+        )
+    
+    def test_kdf_runs_once_per_user(self):
+        """Encrypting and decrypting repeatedly derives the key once"""
+        with patch('gps_tracking.key_cache.derive_master_key', wraps=derive_master_key) as kdf:
+            for _ in range(3):
+                location = self._location()
+                location.set_encrypted_coordinates(6.5244, 3.3792)
+                self.assertEqual(location.get_decrypted_coordinates(), (6.5244, 3.3792))
+        
+        self.assertEqual(kdf.call_count, 1)
+    
+    def test_legacy_ciphertext_still_readable(self):
+        """Rows encrypted with the uncached PBKDF2 derivation decrypt unchanged"""
+        location = self._location()
+        key = derive_master_key(str(self.user.pk).encode(), location._get_user_key())
+        legacy_cipher = Fernet(base64.urlsafe_b64encode(key))
+        location.encrypted_coordinates = base64.urlsafe_b64encode(
+            legacy_cipher.encrypt(json.dumps({'lat': 6.45, 'lng': 3.39}).encode())
+        ).decode()
+        
+        self.assertEqual(location.get_decrypted_coordinates(), (6.45, 3.39))
+    
+    def test_lru_eviction_and_subkeys(self):
+        """The cache stays bounded and subkeys differ per context"""
+        cache = DerivedKeyCache(max_entries=2, ttl_seconds=60)
+        for user_id in [b'1', b'2', b'3']:
+            cache.get_cipher(user_id, 'key-material')
+        
+        self.assertEqual(cache.get_stats()['size'], 2)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+        
+        token = cache.get_subkey_cipher(b'2', 'key-material', 'session-a').encrypt(b'x')
+        self.assertEqual(cache.get_subkey_cipher(b'2', 'key-material', 'session-a').decrypt(token), b'x')
+        with self.assertRaises(InvalidToken):
+            cache.get_subkey_cipher(b'2', 'key-material', 'session-b').decrypt(token)
+
+
+class DecryptedCoordinatesTestCase(TestCase):
+    """Test decrypt-once coordinate memoization and bulk decryption"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='vip-points@example.com',
+            password='testpass123',
+            phone_number='+2348000000003'
+        )
+        self.user.tier = 'VIP'
+    
+    def _encrypted_location(self, lat, lng):
+        location = GPSLocation(
+            user=self.user,
+            accuracy_meters=5.0,
+            device_timestamp=timezone.now()
+        )
+        location.set_encrypted_coordinates(lat, lng)
+        location.save()
+        return location
+    
+    def test_point_decrypts_once(self):
+        """Repeated .point reads on one instance decrypt a single time"""
+        location = GPSLocation.objects.select_related('user').get(
+            pk=self._encrypted_location(6.5, 3.3).pk
+        )
+        
+        with patch.object(GPSLocation, '_decrypt_with', autospec=True,
+                          side_effect=GPSLocation._decrypt_with) as decrypt:
+            for _ in range(3):
+                self.assertEqual(location.point, {'latitude': 6.5, 'longitude': 3.3})
+        
+        self.assertEqual(decrypt.call_count, 1)
+    
+    def test_memo_replaced_on_new_coordinates(self):
+        """Re-encrypting replaces the remembered coordinates"""
+        location = self._encrypted_location(6.5, 3.3)
+        location.set_encrypted_coordinates(6.6, 3.4)
+        
+        self.assertEqual(location.coordinates, (6.6, 3.4))
+    
+    def test_bulk_decryption(self):
+        """Listing decrypts each row once with one query for the users"""
+        for i in range(5):
+            self._encrypted_location(6.5 + i / 100, 3.3)
+        
+        for max_workers in [None, 4]:
+            with self.subTest(max_workers=max_workers):
+                rows = list(GPSLocation.objects.filter(user=self.user))
+                with self.assertNumQueries(1):
+                    GPSLocation.objects.decrypt_coordinates(rows, max_workers=max_workers)
+                    points = [row.point for row in rows]
+                
+                self.assertEqual(
+                    sorted(point['latitude'] for point in points),
+                    [6.5, 6.51, 6.52, 6.53, 6.54]
+                )
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _square_zone(name, min_lng, min_lat, size, **kwargs):
+    return GeofenceZone.objects.create(
+        name=name,
+        zone_type='PICKUP',
+        boundary_coordinates=[
+            [min_lng, min_lat], [min_lng + size, min_lat],
+            [min_lng + size, min_lat + size], [min_lng, min_lat + size]
+        ],
+        center_latitude=Decimal(str(round(min_lat + size / 2, 6))),
+        center_longitude=Decimal(str(round(min_lng + size / 2, 6))),
+        radius_meters=size * 55000,
+        **kwargs
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GeofenceIndexTestCase(TestCase):
+    """Test the geofence grid index and its use in GeofenceService"""
+    
+    def setUp(self):
+        self.airport = _square_zone('Airport', 3.30, 6.55, 0.04)
+        self.hotel = _square_zone('Hotel', 3.32, 6.57, 0.005)
+        self.region = _square_zone('Region', 2.0, 5.0, 3.0)
+        self.inactive = _square_zone('Closed', 3.30, 6.55, 0.04, is_active=False)
+        self.user = User.objects.create_user(
+            email='geofence@example.com',
+            password='testpass123',
+            phone_number='+2348000000004'
+        )
+    
+    def test_index_matches_contains_point(self):
+        """The index returns exactly the active zones contains_point accepts"""
+        index = GeofenceIndex()
+        active = list(GeofenceZone.objects.filter(is_active=True))
+        index.build(active)
+        self.assertEqual(index.get_stats()['large_zones'], 1)
+        
+        for lat in [6.50, 6.55, 6.56, 6.572, 6.575, 6.59, 6.6, 8.5]:
+            for lng in [3.25, 3.30, 3.31, 3.322, 3.325, 3.34, 3.4, 5.5]:
+                expected = {zone.pk for zone in active if zone.contains_point(lat, lng)}
+                found = {zone.pk for zone in index.lookup(lng, lat)}
+                self.assertEqual(found, expected, (lat, lng))
+    
+    def _ping(self, lat, lng):
+        return GPSLocation.objects.create(
+            user=self.user,
+            latitude=Decimal(str(lat)),
+            longitude=Decimal(str(lng)),
+            accuracy_meters=5.0,
+            device_timestamp=timezone.now()
+        )
+    
+    def test_service_enters_and_exits_candidate_zones(self):
+        """Entries come from the index, exits only from entered zones"""
+        service = GeofenceService()
+        get_geofence_index().invalidate()
+        cache.clear()
+        
+        entered = service.check_location_geofences(self._ping(6.572, 3.322))
+        self.assertEqual(
+            sorted(event['zone_name'] for event in entered),
+            ['Airport', 'Hotel', 'Region']
+        )
+        
+        exited = service.check_location_geofences(self._ping(6.56, 3.31))
+        
+        self.assertEqual([event['zone_name'] for event in exited], ['Hotel'])
+    
+    def test_zone_changes_invalidate_index(self):
+        """Saving a zone makes the shared index rebuild"""
+        index = get_geofence_index()
+        index.invalidate()
+        self.assertEqual(index.zones_containing({'latitude': 7.5, 'longitude': 7.5}), [])
+        
+        harbour = _square_zone('Harbour', 7.0, 7.0, 1.0)
+        
+        self.assertEqual(index.zones_containing({'latitude': 7.5, 'longitude': 7.5}), [harbour])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GeofenceMembershipTestCase(TestCase):
+    """Test geofence entry/exit detection from the membership store"""
+    
+    def setUp(self):
+        cache.clear()
+        get_geofence_index().invalidate()
+        self.airport = _square_zone('Airport', 3.30, 6.55, 0.04)
+        self.hotel = _square_zone('Hotel', 3.32, 6.57, 0.005)
+        self.user = User.objects.create_user(
+            email='membership@example.com',
+            password='testpass123',
+            phone_number='+2348000000005'
+        )
+        self.service = GeofenceService()
+    
+    def _ping(self, lat, lng):
+        return GPSLocation.objects.create(
+            user=self.user,
+            latitude=Decimal(str(lat)),
+            longitude=Decimal(str(lng)),
+            accuracy_meters=5.0,
+            device_timestamp=timezone.now()
+        )
+    
+    def test_transitions_are_diffed_without_history_queries(self):
+        """Only membership changes write events, in one bulk insert"""
+        self.service.check_location_geofences(self._ping(6.572, 3.322))
+        self.assertEqual(
+            set(get_membership_store().get(self.user.pk)),
+            {self.airport.pk, self.hotel.pk}
+        )
+        
+        # Same zones: no transitions and no queries at all
+        location = self._ping(6.573, 3.323)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.service.check_location_geofences(location), [])
+        
+        location = self._ping(6.56, 3.31)
+        with self.assertNumQueries(1):
+            exited = self.service.check_location_geofences(location)
+        
+        self.assertEqual([event['event_type'] for event in exited], ['EXIT'])
+        exit_event = GeofenceEvent.objects.get(event_type='EXIT')
+        self.assertEqual(exit_event.geofence_zone, self.hotel)
+        self.assertGreaterEqual(exit_event.duration_seconds, 0)
+        self.assertEqual(GeofenceEvent.objects.filter(event_type='ENTER').count(), 2)
+    
+    def test_entry_records_zone_actions(self):
+        """Zone actions are stored on the bulk-created entry event"""
+        self.hotel.zone_type = 'HOTEL'
+        self.hotel.save()
+        
+        self.service.check_location_geofences(self._ping(6.572, 3.322))
+        
+        event = GeofenceEvent.objects.get(geofence_zone=self.hotel)
+        self.assertEqual(event.triggered_actions, ['hotel_partnership_notification'])
+    
+    def test_store_seeds_from_recent_events(self):
+        """A cold store is seeded from the latest entry/exit of each zone"""
+        location = self._ping(6.572, 3.322)
+        for zone, event_type in [(self.airport, 'ENTER'), (self.hotel, 'ENTER'),
+                                 (self.hotel, 'EXIT')]:
+            GeofenceEvent.objects.create(
+                user=self.user, geofence_zone=zone,
+                gps_location=location, event_type=event_type
+            )
+        
+        store = GeofenceMembershipStore()
+        self.assertEqual(set(store.load(self.user.pk)), {self.airport.pk})
+    
+    @override_settings(GPS_TRACKING={'GEOFENCE_STATE_BACKEND': 'local'})
+    def test_unchanged_pings_refresh_membership_expiry(self):
+        """A user who stays inside a zone keeps their membership past the TTL"""
+        store = get_membership_store()
+        with patch('gps_tracking.geofence_membership.time.monotonic', return_value=1000.0):
+            self.service.check_location_geofences(self._ping(6.572, 3.322))
+        
+        # Pinging from the same zones well into the first hour restarts its expiry
+        with patch('gps_tracking.geofence_membership.time.monotonic', return_value=4000.0):
+            self.assertEqual(self.service.check_location_geofences(self._ping(6.573, 3.323)), [])
+        
+        with patch('gps_tracking.geofence_membership.time.monotonic', return_value=5000.0):
+            self.assertEqual(
+                set(store._get_local(self.user.pk)), {self.airport.pk, self.hotel.pk}
+            )
+    
+    @override_settings(GPS_TRACKING={'GEOFENCE_STATE_BACKEND': 'local'})
+    def test_local_backend_is_bounded(self):
+        """The per-process LRU drops the least recently used users"""
+        store = GeofenceMembershipStore()
+        store.LOCAL_MAX_USERS = 2
+        for user_id in [1, 2, 3]:
+            store.set(user_id, {'zone': float(user_id)})
+        
+        self.assertEqual(store.get(3), {'zone': 3.0})
+        self.assertIsNone(store._get_local(1))
+        self.assertIsNone(cache.get(store._key(3)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GPSIngestBatchTestCase(TestCase):
+    """Test the micro-batched GPS ingest path"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='ingest@example.com',
+            password='testpass123',
+            phone_number='+2348000000006'
+        )
+    
+    def _item(self, lat, timestamp=None):
+        return GPSIngestItem(self.user, {
+            'latitude': lat,
+            'longitude': 3.3,
+            'accuracy': 5.0,
+            'speed': 40.0,
+            'timestamp': timestamp or timezone.now().isoformat()
+        }, 'HIGH')
+    
+    def test_batch_is_bulk_inserted(self):
+        """A batch of updates is stored with a single insert"""
+        items = [self._item(6.5 + i / 100) for i in range(5)]
+        
+        with patch.object(GPSLocation.objects, 'bulk_create',
+                          wraps=GPSLocation.objects.bulk_create) as bulk_create:
+            results = ingest_batch(items)
+        
+        bulk_create.assert_called_once()
+        self.assertEqual(GPSLocation.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(results[0]['location'].speed_kmh, 40.0)
+        self.assertEqual(results[0]['geofence_events'], [])
+    
+    def test_bad_update_does_not_drop_batch(self):
+        """A failing row is reported on its own item only"""
+        results = ingest_batch([self._item(6.5), self._item(6.6, 'not-a-date'), self._item(6.7)])
+        
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(
+            sorted(float(result['location'].latitude) for result in (results[0], results[2])),
+            [6.5, 6.7]
+        )
+        self.assertEqual(GPSLocation.objects.filter(user=self.user).count(), 2)
+    
+    def test_batcher_acks_each_update_from_one_flush(self):
+        """Concurrent submits share a batch but get their own results"""
+        batcher = GPSIngestBatcher(window_ms=10, max_batch_size=100)
+        
+        def fake_ingest(items):
+            return [
+                ValueError('rejected') if item.location_data['latitude'] is None
+                else {'location': item.location_data['latitude'], 'geofence_events': []}
+                for item in items
+            ]
+        
+        async def submit_all():
+            return await asyncio.gather(*[
+                batcher.submit(self.user, {'latitude': lat}, 'HIGH')
+                for lat in [6.5, None, 6.7]
+            ], return_exceptions=True)
+        
+        with patch('gps_tracking.ingest.ingest_batch', side_effect=fake_ingest):
+            results = asyncio.run(submit_all())
+        
+        self.assertEqual(results[0]['location'], 6.5)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2]['location'], 6.7)
+        self.assertEqual(batcher.get_stats()['batches'], 1)
+        self.assertEqual(batcher.get_stats()['failed_updates'], 1)
+        # Finished flush tasks are released once their results are delivered
+        self.assertEqual(batcher._flush_tasks, set())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LastLocationStoreTestCase(TestCase):
+    """Test the last known location store fed by the ingest path"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='lastknown@example.com',
+            password='testpass123',
+            phone_number='+2348000000007'
+        )
+    
+    def _item(self, lat, user=None):
+        return GPSIngestItem(user or self.user, {
+            'latitude': lat,
+            'longitude': 3.3,
+            'accuracy': 5.0,
+            'speed': 35.0,
+            'bearing': 90.0,
+            'timestamp': timezone.now().isoformat()
+        }, 'HIGH')
+    
+    def test_ingest_stores_newest_location(self):
+        """The newest location of a batch is readable without queries"""
+        ingest_batch([self._item(6.5), self._item(6.6)])
+        
+        with self.assertNumQueries(0):
+            entry = get_location_store().get(self.user.pk)
+        
+        self.assertEqual(LastLocationStore.coordinates(entry), (6.6, 3.3))
+        self.assertEqual(entry['speed_kmh'], 35.0)
+        self.assertEqual(entry['bearing'], 90.0)
+    
+    def test_vip_entries_stay_encrypted(self):
+        """VIP coordinates are only readable with the user's key"""
+        self.user.tier = 'VIP'
+        ingest_batch([self._item(6.5)])
+        
+        entry = get_location_store().get(self.user.pk)
+        self.assertNotIn('lat', entry)
+        self.assertEqual(LastLocationStore.coordinates(entry), (None, None))
+        self.assertEqual(LastLocationStore.coordinates(entry, self.user), (6.5, 3.3))
+    
+    @override_settings(GPS_TRACKING={'LAST_LOCATION_BACKEND': 'local'})
+    def test_local_backend(self):
+        """The in-process map serves the same entries"""
+        store = LastLocationStore()
+        store.set_many({1: {'lat': 1.0, 'lng': 2.0, 'timestamp': 0}})
+        
+        self.assertEqual(store.get_many([1, 2]), {1: {'lat': 1.0, 'lng': 2.0, 'timestamp': 0}})
+        self.assertIsNone(cache.get(store._key(1)))
+    
+    def test_speed_validation_uses_last_known_location(self):
+        """A jump faster than a car can drive since the last ping is rejected"""
+        previous = {'lat': 6.5, 'lng': 3.3, 'timestamp': time.time() - 60}
+        service = GPSValidationService()
+        
+        self.assertEqual(asyncio.run(service.validate_location(
+            6.6, 3.3, 5.0, user=self.user, previous_location=previous
+        )), (False, 'HIGH'))
+        self.assertEqual(asyncio.run(service.validate_location(
+            6.505, 3.3, 5.0, user=self.user, previous_location=previous
+        )), (True, 'HIGH'))
+
+
+class RecordingChannelLayer:
+    """Channel layer stand-in that records group sends"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+@override_settings(GPS_TRACKING={
+    'CONTROL_CENTER_BROADCAST_WINDOW_MS': 20, 'RIDE_BROADCAST_WINDOW_MS': 20
+})
+class LocationFanoutTestCase(TestCase):
+    """Test coalesced location broadcasts"""
+    
+    def _run(self, publish):
+        fanout = LocationFanout()
+        channel_layer = RecordingChannelLayer()
+        
+        async def run():
+            publish(fanout)
+            await asyncio.sleep(0.1)
+        
+        with patch('gps_tracking.broadcast.get_channel_layer', return_value=channel_layer):
+            asyncio.run(run())
+        return fanout, channel_layer.sent
+    
+    def test_control_center_gets_one_latest_wins_frame(self):
+        """Several pings per VIP within a window become one batched frame"""
+        def publish(fanout):
+            for i in range(3):
+                fanout.publish_vip('vip-1', f'loc-{i}', timestamp=1000.0 + i)
+            fanout.publish_vip('vip-2', 'loc-x', timestamp=1000.5)
+        
+        fanout, sent = self._run(publish)
+        
+        self.assertEqual(len(sent), 1)
+        group, message = sent[0]
+        self.assertEqual(group, 'control_center_vip')
+        self.assertEqual(message['type'], 'vip_location_batch')
+        self.assertEqual(
+            {update['user_id']: update['location_id'] for update in decode_batch(message)},
+            {'vip-1': 'loc-2', 'vip-2': 'loc-x'}
+        )
+        self.assertEqual(fanout.get_stats()['coalesced'], 2)
+        self.assertEqual(fanout._send_tasks, set())
+    
+    def test_ride_groups_keep_per_user_messages(self):
+        """Ride participants still get ride_location_update, once per user"""
+        def publish(fanout):
+            fanout.publish_ride('42', 'driver', 'loc-1')
+            fanout.publish_ride('42', 'driver', 'loc-2')
+            fanout.publish_ride('42', 'rider', 'loc-3')
+        
+        _, sent = self._run(publish)
+        
+        self.assertEqual(
+            sorted((group, message['type'], message['location_id']) for group, message in sent),
+            [('ride_42', 'ride_location_update', 'loc-2'),
+             ('ride_42', 'ride_location_update', 'loc-3')]
+        )
+    
+    def test_batch_frame_round_trip(self):
+        """Frames carry one base timestamp and millisecond deltas"""
+        frame = encode_batch({'a': ('l1', 1700000000.0), 'b': ('l2', 1700000000.25)})
+        
+        self.assertEqual(frame['updates'], [['a', 'l1', 0], ['b', 'l2', 250]])
+        self.assertEqual(
+            [update['timestamp'] for update in decode_batch(frame)],
+            ['2023-11-14T22:13:20+00:00', '2023-11-14T22:13:20.250000+00:00']
+        )
+    
+    def test_control_center_formats(self):
+        """Clients get expanded JSON by default or the compact rows on request"""
+        consumer = ControlCenterConsumer()
+        sent = []
+        
+        async def send(text_data=None, bytes_data=None):
+            sent.append(text_data)
+        
+        consumer.send = send
+        event = {'type': 'vip_location_batch', **encode_batch({'a': ('l1', 1700000000.0)})}
+        
+        consumer.broadcast_format = 'json'
+        asyncio.run(consumer.vip_location_batch(event))
+        consumer.broadcast_format = 'compact'
+        asyncio.run(consumer.vip_location_batch(event))
+        
+        self.assertEqual(json.loads(sent[0])['updates'][0]['location_id'], 'l1')
+        self.assertTrue(json.loads(sent[0])['updates'][0]['encrypted'])
+        self.assertEqual(
+            sent[1], '{"type":"vip_location_batch","base_ts":1700000000000,"updates":[["a","l1",0]]}'
+        )
+
+
+class OfflineBufferSyncTestCase(TestCase):
+    """Test the bulk offline buffer sync pipeline"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='offline@example.com',
+            password='testpass123',
+            phone_number='+2348000000008'
+        )
+        self.start = timezone.now() - timezone.timedelta(minutes=30)
+    
+    def _points(self, count, spike_at=None):
+        points = []
+        for i in range(count):
+            # ~36 km/h northwards, one fix every 10 seconds
+            points.append({
+                'latitude': 6.5 + i * 0.0009 + (1.0 if i == spike_at else 0),
+                'longitude': 3.3,
+                'accuracy': 8.0,
+                'timestamp': (self.start + timezone.timedelta(seconds=10 * i)).isoformat()
+            })
+        return points
+    
+    def test_buffer_is_validated_as_one_trajectory(self):
+        """Bad fixes are rejected by device time without rejecting their neighbours"""
+        raw = self._points(20, spike_at=7)
+        raw[3]['accuracy'] = 0.5
+        raw[11]['latitude'] = 95
+        raw[15]['accuracy'] = 60
+        raw.reverse()  # Upload order does not matter
+        points, errors = offline_sync.parse_points(raw)
+        self.assertEqual(errors, [])
+        
+        results = offline_sync.validate_points(points)
+        rejected = {
+            19 - points[i]['index']: reason
+            for i, (ok, _, reason) in enumerate(results) if not ok
+        }
+        self.assertEqual(rejected, {
+            3: 'Mock location suspected',
+            7: 'Unreasonable speed',
+            11: 'Invalid coordinates'
+        })
+        self.assertEqual(results[15][1], 'LOW')
+    
+    def test_buffer_is_inserted_in_chunks_with_progress(self):
+        """Valid points are bulk inserted chunk by chunk and progress is reported"""
+        buffered = self._points(12, spike_at=5)
+        buffered.append({'latitude': None, 'longitude': 3.3, 'timestamp': 'x'})
+        offline_buffer = OfflineGPSBuffer.objects.create(
+            user=self.user, device_id='device-1', buffered_locations=buffered,
+            start_timestamp=self.start, end_timestamp=timezone.now(),
+            total_locations=len(buffered), app_version='1.0.0'
+        )
+        progress = []
+        
+        with patch.object(offline_sync, 'BULK_CHUNK_SIZE', 5), \
+                patch.object(GPSLocation.objects, 'bulk_create',
+                             wraps=GPSLocation.objects.bulk_create) as bulk_create:
+            created, errors = offline_buffer.process_buffered_locations(
+                progress_callback=lambda processed, total: progress.append((processed, total))
+            )
+        
+        self.assertEqual(len(created), 11)
+        self.assertEqual([error['index'] for error in errors], [5, 12])
+        self.assertEqual(bulk_create.call_count, 3)
+        self.assertEqual(progress[-1], (13, 13))
+        self.assertEqual(
+            GPSLocation.objects.filter(user=self.user, is_offline_buffered=True).count(), 11
+        )
+        self.assertFalse(offline_buffer.is_synced)
+
+
+class TrajectoryValidatorTestCase(TestCase):
+    """Test streaming trajectory validation on device timestamps"""
+    
+    def _fix(self, t, lat, lng=3.3, accuracy=5.0):
+        return {'lat': lat, 'lng': lng, 'accuracy': accuracy, 'device_timestamp': 1700000000.0 + t}
+    
+    def _reasons(self, fixes, state=None, is_vip=False):
+        return [reason for _, _, reason in TrajectoryValidator(is_vip).score(fixes, state)]
+    
+    def test_state_carries_across_batches(self):
+        """A later batch is measured from the last accepted fix of the earlier one"""
+        state = TrajectoryState()
+        self.assertEqual(self._reasons([self._fix(0, 6.5), self._fix(10, 6.5009)], state), ['', ''])
+        
+        self.assertEqual(
+            self._reasons([self._fix(5, 6.5), self._fix(20, 6.6), self._fix(30, 6.5018)], state),
+            ['Out-of-order fix', 'Unreasonable speed', '']
+        )
+    
+    def test_acceleration_outlier(self):
+        """Going from 36 km/h to 180 km/h within a second is rejected"""
+        fixes = [self._fix(0, 6.5), self._fix(10, 6.5009), self._fix(11, 6.50135)]
+        self.assertEqual(self._reasons(fixes), ['', '', 'Unreasonable acceleration'])
+    
+    def test_repeated_coordinates(self):
+        """Jumping back to the same exact position over and over looks mocked"""
+        fixes = [self._fix(t * 10, 6.5 + (t % 2) * 0.0001) for t in range(22)]
+        reasons = self._reasons(fixes)
+        self.assertEqual(reasons[:20], [''] * 20)
+        self.assertEqual(reasons[20], 'Repeated coordinates')
+    
+    def test_parked_device_is_not_repeated(self):
+        """A device waiting at pickup keeps reporting its position without rejections"""
+        fixes = [self._fix(t * 5, 6.5) for t in range(40)]
+        self.assertEqual(self._reasons(fixes), [''] * 40)
+    
+    def test_real_relocation_reanchors(self):
+        """Consistent fixes far from the anchor are accepted after a few rejections"""
+        fixes = [self._fix(0, 6.5)] + [self._fix(t, 7.5 + t * 0.0001) for t in range(10, 60, 10)]
+        self.assertEqual(
+            self._reasons(fixes),
+            ['', 'Unreasonable speed', 'Unreasonable speed', '', '', '']
+        )
+    
+    def test_seeded_anchor_tolerates_clock_skew(self):
+        """A server-timed anchor is not compared against fixes moments later"""
+        state = TrajectoryState.from_fix(6.5, 3.3, 1700000005.0)
+        self.assertEqual(self._reasons([self._fix(0, 6.501)], state), [''])
+        self.assertEqual(self._reasons([self._fix(10, 6.6)], state), ['Unreasonable speed'])
+
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TrajectoryCompactionTestCase(TestCase):
+    """Test compaction of finished rides into compressed trajectories"""
+    
+    def setUp(self):
+        from rides.models import Ride, RideStatus
+        
+        get_key_cache().clear()
+        self.user = User.objects.create_user(
+            email='compact@example.com',
+            password='testpass123',
+            phone_number='+2348000000009'
+        )
+        self.ride = Ride.objects.create(
+            rider=self.user,
+            status=RideStatus.COMPLETED,
+            pickup_latitude=Decimal('6.5'),
+            pickup_longitude=Decimal('3.3'),
+            pickup_address='Pickup',
+            destination_latitude=Decimal('6.51'),
+            destination_longitude=Decimal('3.31'),
+            destination_address='Destination',
+            platform_commission_rate=Decimal('20.00')
+        )
+        Ride.objects.filter(id=self.ride.id).update(
+            updated_at=timezone.now() - timezone.timedelta(hours=1)
+        )
+        # North for 30 pings, then east for 30 pings, one ping every 2 seconds
+        self.path = [(6.5 + i * 0.0001, 3.3, 1700000000 + i * 2) for i in range(30)]
+        self.path += [(6.5029, 3.3 + i * 0.0001, 1700000060 + i * 2) for i in range(1, 31)]
+    
+    def _record_path(self):
+        for lat, lng, timestamp in self.path:
+            GPSLocation.objects.create_encrypted_location(
+                user=self.user,
+                latitude=lat,
+                longitude=lng,
+                accuracy_meters=5,
+                device_timestamp=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc),
+                ride=self.ride
+            )
+    
+    def test_simplify_and_encode_path(self):
+        """Collinear pings collapse to the corners and the encoding round-trips"""
+        simplified = simplify_path(self.path, tolerance_meters=5)
+        self.assertEqual([point[2] for point in simplified], [1700000000, 1700000058, 1700000120])
+        
+        decoded = decode_path(encode_path(self.path))
+        self.assertEqual(len(decoded), len(self.path))
+        for (lat, lng, timestamp), expected in zip(decoded, self.path):
+            self.assertAlmostEqual(lat, expected[0], places=5)
+            self.assertAlmostEqual(lng, expected[1], places=5)
+            self.assertEqual(timestamp, expected[2])
+    
+    def test_compaction_prunes_raw_rows(self):
+        """Finished rides are stored as one trajectory and replayed from it"""
+        self._record_path()
+        
+        stats = compact_finished_rides()
+        
+        self.assertEqual(stats['rides'], 1)
+        self.assertEqual(stats['raw_points'], 60)
+        self.assertFalse(GPSLocation.objects.filter(ride=self.ride).exists())
+        trajectory = RideTrajectory.objects.get(ride=self.ride, user=self.user)
+        self.assertEqual(trajectory.point_count, 3)
+        
+        replay = ride_replay(self.ride)[str(self.user.id)]
+        self.assertEqual([point['latitude'] for point in replay], [6.5, 6.5029, 6.5029])
+        # 29 + 30 steps of ~11.1m and ~11.05m
+        self.assertAlmostEqual(ride_distance_km(self.ride), 0.654, places=2)
+        self.assertEqual(compact_finished_rides()['rides'], 0)
+    
+    def test_late_points_merge_into_trajectory(self):
+        """Rows uploaded after compaction extend the existing trajectory"""
+        late_points = self.path[40:]
+        self.path = self.path[:40]
+        self._record_path()
+        compact_finished_rides()
+        
+        self.path = late_points
+        self._record_path()
+        compact_finished_rides()
+        
+        trajectory = RideTrajectory.objects.get(ride=self.ride, user=self.user)
+        self.assertEqual(trajectory.raw_point_count, 60)
+        self.assertEqual(trajectory.ended_at.timestamp(), 1700000120)
+        self.assertAlmostEqual(trajectory.distance_km, 0.654, places=2)
+
+    def test_late_merge_only_exposes_new_points(self):
+        """A merge run hands only the late rows on for speed learning"""
+        late_points = self.path[40:]
+        self.path = self.path[:40]
+        self._record_path()
+        compact_finished_rides()
+
+        self.path = late_points
+        self._record_path()
+        trajectory, = compact_ride(self.ride)
+
+        self.assertEqual(trajectory.compacted_points[0][2], late_points[0][2])
+        self.assertEqual(trajectory.compacted_points[-1][2], late_points[-1][2])
+        self.assertEqual(trajectory.get_points()[0][2], 1700000000)
+    
+    def test_vip_trajectory_stays_encrypted(self):
+        """A VIP ride's compacted path is only readable with the user's key"""
+        self.user.tier = 'VIP'
+        self._record_path()
+        
+        compact_finished_rides()
+        
+        trajectory = RideTrajectory.objects.get(ride=self.ride, user=self.user)
+        self.assertTrue(trajectory.is_encrypted)
+        points = trajectory.get_points()
+        self.assertEqual(points[-1][:2], (6.5029, 3.303))
+        self.assertNotIn(encode_path(points), trajectory.encoded_path)
+
+    def test_undecryptable_rows_are_kept(self):
+        """VIP rows that fail to decrypt stay in place instead of being deleted"""
+        self.user.tier = 'VIP'
+        self._record_path()
+        corrupted = GPSLocation.objects.filter(ride=self.ride).order_by('device_timestamp').first()
+        GPSLocation.objects.filter(id=corrupted.id).update(encrypted_coordinates='corrupted')
+
+        stats = compact_finished_rides()
+
+        self.assertEqual(stats['raw_points'], 59)
+        self.assertEqual(
+            list(GPSLocation.objects.filter(ride=self.ride).values_list('id', flat=True)),
+            [corrupted.id]
+        )
+        self.assertEqual(RideTrajectory.objects.get(ride=self.ride).raw_point_count, 59)
+
+    def test_unfinished_rides_are_not_compacted(self):
+        """Rides in progress keep their raw rows"""
+        from rides.models import RideStatus
+        
+        self.ride.status = RideStatus.IN_PROGRESS
+        self.ride.save()
+        self._record_path()
+        
+        self.assertEqual(compact_finished_rides()['rides'], 0)
+        self.assertEqual(GPSLocation.objects.filter(ride=self.ride).count(), 60)
+        self.assertEqual(len(ride_replay(self.ride)[str(self.user.id)]), 60)
+
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GPSRetentionTestCase(TestCase):
+    """Test GPS location retention without partitioned storage"""
+    
+    def setUp(self):
+        get_key_cache().clear()
+        self.user = User.objects.create_user(
+            email='retention@example.com',
+            password='testpass123',
+            phone_number='+2348000000010'
+        )
+    
+    def _location(self, days_old, vip=False):
+        self.user.tier = 'VIP' if vip else 'NORMAL'
+        location = GPSLocation.objects.create_encrypted_location(
+            user=self.user,
+            latitude=6.5,
+            longitude=3.3,
+            accuracy_meters=5,
+            device_timestamp=timezone.now()
+        )
+        GPSLocation.objects.filter(id=location.id).update(
+            server_timestamp=timezone.now() - timezone.timedelta(days=days_old)
+        )
+        return location
+    
+    def test_plain_locations_expire_first(self):
+        """Old plain rows are deleted while encrypted rows are kept by default"""
+        from .tasks import cleanup_old_gps_data
+        
+        expired = self._location(31)
+        recent = self._location(1)
+        vip = self._location(31, vip=True)
+        
+        cleanup_old_gps_data()
+        
+        remaining = set(GPSLocation.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {recent.id, vip.id})
+        self.assertNotIn(expired.id, remaining)
+        
+        with self.settings(GPS_TRACKING={'VIP_LOCATION_RETENTION_DAYS': 30}):
+            cleanup_old_gps_data()
+        self.assertEqual(set(GPSLocation.objects.values_list('id', flat=True)), {recent.id})
+
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ETAEngineTestCase(TestCase):
+    """Test smoothed, segment-speed based ETAs"""
+    
+    def setUp(self):
+        from rides.models import Ride
+        
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='eta@example.com',
+            password='testpass123',
+            phone_number='+2348000000011'
+        )
+        self.ride = Ride.objects.create(
+            rider=self.user,
+            pickup_latitude=Decimal('6.5'),
+            pickup_longitude=Decimal('3.3'),
+            pickup_address='Pickup',
+            destination_latitude=Decimal('6.52'),
+            destination_longitude=Decimal('3.3'),
+            destination_address='Destination',
+            platform_commission_rate=Decimal('20.00')
+        )
+        # Straight north for ~2.2km
+        self.route = RouteOptimization.objects.create(
+            ride=self.ride,
+            pickup_latitude=Decimal('6.5'),
+            pickup_longitude=Decimal('3.3'),
+            dropoff_latitude=Decimal('6.52'),
+            dropoff_longitude=Decimal('3.3'),
+            route_polyline=encode_polyline([(6.5, 3.3), (6.51, 3.3), (6.52, 3.3)]),
+            distance_meters=2226,
+            duration_seconds=267,
+            original_eta=timezone.now(),
+            current_eta=timezone.now(),
+            traffic_level='MODERATE'
+        )
+        self.engine = ETAEngine(speed_table=SegmentSpeedTable())
+    
+    def _ping(self, lat, speed_kmh, seconds_ago=0):
+        location = GPSLocation(
+            user=self.user, latitude=Decimal(str(lat)), longitude=Decimal('3.3'),
+            accuracy_meters=5, speed_kmh=speed_kmh, device_timestamp=timezone.now()
+        )
+        location.server_timestamp = timezone.now() - timezone.timedelta(seconds=seconds_ago)
+        return location
+    
+    def test_speed_is_smoothed(self):
+        """A one-second speed spike barely moves the smoothed speed"""
+        state = self.engine.observe(None, 6.5, 3.3, 1000.0, 30)
+        state = self.engine.observe(state, 6.5001, 3.3, 1001.0, 90)
+        self.assertLess(state['speed_kmh'], 32)
+        
+        state = self.engine.observe(state, 6.51, 3.3, 1301.0, 90)
+        self.assertGreater(state['speed_kmh'], 89)
+    
+    def test_eta_saved_only_on_meaningful_change(self):
+        """Pings that keep the ETA within the threshold cause no write"""
+        self.assertTrue(self.engine.update(self.route, self._ping(6.5, 30, seconds_ago=2)))
+        saved_eta = RouteOptimization.objects.get(id=self.route.id).current_eta
+        
+        self.assertFalse(self.engine.update(self.route, self._ping(6.5002, 30)))
+        self.assertEqual(RouteOptimization.objects.get(id=self.route.id).current_eta, saved_eta)
+        # ~2.2km at 30 km/h
+        self.assertAlmostEqual((saved_eta - timezone.now()).total_seconds(), 267, delta=15)
+        self.assertEqual(self.engine.get_state(self.ride.id)['segment'], 0)
+    
+    def test_learned_segment_speeds(self):
+        """Completed rides teach cell speeds that slow later ETAs down"""
+        start = time.time()
+        # 20 km/h north along the route, one point every 18 seconds (100m)
+        points = [(6.5 + i * 0.0009, 3.3, start + i * 18) for i in range(25)]
+        for _ in range(3):
+            learn_segment_speeds([points])
+        speed = SegmentSpeed.objects.get(cell='650:330', hour=local_hour(start + 9))
+        self.assertAlmostEqual(speed.speed_kmh, 20, delta=0.5)
+        
+        hour = local_hour(start + 9)
+        learned = self.engine.remaining_seconds(self.route, 6.5, 3.3, {}, hour=hour)
+        default = ETAEngine(speed_table=SegmentSpeedTable()).remaining_seconds(
+            self.route, 6.5, 3.3, {}, hour=(hour + 12) % 24
+        )
+        self.assertGreater(learned, default * 1.2)
+    
+    def test_off_route_uses_straight_line(self):
+        """A car far from the planned route is estimated directly to the drop-off"""
+        state = {}
+        seconds = self.engine.remaining_seconds(self.route, 6.52, 3.32, state, hour=3)
+        self.assertNotIn('segment', state)
+        # ~2.2km straight line with the city detour factor at 30 km/h
+        self.assertAlmostEqual(seconds, 2.2 * 1.3 / 30 * 3600, delta=20)
@@ -0,0 +1,191 @@
+"""
+Trajectory Validation for GPS Fixes
+Streaming per-device validation of fix sequences using device timestamps
+"""
+
+import math
+from collections import Counter, deque
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Accuracy classes and limits shared by the live and offline paths
+ACCURACY_THRESHOLDS = [('HIGH', 10), ('MEDIUM', 50), ('LOW', 100)]
+MIN_ACCURACY_METERS = 1  # Suspiciously perfect accuracy means a mocked location
+VIP_MAX_ACCURACY_METERS = 20
+MAX_REASONABLE_SPEED_KMH = 200
+MAX_ACCELERATION_MS2 = 12  # Well above what a car manages, below GPS jumps
+EARTH_RADIUS_KM = 6371.0
+
+
+def accuracy_level(accuracy: float) -> str:
+    """Classify a fix's reported accuracy in meters"""
+    for level, threshold in ACCURACY_THRESHOLDS:
+        if accuracy <= threshold:
+            return level
+    return 'UNKNOWN'
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * math.asin(math.sqrt(min(1.0, a))) * EARTH_RADIUS_KM
+
+
+def parse_device_timestamp(value) -> Optional[datetime]:
+    """Parse an ISO string, datetime or epoch (seconds or ms) device timestamp"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+    elif isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            return None
+    else:
+        return None
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+class TrajectoryState:
+    """
+    What the validator remembers about one device between batches
+
+    The last accepted fix (device time in epoch seconds and position), the
+    speed that fix implied, how many fixes in a row were rejected for
+    movement and a rolling window of recent coordinates. A state seeded
+    from a server-timed fix marks its anchor as such, because device and
+    server clocks differ by a few seconds.
+    """
+
+    WINDOW_SIZE = 30
+
+    __slots__ = ('last_time', 'last_lat', 'last_lng', 'last_speed_kmh',
+                 'movement_rejections', 'recent_coordinates', 'anchor_is_device_time')
+
+    def __init__(self):
+        self.last_time: Optional[float] = None
+        self.last_lat: Optional[float] = None
+        self.last_lng: Optional[float] = None
+        self.last_speed_kmh: Optional[float] = None
+        self.movement_rejections = 0
+        self.recent_coordinates = deque(maxlen=self.WINDOW_SIZE)
+        self.anchor_is_device_time = True
+
+    @classmethod
+    def from_fix(cls, latitude: float, longitude: float, timestamp: float) -> 'TrajectoryState':
+        """Start a trajectory from a known fix (e.g. the last known location)"""
+        state = cls()
+        state.last_time = timestamp
+        state.last_lat = float(latitude)
+        state.last_lng = float(longitude)
+        state.anchor_is_device_time = False
+        return state
+
+    def accept(self, timestamp: float, latitude: float, longitude: float,
+               speed_kmh: Optional[float]) -> None:
+        self.last_time = timestamp
+        self.last_lat = latitude
+        self.last_lng = longitude
+        self.last_speed_kmh = speed_kmh
+        self.movement_rejections = 0
+        self.anchor_is_device_time = True
+
+
+class TrajectoryValidator:
+    """
+    Scores batches of fixes against a device's trajectory in one pass
+
+    Fixes are dicts with 'lat', 'lng', 'accuracy' and a 'device_timestamp'
+    datetime, in device-time order. Each fix is checked for coordinate
+    range, accuracy (mock and VIP limits), jumps back to exact coordinates
+    already seen in the rolling window, and the speed and acceleration
+    implied by moving from the last accepted fix. A fix at the position of
+    the last accepted one is a stationary device, not a repeat. Movement checks use device timestamps, so a
+    buffer uploaded all at once is judged by when it was recorded.
+
+    A fix rejected for movement does not become the reference point, so a
+    single GPS jump does not also reject the good fix after it. After
+    REANCHOR_AFTER movement rejections in a row the trajectory restarts
+    from the current fix, so a device that really moved (e.g. was off for
+    a ferry crossing) is not rejected forever.
+    """
+
+    REPEAT_LIMIT = 10  # Returns to the same exact coordinates more often than this in the window
+    REANCHOR_AFTER = 3
+    MIN_ACCELERATION_INTERVAL_SECONDS = 1.0  # Shorter gaps are dominated by GPS noise
+    SEEDED_MIN_INTERVAL_SECONDS = 30  # Server-timed anchors are too coarse for short gaps
+
+    def __init__(self, is_vip: bool = False):
+        self.is_vip = is_vip
+
+    def score(self, fixes: List[Dict], state: TrajectoryState = None) -> List[Tuple[bool, str, str]]:
+        """Return (is_valid, accuracy_level, reason) per fix, updating state"""
+        state = state if state is not None else TrajectoryState()
+        return [self._score_fix(fix, state) for fix in fixes]
+
+    def _score_fix(self, fix: Dict, state: TrajectoryState) -> Tuple[bool, str, str]:
+        lat, lng, accuracy = fix['lat'], fix['lng'], fix['accuracy']
+        level = accuracy_level(accuracy)
+
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return False, 'UNKNOWN', 'Invalid coordinates'
+        if accuracy < MIN_ACCURACY_METERS:
+            return False, level, 'Mock location suspected'
+        if self.is_vip and accuracy > VIP_MAX_ACCURACY_METERS:
+            return False, level, 'Accuracy too low for VIP tracking'
+
+        # A parked device repeats the fix it is already at; only returns to
+        # an exact earlier position from somewhere else count as repeats
+        coordinate_key = (round(lat, 7), round(lng, 7))
+        stationary = (state.last_lat is not None and
+                      coordinate_key == (round(state.last_lat, 7), round(state.last_lng, 7)))
+        if not stationary:
+            repeats = Counter(state.recent_coordinates)[coordinate_key]
+            state.recent_coordinates.append(coordinate_key)
+            if repeats >= self.REPEAT_LIMIT:
+                return False, level, 'Repeated coordinates'
+
+        timestamp = self._epoch(fix['device_timestamp'])
+        if state.last_time is None:
+            state.accept(timestamp, lat, lng, None)
+            return True, level, ''
+
+        elapsed = timestamp - state.last_time
+        if not state.anchor_is_device_time and elapsed < self.SEEDED_MIN_INTERVAL_SECONDS:
+            state.accept(timestamp, lat, lng, None)
+            return True, level, ''
+        if elapsed < 0:
+            return False, level, 'Out-of-order fix'
+        if elapsed == 0:
+            return True, level, ''  # Duplicate timestamp, nothing to measure
+
+        speed_kmh = haversine_km(state.last_lat, state.last_lng, lat, lng) / (elapsed / 3600)
+        reason = ''
+        if speed_kmh > MAX_REASONABLE_SPEED_KMH:
+            reason = 'Unreasonable speed'
+        elif (state.last_speed_kmh is not None and
+              elapsed >= self.MIN_ACCELERATION_INTERVAL_SECONDS and
+              abs(speed_kmh - state.last_speed_kmh) / 3.6 / elapsed > MAX_ACCELERATION_MS2):
+            reason = 'Unreasonable acceleration'
+
+        if reason:
+            state.movement_rejections += 1
+            if state.movement_rejections < self.REANCHOR_AFTER:
+                return False, level, reason
+            speed_kmh = None  # Restart the trajectory from this fix
+
+        state.accept(timestamp, lat, lng, speed_kmh)
+        return True, level, ''
+
+    @staticmethod
+    def _epoch(value) -> float:
+        return value.timestamp() if isinstance(value, datetime) else float(value)
@@ -18,6 +18,11 @@ urlpatterns = [
          views.RouteOptimizationDetailView.as_view(), 
          name='route-optimization-detail'),
     
+    # Ride replay (compacted trajectories)
+    path('rides/<uuid:ride_id>/trajectory/', 
+         views.ride_trajectory, 
+         name='ride-trajectory'),
+    
     # GPS Encryption URLs (from core app)
     path('', include('core.gps_urls')),
 ]
@@ -104,3 +104,34 @@ class RouteOptimizationDetailView(generics.RetrieveUpdateDestroyAPIView):
     
     def get_queryset(self):
         return RouteOptimization.objects.filter(ride__customer=self.request.user)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def ride_trajectory(request, ride_id):
+    """Replay the tracked paths of a ride and the distance recomputed from them"""
+    from rides.models import Ride
+    from .compaction import ride_distance_km, ride_replay
+    
+    ride = Ride.objects.select_related('driver').filter(id=ride_id).first()
+    if ride is None:
+        return Response({'error': 'Ride not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    is_participant = request.user.id == ride.rider_id or (
+        ride.driver_id and ride.driver.user_id == request.user.id
+    )
+    if not (is_participant or request.user.is_staff):
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        return Response({
+            'ride_id': str(ride.id),
+            'paths': ride_replay(ride),
+            'distance_km': ride_distance_km(ride)
+        })
+    except Exception as e:
+        logger.error(f"Ride trajectory replay error: {str(e)}")
+        return Response(
+            {'error': 'Failed to load ride trajectory'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -4,20 +4,28 @@ Advanced surge pricing system with demand-based calculations, tier preferences,
 """
 
 from django.utils import timezone
-from django.db.models import Q
+from django.core.cache import cache
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import logging
 from datetime import timedelta
 
 from .models import (
-    PricingZone, TimeBasedPricing, SpecialEvent, DemandSurge, 
-    PromotionalCode, PricingRule, PriceCalculationLog
+    PricingZone, DemandSurge, PromotionalCode, PricingRule, PriceCalculationLog
 )
+from .log_writer import get_price_log_writer
+from .snapshots import get_snapshot_cache
+from .zone_index import PricingZoneIndex, get_zone_index
 from accounts.models import UserTier
 
 logger = logging.getLogger(__name__)
 
+# Marks zone arguments the caller has not resolved yet
+ZONE_NOT_RESOLVED = object()
+
+# Cache key of the surge map published by SurgeManagementService.update_surge_grid
+SURGE_GRID_CACHE_KEY = 'pricing_surge_grid'
+
 
 class PricingEngine:
     """Main pricing calculation engine for dynamic surge pricing"""
@@ -54,37 +62,183 @@ class PricingEngine:
         if not ride_time:
             ride_time = timezone.now()
         
-        self.calculation_log = {
-            'user_tier': user.tier,
-            'vehicle_type': vehicle_type,
-            'distance_km': str(distance_km),
-            'duration_minutes': estimated_duration_minutes,
-            'calculation_time': ride_time.isoformat(),
-            'factors_applied': []
-        }
+        self.calculation_log = self._new_calculation_log(
+            user, vehicle_type, distance_km, estimated_duration_minutes, ride_time
+        )
+        
+        # Resolve the pickup zone once for every step below
+        zone = self._get_pricing_zone(pickup_lat, pickup_lng)
         
         # Step 1: Get base pricing rule
-        pricing_rule = self._get_pricing_rule(pickup_lat, pickup_lng, vehicle_type)
+        pricing_rule = self._get_pricing_rule(pickup_lat, pickup_lng, vehicle_type, zone=zone)
         if not pricing_rule:
             raise ValueError(f"No pricing rule found for {vehicle_type} at location")
         
-        # Step 2: Calculate base fare
-        base_fare = self._calculate_base_fare(
-            pricing_rule, distance_km, estimated_duration_minutes
+        # Steps 3-6: Location and time factors
+        factors = self._get_location_factors(user, pickup_lat, pickup_lng, ride_time, zone)
+        
+        result, log_entry = self._price_with_rule(
+            user, pricing_rule, factors, distance_km, estimated_duration_minutes,
+            promo_code
+        )
+        
+        # Log the calculation
+        self._log_calculation(
+            user, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, distance_km, 
+            estimated_duration_minutes, vehicle_type, pricing_rule,
+            log_entry
+        )
+        
+        return result
+    
+    def calculate_batch_prices(
+        self,
+        user,
+        pickup_lat: Decimal,
+        pickup_lng: Decimal,
+        dropoff_lat: Decimal,
+        dropoff_lng: Decimal,
+        distance_km: Decimal,
+        estimated_duration_minutes: int,
+        vehicle_types: List[str],
+        promo_codes: List[str] = None,
+        ride_time: timezone.datetime = None
+    ) -> Dict:
+        """
+        Calculate prices for several vehicle types and promo codes at once
+        
+        Zone, time, surge and event factors are resolved once and shared by
+        every quote; promo codes are loaded with one query and all quotes are
+        logged with one bulk insert.
+        
+        Returns:
+        {
+            'quotes': [{'vehicle_type': str, ...calculate_ride_price result,
+                        'promo_variants': [{'promo_code': str, ...}]}],
+            'unavailable_vehicle_types': List[str],
+            'transparency_info': Dict
+        }
+        """
+        if not ride_time:
+            ride_time = timezone.now()
+        
+        promo_codes = [code for code in (promo_codes or []) if code]
+        
+        self.calculation_log = self._new_calculation_log(
+            user, None, distance_km, estimated_duration_minutes, ride_time
         )
         
-        # Step 3: Apply zone-based pricing
         zone = self._get_pricing_zone(pickup_lat, pickup_lng)
+        pricing_rules = {
+            vehicle_type: self._get_pricing_rule(pickup_lat, pickup_lng, vehicle_type, zone=zone)
+            for vehicle_type in vehicle_types
+        }
+        if not any(pricing_rules.values()):
+            raise ValueError("No pricing rule found for the requested vehicle types at location")
+        
+        factors = self._get_location_factors(user, pickup_lat, pickup_lng, ride_time, zone)
+        shared_log = self.calculation_log
+        promos = self._load_promo_codes(promo_codes)
+        
+        quotes = []
+        unavailable_vehicle_types = []
+        log_entries = []
+        
+        for vehicle_type, pricing_rule in pricing_rules.items():
+            if not pricing_rule:
+                unavailable_vehicle_types.append(vehicle_type)
+                continue
+            
+            variants = []
+            for promo_code in [None] + promo_codes:
+                self.calculation_log = self._copy_calculation_log(shared_log, vehicle_type)
+                result, log_entry = self._price_with_rule(
+                    user, pricing_rule, factors, distance_km, estimated_duration_minutes,
+                    promo_code, promo=promos.get(promo_code.upper()) if promo_code else None
+                )
+                log_entries.append(self._build_log_entry(
+                    user, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, distance_km,
+                    estimated_duration_minutes, vehicle_type, pricing_rule, log_entry
+                ))
+                variants.append(result)
+            
+            quote = {'vehicle_type': vehicle_type, **variants[0]}
+            quote['promo_variants'] = [
+                {
+                    'promo_code': promo_code,
+                    'final_price': variant['final_price'],
+                    'discount': variant['discount'],
+                    'transparency_info': variant['transparency_info']
+                }
+                for promo_code, variant in zip(promo_codes, variants[1:])
+            ]
+            quotes.append(quote)
+        
+        self._save_log_entries(log_entries)
+        self.calculation_log = shared_log
+        
+        return {
+            'quotes': quotes,
+            'unavailable_vehicle_types': unavailable_vehicle_types,
+            'transparency_info': self._generate_transparency_info(
+                zone, factors['surge_multiplier'], factors['event_multiplier'], {}
+            )
+        }
+    
+    def _new_calculation_log(
+        self, user, vehicle_type: str, distance_km: Decimal,
+        estimated_duration_minutes: int, ride_time: timezone.datetime
+    ) -> Dict:
+        """Start the calculation log for a quote"""
+        return {
+            'user_tier': user.tier,
+            'vehicle_type': vehicle_type,
+            'distance_km': str(distance_km),
+            'duration_minutes': estimated_duration_minutes,
+            'calculation_time': ride_time.isoformat(),
+            'factors_applied': []
+        }
+    
+    def _copy_calculation_log(self, shared_log: Dict, vehicle_type: str) -> Dict:
+        """Copy the shared factors into a per-quote calculation log"""
+        calculation_log = dict(shared_log, vehicle_type=vehicle_type)
+        calculation_log['factors_applied'] = list(shared_log['factors_applied'])
+        return calculation_log
+    
+    def _get_location_factors(
+        self, user, pickup_lat: Decimal, pickup_lng: Decimal,
+        ride_time: timezone.datetime, zone
+    ) -> Dict:
+        """Resolve the multipliers shared by every quote from the same place and time"""
+        # Step 3: Apply zone-based pricing
         zone_multiplier = zone.base_multiplier if zone else Decimal('1.000')
         
         # Step 4: Apply time-based pricing
         time_multiplier = self._get_time_multiplier(ride_time, user.tier)
         
         # Step 5: Apply surge pricing
-        surge_multiplier = self._get_surge_multiplier(pickup_lat, pickup_lng, ride_time)
+        surge_multiplier = self._get_surge_multiplier(pickup_lat, pickup_lng, ride_time, zone=zone)
         
         # Step 6: Apply special event pricing
-        event_multiplier = self._get_event_multiplier(pickup_lat, pickup_lng, ride_time)
+        event_multiplier = self._get_event_multiplier(pickup_lat, pickup_lng, ride_time, zone=zone)
+        
+        return {
+            'zone': zone,
+            'zone_multiplier': zone_multiplier,
+            'time_multiplier': time_multiplier,
+            'surge_multiplier': surge_multiplier,
+            'event_multiplier': event_multiplier
+        }
+    
+    def _price_with_rule(
+        self, user, pricing_rule: PricingRule, factors: Dict, distance_km: Decimal,
+        estimated_duration_minutes: int, promo_code: str = None, promo=None
+    ) -> Tuple[Dict, Dict]:
+        """Price a trip with a pricing rule and resolved location factors"""
+        # Step 2: Calculate base fare
+        base_fare = self._calculate_base_fare(
+            pricing_rule, distance_km, estimated_duration_minutes
+        )
         
         # Step 7: Apply tier-based adjustments
         tier_multiplier = self._get_tier_multiplier(user.tier, pricing_rule)
@@ -92,10 +246,10 @@ class PricingEngine:
         # Calculate price before discounts
         subtotal = (
             base_fare *
-            zone_multiplier *
-            time_multiplier *
-            surge_multiplier *
-            event_multiplier *
+            factors['zone_multiplier'] *
+            factors['time_multiplier'] *
+            factors['surge_multiplier'] *
+            factors['event_multiplier'] *
             tier_multiplier
         )
         
@@ -104,7 +258,7 @@ class PricingEngine:
         
         # Step 8: Apply promotional discounts
         promo_discount, promo_details = self._apply_promo_code(
-            promo_code, user, subtotal, surge_multiplier
+            promo_code, user, subtotal, factors['surge_multiplier'], promo=promo
         )
         
         final_price = subtotal - promo_discount
@@ -112,26 +266,17 @@ class PricingEngine:
         # Round to nearest cent
         final_price = final_price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         
-        # Log the calculation
-        self._log_calculation(
-            user, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, distance_km, 
-            estimated_duration_minutes, vehicle_type, pricing_rule,
-            zone_multiplier, time_multiplier, surge_multiplier,
-            event_multiplier, tier_multiplier, base_fare, 
-            subtotal, promo_discount, final_price, promo_code
-        )
-        
-        return {
+        result = {
             'base_price': base_fare,
             'surge_price': subtotal,
             'final_price': final_price,
             'discount': promo_discount,
             'pricing_breakdown': {
                 'base_fare': base_fare,
-                'zone_multiplier': zone_multiplier,
-                'time_multiplier': time_multiplier,
-                'surge_multiplier': surge_multiplier,
-                'event_multiplier': event_multiplier,
+                'zone_multiplier': factors['zone_multiplier'],
+                'time_multiplier': factors['time_multiplier'],
+                'surge_multiplier': factors['surge_multiplier'],
+                'event_multiplier': factors['event_multiplier'],
                 'tier_multiplier': tier_multiplier,
                 'subtotal': subtotal,
                 'promo_discount': promo_discount,
@@ -139,39 +284,43 @@ class PricingEngine:
                 'booking_fee': pricing_rule.booking_fee
             },
             'transparency_info': self._generate_transparency_info(
-                zone, surge_multiplier, event_multiplier, promo_details
+                factors['zone'], factors['surge_multiplier'],
+                factors['event_multiplier'], promo_details
             ),
             'calculation_log': self.calculation_log
         }
+        
+        log_values = {
+            'zone_multiplier': factors['zone_multiplier'],
+            'time_multiplier': factors['time_multiplier'],
+            'surge_multiplier': factors['surge_multiplier'],
+            'event_multiplier': factors['event_multiplier'],
+            'tier_multiplier': tier_multiplier,
+            'base_fare': base_fare,
+            'subtotal': subtotal,
+            'promo_discount': promo_discount,
+            'final_price': final_price,
+            'promo_code': promo_code,
+            'pricing_factors': self.calculation_log
+        }
+        
+        return result, log_values
     
-    def _get_pricing_rule(self, pickup_lat: Decimal, pickup_lng: Decimal, vehicle_type: str) -> Optional[PricingRule]:
+    def _get_pricing_rule(
+        self, pickup_lat: Decimal, pickup_lng: Decimal, vehicle_type: str, zone=ZONE_NOT_RESOLVED
+    ) -> Optional[PricingRule]:
         """Get applicable pricing rule for location and vehicle type"""
-        zone = self._get_pricing_zone(pickup_lat, pickup_lng)
+        if zone is ZONE_NOT_RESOLVED:
+            zone = self._get_pricing_zone(pickup_lat, pickup_lng)
         if not zone:
             # Fallback to default zone or raise error
             return None
         
-        rules = PricingRule.objects.filter(
-            vehicle_type=vehicle_type,
-            zone=zone,
-            is_active=True
-        ).filter(
-            effective_from__lte=timezone.now()
-        ).filter(
-            Q(effective_until__isnull=True) | Q(effective_until__gte=timezone.now())
-        ).order_by('-effective_from')
-        
-        return rules.first()
+        return get_snapshot_cache().get_pricing_rule(zone, vehicle_type)
     
     def _get_pricing_zone(self, latitude: Decimal, longitude: Decimal) -> Optional[PricingZone]:
         """Find pricing zone for given coordinates"""
-        zones = PricingZone.objects.filter(is_active=True)
-        
-        for zone in zones:
-            if zone.contains_point(latitude, longitude):
-                return zone
-        
-        return None
+        return get_zone_index().resolve(latitude, longitude)
     
     def _calculate_base_fare(
         self, 
@@ -198,9 +347,7 @@ class PricingEngine:
     
     def _get_time_multiplier(self, ride_time: timezone.datetime, user_tier: str) -> Decimal:
         """Get time-based pricing multiplier"""
-        applicable_rules = TimeBasedPricing.objects.filter(
-            is_active=True
-        ).order_by('-priority')
+        applicable_rules = get_snapshot_cache().get_time_rules()
         
         for rule in applicable_rules:
             if rule.is_applicable_now():
@@ -228,20 +375,24 @@ class PricingEngine:
         """Public method to get event multiplier"""
         return self._get_event_multiplier(pickup_lat, pickup_lng, ride_time)
     
-    def _get_surge_multiplier(self, pickup_lat: Decimal, pickup_lng: Decimal, ride_time: timezone.datetime) -> Decimal:
+    def _get_surge_multiplier(
+        self, pickup_lat: Decimal, pickup_lng: Decimal, ride_time: timezone.datetime, zone=ZONE_NOT_RESOLVED
+    ) -> Decimal:
         """Calculate real-time surge multiplier based on demand"""
-        zone = self._get_pricing_zone(pickup_lat, pickup_lng)
+        if zone is ZONE_NOT_RESOLVED:
+            zone = self._get_pricing_zone(pickup_lat, pickup_lng)
         if not zone:
             return Decimal('1.000')
         
+        # Precomputed surge grid from the periodic surge task
+        grid_multiplier = self._get_grid_surge_multiplier(zone, ride_time)
+        if grid_multiplier is not None:
+            return grid_multiplier
+        
         # Get current surge data
-        current_surge = DemandSurge.objects.filter(
-            zone=zone,
-            is_active=True,
-            expires_at__gt=ride_time
-        ).order_by('-calculated_at').first()
+        current_surge = get_snapshot_cache().get_zone_surge(zone)
         
-        if current_surge and current_surge.is_valid():
+        if current_surge and current_surge.expires_at > ride_time and current_surge.is_valid():
             multiplier = current_surge.surge_multiplier
             
             self.calculation_log['factors_applied'].append({
@@ -257,6 +408,33 @@ class PricingEngine:
         # Calculate real-time surge if no current data
         return self._calculate_real_time_surge(zone, ride_time)
     
+    def _get_grid_surge_multiplier(self, zone: PricingZone, ride_time: timezone.datetime) -> Optional[Decimal]:
+        """Read the zone's surge from the published surge grid, if it has a current entry"""
+        try:
+            surge_grid = cache.get(SURGE_GRID_CACHE_KEY)
+        except Exception as e:
+            logger.error(f"Failed to read surge grid: {e}")
+            return None
+        
+        entry = surge_grid.get(str(zone.pk)) if surge_grid else None
+        if not entry:
+            return None
+        
+        multiplier, surge_level, demand_ratio, expires_at = entry
+        if ride_time.timestamp() >= expires_at:
+            return None
+        
+        multiplier = Decimal(multiplier)
+        self.calculation_log['factors_applied'].append({
+            'type': 'surge_pricing',
+            'zone': zone.name,
+            'surge_level': surge_level,
+            'demand_ratio': demand_ratio,
+            'multiplier': str(multiplier)
+        })
+        
+        return multiplier
+    
     def _calculate_real_time_surge(self, zone: PricingZone, ride_time: timezone.datetime) -> Decimal:
         """Calculate surge based on real-time demand metrics"""
         from rides.models import Ride
@@ -322,17 +500,20 @@ class PricingEngine:
         
         return multiplier
     
-    def _get_event_multiplier(self, pickup_lat: Decimal, pickup_lng: Decimal, ride_time: timezone.datetime) -> Decimal:
+    def _get_event_multiplier(
+        self, pickup_lat: Decimal, pickup_lng: Decimal, ride_time: timezone.datetime, zone=ZONE_NOT_RESOLVED
+    ) -> Decimal:
         """Get special event pricing multiplier"""
+        if zone is ZONE_NOT_RESOLVED:
+            zone = self._get_pricing_zone(pickup_lat, pickup_lng)
+        
         # Check for events affecting the pickup location
-        active_events = SpecialEvent.objects.filter(
-            is_active=True
-        )
+        active_events = get_snapshot_cache().get_events()
         
         highest_multiplier = Decimal('1.000')
         event_info = None
         
-        for event in active_events:
+        for event, affected_zone_ids in active_events:
             if event.is_active_now():
                 # Check if event affects the pickup location (simplified)
                 if event.latitude and event.longitude:
@@ -350,8 +531,7 @@ class PricingEngine:
                             }
                 
                 # Check affected zones
-                zone = self._get_pricing_zone(pickup_lat, pickup_lng)
-                if zone and zone in event.affected_zones.all():
+                if zone and zone.pk in affected_zone_ids:
                     multiplier = event.get_current_multiplier()
                     if multiplier > highest_multiplier:
                         highest_multiplier = multiplier
@@ -373,7 +553,7 @@ class PricingEngine:
         """Get user tier-based multiplier"""
         multiplier_map = {
             UserTier.NORMAL: pricing_rule.normal_multiplier,
-            UserTier.PREMIUM: pricing_rule.premium_multiplier,
+            UserTier.VIP_PREMIUM: pricing_rule.premium_multiplier,
             UserTier.VIP: pricing_rule.vip_multiplier
         }
         
@@ -393,14 +573,16 @@ class PricingEngine:
         promo_code: str, 
         user, 
         subtotal: Decimal, 
-        surge_multiplier: Decimal
+        surge_multiplier: Decimal,
+        promo: PromotionalCode = None
     ) -> Tuple[Decimal, Dict]:
-        """Apply promotional code discount"""
+        """Apply promotional code discount, using `promo` if already loaded"""
         if not promo_code:
             return Decimal('0.00'), {}
         
         try:
-            promo = PromotionalCode.objects.get(code=promo_code.upper())
+            if promo is None:
+                promo = PromotionalCode.objects.get(code=promo_code.upper())
             
             # Check if user can use this code
             can_use, reason = promo.can_user_use(user)
@@ -448,6 +630,18 @@ class PricingEngine:
             logger.error(f"Error applying promo code {promo_code}: {e}")
             return Decimal('0.00'), {'error': 'Unable to apply promo code'}
     
+    def _load_promo_codes(self, promo_codes: List[str]) -> Dict[str, PromotionalCode]:
+        """Load promotional codes by upper-cased code with a single query"""
+        if not promo_codes:
+            return {}
+        
+        return {
+            promo.code: promo
+            for promo in PromotionalCode.objects.filter(
+                code__in=[code.upper() for code in promo_codes]
+            )
+        }
+    
     def _generate_transparency_info(
         self, 
         zone: PricingZone, 
@@ -511,44 +705,57 @@ class PricingEngine:
     
     def _log_calculation(
         self, user, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, distance_km, 
-        estimated_duration_minutes, vehicle_type, pricing_rule,
-        zone_multiplier, time_multiplier, surge_multiplier,
-        event_multiplier, tier_multiplier, base_fare, 
-        subtotal, promo_discount, final_price, promo_code
+        estimated_duration_minutes, vehicle_type, pricing_rule, log_values
     ):
         """Log detailed price calculation for auditing"""
+        self._save_log_entries([self._build_log_entry(
+            user, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, distance_km,
+            estimated_duration_minutes, vehicle_type, pricing_rule, log_values
+        )])
+    
+    def _build_log_entry(
+        self, user, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, distance_km, 
+        estimated_duration_minutes, vehicle_type, pricing_rule, log_values
+    ) -> PriceCalculationLog:
+        """Build an unsaved price calculation log entry"""
+        return PriceCalculationLog(
+            user=user,
+            pickup_latitude=pickup_lat,
+            pickup_longitude=pickup_lng,
+            dropoff_latitude=dropoff_lat,
+            dropoff_longitude=dropoff_lng,
+            distance_km=distance_km,
+            estimated_duration_minutes=estimated_duration_minutes,
+            vehicle_type=vehicle_type,
+            base_fare=log_values['base_fare'],
+            distance_fare=pricing_rule.per_km_rate * distance_km,
+            time_fare=pricing_rule.per_minute_rate * Decimal(str(estimated_duration_minutes)),
+            subtotal=log_values['base_fare'],
+            zone_multiplier=log_values['zone_multiplier'],
+            time_multiplier=log_values['time_multiplier'],
+            surge_multiplier=log_values['surge_multiplier'],
+            event_multiplier=log_values['event_multiplier'],
+            tier_multiplier=log_values['tier_multiplier'],
+            total_before_discount=log_values['subtotal'],
+            promo_discount=log_values['promo_discount'],
+            final_price=log_values['final_price'],
+            applied_promo_code=log_values['promo_code'] or '',
+            pricing_factors=log_values['pricing_factors']
+        )
+    
+    def _save_log_entries(self, log_entries):
+        """Hand log entries to the buffered writer, which bulk inserts them"""
         try:
-            PriceCalculationLog.objects.create(
-                user=user,
-                pickup_latitude=pickup_lat,
-                pickup_longitude=pickup_lng,
-                dropoff_latitude=dropoff_lat,
-                dropoff_longitude=dropoff_lng,
-                distance_km=distance_km,
-                estimated_duration_minutes=estimated_duration_minutes,
-                vehicle_type=vehicle_type,
-                base_fare=base_fare,
-                distance_fare=pricing_rule.per_km_rate * distance_km,
-                time_fare=pricing_rule.per_minute_rate * Decimal(str(estimated_duration_minutes)),
-                subtotal=base_fare,
-                zone_multiplier=zone_multiplier,
-                time_multiplier=time_multiplier,
-                surge_multiplier=surge_multiplier,
-                event_multiplier=event_multiplier,
-                tier_multiplier=tier_multiplier,
-                total_before_discount=subtotal,
-                promo_discount=promo_discount,
-                final_price=final_price,
-                applied_promo_code=promo_code or '',
-                pricing_factors=self.calculation_log
-            )
+            get_price_log_writer().submit(log_entries)
         except Exception as e:
-            logger.error(f"Failed to log price calculation: {e}")
+            logger.error(f"Failed to queue price calculation logs: {e}")
 
 
 class SurgeManagementService:
     """Service for managing real-time surge pricing"""
     
+    SURGE_VALIDITY_MINUTES = 5
+    
     @staticmethod
     def update_zone_surge(zone_id: str):
         """Update surge pricing for a specific zone"""
@@ -561,12 +768,120 @@ class SurgeManagementService:
         except Exception as e:
             logger.error(f"Error updating surge for zone {zone_id}: {e}")
     
+    @staticmethod
+    def update_surge_grid(now: timezone.datetime = None) -> Dict:
+        """
+        Recalculate surge for all surge-enabled zones in one grouped pass
+        
+        Recent rides and available drivers are each loaded with one query
+        and bucketed into zones in memory, DemandSurge rows are written in
+        bulk, and the resulting zone_id -> (multiplier, level, demand ratio,
+        expiry timestamp) map is published to the cache for
+        PricingEngine._get_surge_multiplier. The number of queries does not
+        depend on the number of zones.
+        
+        Returns:
+            The published surge map
+        """
+        from rides.models import Ride, RideStatus
+        from accounts.models import Driver
+        
+        if not now:
+            now = timezone.now()
+        time_window = now - timedelta(minutes=15)
+        expires_at = now + timedelta(minutes=SurgeManagementService.SURGE_VALIDITY_MINUTES)
+        
+        # Bucket points with the same zone resolution quotes use
+        zones = list(PricingZone.objects.filter(is_active=True))
+        zone_index = PricingZoneIndex()
+        zone_index.build(zones)
+        surge_zones = {zone.pk: zone for zone in zones if zone.surge_enabled}
+        counts = {
+            zone_id: {'active_rides': 0, 'pending_requests': 0, 'available_drivers': 0}
+            for zone_id in surge_zones
+        }
+        
+        active_statuses = {
+            RideStatus.DRIVER_ACCEPTED, RideStatus.DRIVER_EN_ROUTE,
+            RideStatus.DRIVER_ARRIVED, RideStatus.IN_PROGRESS
+        }
+        pending_statuses = {RideStatus.REQUESTED, RideStatus.DRIVER_SEARCH}
+        
+        recent_rides = Ride.objects.filter(
+            created_at__gte=time_window,
+            status__in=list(active_statuses | pending_statuses)
+        ).values_list('pickup_latitude', 'pickup_longitude', 'status')
+        
+        for latitude, longitude, ride_status in recent_rides:
+            zone = zone_index.lookup(latitude, longitude)
+            if zone and zone.pk in counts:
+                key = 'active_rides' if ride_status in active_statuses else 'pending_requests'
+                counts[zone.pk][key] += 1
+        
+        available_drivers = Driver.objects.filter(
+            is_online=True,
+            is_available=True,
+            current_location_lat__isnull=False,
+            current_location_lng__isnull=False
+        ).values_list('current_location_lat', 'current_location_lng')
+        
+        for latitude, longitude in available_drivers:
+            zone = zone_index.lookup(latitude, longitude)
+            if zone and zone.pk in counts:
+                counts[zone.pk]['available_drivers'] += 1
+        
+        # Latest surge row per zone, updated in place like update_or_create
+        existing = {}
+        for surge in DemandSurge.objects.filter(zone_id__in=list(surge_zones)).order_by('-calculated_at'):
+            existing.setdefault(surge.zone_id, surge)
+        
+        to_update, to_create, surge_grid = [], [], {}
+        for zone_id, zone in surge_zones.items():
+            zone_counts = counts[zone_id]
+            total_demand = zone_counts['active_rides'] + zone_counts['pending_requests']
+            supply = max(zone_counts['available_drivers'], 1)  # Avoid division by zero
+            
+            surge = existing.get(zone_id) or DemandSurge(zone=zone)
+            surge.zone = zone
+            surge.active_rides = zone_counts['active_rides']
+            surge.pending_requests = zone_counts['pending_requests']
+            surge.available_drivers = zone_counts['available_drivers']
+            surge.demand_ratio = Decimal(str(total_demand / supply))
+            surge.expires_at = expires_at
+            surge.is_active = True
+            surge.surge_level, surge.surge_multiplier = surge.calculate_surge_level()
+            (to_update if surge.pk else to_create).append(surge)
+            
+            surge_grid[str(zone_id)] = (
+                str(surge.surge_multiplier), surge.surge_level,
+                str(surge.demand_ratio), expires_at.timestamp()
+            )
+        
+        if to_update:
+            for surge in to_update:
+                surge.updated_at = now
+            DemandSurge.objects.bulk_update(to_update, [
+                'active_rides', 'pending_requests', 'available_drivers', 'demand_ratio',
+                'surge_level', 'surge_multiplier', 'expires_at', 'is_active', 'updated_at'
+            ])
+        if to_create:
+            DemandSurge.objects.bulk_create(to_create)
+        
+        cache.set(
+            SURGE_GRID_CACHE_KEY, surge_grid,
+            timeout=SurgeManagementService.SURGE_VALIDITY_MINUTES * 60
+        )
+        
+        # Bulk writes skip post_save, so refresh the quote-path surge snapshot here
+        get_snapshot_cache().invalidate_surges()
+        
+        logger.info(f"Surge grid published for {len(surge_grid)} zones")
+        return surge_grid
+    
     @staticmethod
     def update_all_zones_surge():
         """Update surge pricing for all active zones"""
-        active_zones = PricingZone.objects.filter(is_active=True)
-        for zone in active_zones:
-            SurgeManagementService.update_zone_surge(str(zone.id))
+        SurgeManagementService.update_surge_grid()
     
     @staticmethod
     def get_current_surge_levels() -> Dict:
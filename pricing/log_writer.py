@@ -0,0 +1,70 @@
+"""
+VIP Ride-Hailing Platform - Price Calculation Log Writer
+Buffered background writer keeping audit log inserts off the quote path
+"""
+
+import random
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+
+from core.buffered_writer import BufferedBulkWriter
+
+DEFAULT_LOG_SETTINGS = {
+    'ASYNC_ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL_MS': 500,
+    'MAX_QUEUE_SIZE': 10000,
+    'SAMPLE_RATE': 1.0,
+}
+
+
+class PriceLogWriter(BufferedBulkWriter):
+    """
+    Buffered writer of unsaved PriceCalculationLog entries
+
+    Quotes only submit entries, which the shared buffered writer flushes
+    in the background. SAMPLE_RATE keeps only a fraction of entries.
+    Settings are read from PRICING_LOG_SETTINGS on every submit so they can
+    be tuned without a restart of the writer.
+    """
+
+    settings_name = 'PRICING_LOG_SETTINGS'
+    default_settings = DEFAULT_LOG_SETTINGS
+    thread_name = 'price-log-writer'
+    label = 'Price log writer'
+    stat_names = ('submitted', 'sampled_out', 'dropped', 'written', 'failed')
+
+    def get_model(self):
+        from .models import PriceCalculationLog
+        return PriceCalculationLog
+
+    def after_write(self, entries) -> None:
+        # bulk_create skips post_save, so clear the cache its receiver would
+        cache.delete('pricing_calculations_cache')
+
+    def submit(self, entries: Iterable) -> None:
+        """Queue log entries for writing without waiting on the database"""
+        config = self.get_config()
+        entries = list(entries)
+        sample_rate = config['SAMPLE_RATE']
+        kept = [
+            entry for entry in entries
+            if sample_rate >= 1.0 or random.random() < sample_rate
+        ]
+        self._count('submitted', len(entries))
+        self._count('sampled_out', len(entries) - len(kept))
+
+        self.enqueue(kept, config)
+
+
+# Global price log writer instance
+_price_log_writer: Optional[PriceLogWriter] = None
+
+
+def get_price_log_writer() -> PriceLogWriter:
+    """Get global price log writer instance"""
+    global _price_log_writer
+    if _price_log_writer is None:
+        _price_log_writer = PriceLogWriter()
+    return _price_log_writer
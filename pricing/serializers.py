@@ -5,7 +5,7 @@ Django REST Framework serializers for pricing API
 
 from rest_framework import serializers
 from decimal import Decimal
-from .models import PricingZone, PromotionalCode
+from .models import PricingZone, PromotionalCode, PricingRule
 
 
 class PriceQuoteRequestSerializer(serializers.Serializer):
@@ -98,6 +98,49 @@ class PriceQuoteResponseSerializer(serializers.Serializer):
     calculation_log = serializers.DictField(required=False)
 
 
+class BatchPriceQuoteRequestSerializer(PriceQuoteRequestSerializer):
+    """Serializer for batch price quote request"""
+    vehicle_type = None
+    promo_code = None
+    vehicle_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=PricingRule.VEHICLE_TYPES),
+        min_length=1, max_length=len(PricingRule.VEHICLE_TYPES),
+        help_text="Vehicle types to quote"
+    )
+    promo_codes = serializers.ListField(
+        child=serializers.CharField(max_length=20),
+        required=False, max_length=5,
+        help_text="Optional promotional codes to price as variants"
+    )
+    
+    def validate_vehicle_types(self, value):
+        """Drop duplicate vehicle types, keeping request order"""
+        return list(dict.fromkeys(value))
+
+
+class PromoVariantSerializer(serializers.Serializer):
+    """Serializer for a quote priced with a promotional code"""
+    promo_code = serializers.CharField(max_length=20)
+    final_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    discount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    transparency_info = TransparencyInfoSerializer()
+
+
+class BatchQuoteSerializer(PriceQuoteResponseSerializer):
+    """Serializer for one vehicle type in a batch quote response"""
+    vehicle_type = serializers.CharField(max_length=20)
+    promo_variants = PromoVariantSerializer(many=True)
+
+
+class BatchPriceQuoteResponseSerializer(serializers.Serializer):
+    """Serializer for batch price quote response"""
+    quotes = BatchQuoteSerializer(many=True)
+    unavailable_vehicle_types = serializers.ListField(
+        child=serializers.CharField(max_length=20)
+    )
+    transparency_info = TransparencyInfoSerializer()
+
+
 class SurgeLevelSerializer(serializers.Serializer):
     """Serializer for surge level information"""
     zone_name = serializers.CharField(max_length=100)
@@ -3,13 +3,18 @@
 Pricing system signals for automated business logic
 """
 
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 from django.core.cache import cache
 from decimal import Decimal
 
-from .models import PriceCalculationLog, PromotionalCode, DemandSurge
+from .models import (
+    PriceCalculationLog, PromotionalCode, DemandSurge, PricingZone,
+    PricingRule, TimeBasedPricing, SpecialEvent
+)
+from .snapshots import get_snapshot_cache
+from .zone_index import get_zone_index
 
 
 @receiver(post_save, sender=PriceCalculationLog)
@@ -84,6 +89,33 @@ def log_surge_activity(sender, instance, created, **kwargs):
         logger.info(f"Surge pricing deactivated for {instance.zone.name}")
 
 
+@receiver(post_save, sender=PricingZone)
+@receiver(post_delete, sender=PricingZone)
+def invalidate_zone_index(sender, instance, **kwargs):
+    """Rebuild the pricing zone index after zone boundaries or status change"""
+    get_zone_index().invalidate()
+    get_snapshot_cache().invalidate_rules()
+
+
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+@receiver(post_save, sender=TimeBasedPricing)
+@receiver(post_delete, sender=TimeBasedPricing)
+@receiver(post_save, sender=SpecialEvent)
+@receiver(post_delete, sender=SpecialEvent)
+@receiver(m2m_changed, sender=SpecialEvent.affected_zones.through)
+def invalidate_pricing_rule_snapshot(sender, instance, **kwargs):
+    """Reload cached pricing rules, time rules and events after a change"""
+    get_snapshot_cache().invalidate_rules()
+
+
+@receiver(post_save, sender=DemandSurge)
+@receiver(post_delete, sender=DemandSurge)
+def invalidate_surge_snapshot(sender, instance, **kwargs):
+    """Reload cached surge records after a surge is recalculated"""
+    get_snapshot_cache().invalidate_surges()
+
+
 def update_demand_metrics():
     """
     Update demand metrics for all zones
@@ -0,0 +1,188 @@
+"""
+VIP Ride-Hailing Platform - Pricing Snapshot Cache
+Process-local tables of pricing rules, time rules, events and surges for the quote path
+"""
+
+import threading
+import time
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+class SnapshotSection:
+    """
+    One independently refreshed part of the pricing snapshot
+
+    The section is loaded on first use and reloaded when its TTL expires,
+    when invalidate() is called in this process, or when another process
+    bumps the section's version number in the shared cache (checked at
+    most every VERSION_CHECK_INTERVAL_SECONDS).
+    """
+
+    VERSION_CHECK_INTERVAL_SECONDS = 5
+
+    def __init__(self, name: str, loader: Callable, ttl_seconds: int):
+        self.name = name
+        self.version_key = f'pricing_snapshot_version_{name}'
+        self.ttl_seconds = ttl_seconds
+        self._loader = loader
+        self._data = None
+        self._version = None
+        self._loaded_at: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Get the section data, reloading it if needed"""
+        now = time.monotonic()
+        if (self._loaded_at is not None and
+                now - self._loaded_at < self.ttl_seconds and
+                now - self._checked_at < self.VERSION_CHECK_INTERVAL_SECONDS):
+            return self._data
+
+        with self._lock:
+            shared_version = self._get_shared_version()
+            self._checked_at = now
+            if (self._loaded_at is not None and
+                    now - self._loaded_at < self.ttl_seconds and
+                    shared_version == self._version):
+                return self._data
+
+            self._data = self._loader()
+            self._version = shared_version
+            self._loaded_at = time.monotonic()
+            logger.debug(f"Pricing snapshot section '{self.name}' reloaded")
+            return self._data
+
+    def invalidate(self) -> None:
+        """Drop the loaded data here and signal other processes to reload"""
+        self._loaded_at = None
+        try:
+            try:
+                cache.incr(self.version_key)
+            except ValueError:
+                cache.set(self.version_key, 1, None)
+        except Exception as e:
+            logger.error(f"Failed to publish pricing snapshot version for {self.name}: {e}")
+
+    def _get_shared_version(self):
+        try:
+            return cache.get(self.version_key)
+        except Exception as e:
+            logger.error(f"Failed to read pricing snapshot version for {self.name}: {e}")
+            return self._version
+
+
+class PricingSnapshotCache:
+    """
+    Precomputed pricing tables so price quotes need no database reads
+
+    Rules, time-based pricing and special events change rarely and are
+    refreshed from model signals or a TTL. Demand surges change every few
+    minutes and live in their own section with a shorter TTL.
+    """
+
+    RULES_TTL_SECONDS = 300
+    SURGES_TTL_SECONDS = 30
+
+    def __init__(self):
+        self.rules = SnapshotSection('rules', self._load_rules, self.RULES_TTL_SECONDS)
+        self.surges = SnapshotSection('surges', self._load_surges, self.SURGES_TTL_SECONDS)
+
+    def _load_rules(self) -> Dict:
+        """Load pricing rules, time rules and events with one query each"""
+        from .models import PricingRule, TimeBasedPricing, SpecialEvent
+
+        # (zone_id, vehicle_type) -> rules, newest effective_from first
+        pricing_rules = defaultdict(list)
+        for rule in PricingRule.objects.filter(is_active=True).order_by('-effective_from'):
+            pricing_rules[(rule.zone_id, rule.vehicle_type)].append(rule)
+
+        # weekday -> time rules that can apply on that day, highest priority first
+        time_rules = {day: [] for day in WEEKDAYS}
+        for rule in TimeBasedPricing.objects.filter(is_active=True).order_by('-priority', 'start_time'):
+            for day in WEEKDAYS:
+                if (rule.day_of_week == 'all' or rule.day_of_week == day or
+                        (rule.day_of_week == 'weekday' and day not in ['saturday', 'sunday']) or
+                        (rule.day_of_week == 'weekend' and day in ['saturday', 'sunday'])):
+                    time_rules[day].append(rule)
+
+        # (event, affected zone ids)
+        events = [
+            (event, frozenset(zone.pk for zone in event.affected_zones.all()))
+            for event in SpecialEvent.objects.filter(is_active=True).prefetch_related('affected_zones')
+        ]
+
+        return {
+            'pricing_rules': dict(pricing_rules),
+            'time_rules': time_rules,
+            'events': events
+        }
+
+    def _load_surges(self) -> Dict:
+        """Load the latest unexpired surge of every zone with one query"""
+        from .models import DemandSurge
+
+        surges = {}
+        for surge in DemandSurge.objects.filter(
+            is_active=True,
+            expires_at__gt=timezone.now()
+        ).select_related('zone').order_by('-calculated_at'):
+            surges.setdefault(surge.zone_id, surge)
+
+        return surges
+
+    def get_pricing_rule(self, zone, vehicle_type: str, moment=None):
+        """Get the newest pricing rule in effect for a zone and vehicle type"""
+        if moment is None:
+            moment = timezone.now()
+
+        for rule in self.rules.get()['pricing_rules'].get((zone.pk, vehicle_type), []):
+            if rule.effective_from <= moment and (
+                rule.effective_until is None or rule.effective_until >= moment
+            ):
+                return rule
+
+        return None
+
+    def get_time_rules(self, moment=None) -> List:
+        """Get time rules that can apply on the weekday of a moment"""
+        if moment is None:
+            moment = timezone.now()
+        return self.rules.get()['time_rules'][moment.strftime('%A').lower()]
+
+    def get_events(self) -> List[Tuple]:
+        """Get active special events with their affected zone ids"""
+        return self.rules.get()['events']
+
+    def get_zone_surge(self, zone):
+        """Get the latest unexpired surge record for a zone"""
+        return self.surges.get().get(zone.pk)
+
+    def invalidate_rules(self) -> None:
+        """Reload pricing rules, time rules and events on next use"""
+        self.rules.invalidate()
+
+    def invalidate_surges(self) -> None:
+        """Reload surge records on next use"""
+        self.surges.invalidate()
+
+
+# Global pricing snapshot cache instance
+_snapshot_cache: Optional[PricingSnapshotCache] = None
+
+
+def get_snapshot_cache() -> PricingSnapshotCache:
+    """Get global pricing snapshot cache instance"""
+    global _snapshot_cache
+    if _snapshot_cache is None:
+        _snapshot_cache = PricingSnapshotCache()
+    return _snapshot_cache
@@ -25,19 +25,9 @@ def update_surge_pricing(self):
     try:
         logger.info("Starting surge pricing update task")
         
-        # Get all active zones
-        active_zones = PricingZone.objects.filter(
-            is_active=True, 
-            surge_enabled=True
-        )
-        
-        updated_zones = 0
-        for zone in active_zones:
-            try:
-                SurgeManagementService.update_zone_surge(str(zone.id))
-                updated_zones += 1
-            except Exception as e:
-                logger.error(f"Failed to update surge for zone {zone.name}: {e}")
+        # Recalculate every surge-enabled zone in one grouped pass
+        surge_grid = SurgeManagementService.update_surge_grid()
+        updated_zones = len(surge_grid)
         
         logger.info(f"Surge pricing updated for {updated_zones} zones")
         
@@ -0,0 +1,361 @@
+from datetime import time, timedelta
+from decimal import Decimal
+import queue
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User, UserTier
+from .engines import PricingEngine, SURGE_GRID_CACHE_KEY, SurgeManagementService
+from .log_writer import PriceLogWriter
+from .models import (
+    DemandSurge, PriceCalculationLog, PricingRule, PricingZone,
+    PromotionalCode, TimeBasedPricing
+)
+from .snapshots import PricingSnapshotCache
+from .zone_index import PricingZoneIndex
+
+
+class PricingZoneIndexTestCase(SimpleTestCase):
+    """Test pricing zone index lookups"""
+
+    def setUp(self):
+        def zone(name, min_lat, max_lat, min_lng, max_lng):
+            return PricingZone(
+                name=name, city='Lagos',
+                min_latitude=Decimal(min_lat), max_latitude=Decimal(max_lat),
+                min_longitude=Decimal(min_lng), max_longitude=Decimal(max_lng)
+            )
+
+        self.zones = [
+            zone('Victoria Island', '6.4200', '6.4400', '3.4000', '3.4400'),
+            zone('Lekki', '6.4300', '6.4700', '3.4300', '3.5500'),
+            zone('Lagos Metro', '6.3800', '6.7000', '3.2000', '3.6000'),
+            zone('Ikeja', '6.5800', '6.6300', '3.3200', '3.3700'),
+        ]
+        self.index = PricingZoneIndex()
+        self.index.build(self.zones)
+
+    def _linear_lookup(self, latitude, longitude):
+        for zone in self.zones:
+            if zone.contains_point(latitude, longitude):
+                return zone
+        return None
+
+    def test_lookup_returns_first_matching_zone(self):
+        """Test overlapping zones resolve in queryset order"""
+        self.assertEqual(self.index.lookup(Decimal('6.4300'), Decimal('3.4350')).name, 'Victoria Island')
+        self.assertEqual(self.index.lookup(Decimal('6.4500'), Decimal('3.5000')).name, 'Lekki')
+        self.assertEqual(self.index.lookup(Decimal('6.6000'), Decimal('3.3500')).name, 'Lagos Metro')
+        self.assertIsNone(self.index.lookup(Decimal('7.3775'), Decimal('3.9470')))
+
+    def test_lookup_matches_linear_scan(self):
+        """Test index agrees with contains_point including zone edges"""
+        latitudes = [Decimal('6.3700') + Decimal('0.0050') * i for i in range(70)]
+        longitudes = [Decimal('3.1900') + Decimal('0.0100') * j for j in range(43)]
+
+        for latitude in latitudes:
+            for longitude in longitudes:
+                self.assertIs(
+                    self.index.lookup(latitude, longitude),
+                    self._linear_lookup(latitude, longitude),
+                    f"Mismatch at {latitude}, {longitude}"
+                )
+
+    def test_empty_index(self):
+        """Test lookups on an index without zones"""
+        index = PricingZoneIndex()
+        index.build([])
+        self.assertIsNone(index.lookup(Decimal('6.45'), Decimal('3.47')))
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SYNC_PRICING_LOGS = {'ASYNC_ENABLED': False}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PricingSnapshotCacheTestCase(TestCase):
+    """Test cached pricing tables for the quote path"""
+
+    def setUp(self):
+        self.zone = PricingZone.objects.create(
+            name='Lekki', city='Lagos',
+            min_latitude=Decimal('6.43'), max_latitude=Decimal('6.47'),
+            min_longitude=Decimal('3.43'), max_longitude=Decimal('3.55')
+        )
+        now = timezone.now()
+        self.current_rule = PricingRule.objects.create(
+            vehicle_type='economy', zone=self.zone,
+            base_fare=Decimal('500.00'), per_km_rate=Decimal('100.00'),
+            per_minute_rate=Decimal('10.00'), minimum_fare=Decimal('800.00'),
+            effective_from=now - timedelta(days=30)
+        )
+        PricingRule.objects.create(
+            vehicle_type='economy', zone=self.zone,
+            base_fare=Decimal('600.00'), per_km_rate=Decimal('120.00'),
+            per_minute_rate=Decimal('12.00'), minimum_fare=Decimal('900.00'),
+            effective_from=now + timedelta(days=1)
+        )
+        self.snapshots = PricingSnapshotCache()
+
+    def test_pricing_rule_respects_effective_dates(self):
+        """Test the newest rule already in effect is returned"""
+        self.assertEqual(
+            self.snapshots.get_pricing_rule(self.zone, 'economy'), self.current_rule
+        )
+        self.assertIsNone(self.snapshots.get_pricing_rule(self.zone, 'luxury'))
+
+    def test_cached_lookups_need_no_queries(self):
+        """Test repeated lookups are served from memory"""
+        self.snapshots.get_pricing_rule(self.zone, 'economy')
+        self.snapshots.get_zone_surge(self.zone)
+
+        with self.assertNumQueries(0):
+            self.snapshots.get_pricing_rule(self.zone, 'economy')
+            self.snapshots.get_time_rules()
+            self.snapshots.get_events()
+            self.snapshots.get_zone_surge(self.zone)
+
+    def test_time_rules_are_grouped_by_weekday(self):
+        """Test time rules are only listed for the days they can apply"""
+        weekend_rule = TimeBasedPricing.objects.create(
+            name='Weekend nights', day_of_week='weekend',
+            start_time=time(22, 0), end_time=time(4, 0)
+        )
+        self.snapshots.invalidate_rules()
+
+        saturday = timezone.now() + timedelta(days=(5 - timezone.now().weekday()) % 7)
+        monday = saturday + timedelta(days=2)
+        self.assertEqual(self.snapshots.get_time_rules(saturday), [weekend_rule])
+        self.assertEqual(self.snapshots.get_time_rules(monday), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PRICING_LOG_SETTINGS=SYNC_PRICING_LOGS)
+class BatchPriceQuoteTestCase(TestCase):
+    """Test batch price quotes against single quotes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='rider@example.com', password='pass12345', phone_number='+2348000000001'
+        )
+        zone = PricingZone.objects.create(
+            name='Lekki', city='Lagos', base_multiplier=Decimal('1.100'),
+            min_latitude=Decimal('6.43'), max_latitude=Decimal('6.47'),
+            min_longitude=Decimal('3.43'), max_longitude=Decimal('3.55')
+        )
+        effective_from = timezone.now() - timedelta(days=1)
+        for vehicle_type, base_fare in [('economy', '500.00'), ('luxury', '1500.00')]:
+            PricingRule.objects.create(
+                vehicle_type=vehicle_type, zone=zone,
+                base_fare=Decimal(base_fare), per_km_rate=Decimal('100.00'),
+                per_minute_rate=Decimal('10.00'), minimum_fare=Decimal('800.00'),
+                effective_from=effective_from
+            )
+        DemandSurge.objects.create(
+            zone=zone, surge_level='low', surge_multiplier=Decimal('1.200'),
+            expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        PromotionalCode.objects.create(
+            code='SAVE10', description='10% off', code_type='discount',
+            discount_type='percentage', discount_value=Decimal('10'),
+            applies_to_surge=True, expires_at=timezone.now() + timedelta(days=7)
+        )
+        self.trip = dict(
+            user=self.user,
+            pickup_lat=Decimal('6.4474'), pickup_lng=Decimal('3.4700'),
+            dropoff_lat=Decimal('6.4300'), dropoff_lng=Decimal('3.4500'),
+            distance_km=Decimal('5.20'), estimated_duration_minutes=15
+        )
+
+    def test_batch_matches_single_quotes(self):
+        """Test every batch quote and promo variant equals its single quote"""
+        result = PricingEngine().calculate_batch_prices(
+            vehicle_types=['economy', 'luxury', 'van'], promo_codes=['save10'], **self.trip
+        )
+
+        self.assertEqual(result['unavailable_vehicle_types'], ['van'])
+        self.assertEqual([quote['vehicle_type'] for quote in result['quotes']], ['economy', 'luxury'])
+
+        for quote in result['quotes']:
+            single = PricingEngine().calculate_ride_price(vehicle_type=quote['vehicle_type'], **self.trip)
+            self.assertEqual(quote['final_price'], single['final_price'])
+            self.assertEqual(quote['pricing_breakdown'], single['pricing_breakdown'])
+
+            promo_single = PricingEngine().calculate_ride_price(
+                vehicle_type=quote['vehicle_type'], promo_code='save10', **self.trip
+            )
+            variant = quote['promo_variants'][0]
+            self.assertEqual(variant['promo_code'], 'save10')
+            self.assertEqual(variant['final_price'], promo_single['final_price'])
+            self.assertGreater(variant['discount'], Decimal('0'))
+
+    def test_batch_logs_every_quote_in_one_insert(self):
+        """Test all batch quotes are logged with a single insert"""
+        engine = PricingEngine()
+        with mock.patch.object(
+            PriceCalculationLog.objects, 'bulk_create',
+            wraps=PriceCalculationLog.objects.bulk_create
+        ) as bulk_create:
+            engine.calculate_batch_prices(
+                vehicle_types=['economy', 'luxury'], promo_codes=['SAVE10'], **self.trip
+            )
+
+        bulk_create.assert_called_once()
+        self.assertEqual(PriceCalculationLog.objects.count(), 4)
+        self.assertEqual(
+            sorted(PriceCalculationLog.objects.values_list('applied_promo_code', flat=True)),
+            ['', '', 'SAVE10', 'SAVE10']
+        )
+
+    def test_batch_without_any_rule_raises(self):
+        """Test a batch with no priceable vehicle type is rejected"""
+        with self.assertRaises(ValueError):
+            PricingEngine().calculate_batch_prices(vehicle_types=['van'], **self.trip)
+
+    def test_vip_premium_gets_premium_multiplier(self):
+        """Test VIP Premium customers are priced with the rule's premium multiplier"""
+        rule = PricingRule(
+            normal_multiplier=Decimal('1.000'), premium_multiplier=Decimal('1.500'),
+            vip_multiplier=Decimal('2.000')
+        )
+        engine = PricingEngine()
+        engine.calculation_log = {'factors_applied': []}
+
+        self.assertEqual(engine._get_tier_multiplier(UserTier.VIP_PREMIUM, rule), Decimal('1.500'))
+        self.assertEqual(engine._get_tier_multiplier(UserTier.VIP, rule), Decimal('2.000'))
+
+
+class PriceLogWriterTestCase(SimpleTestCase):
+    """Test buffered price calculation log writer"""
+
+    def setUp(self):
+        self.writer = PriceLogWriter()
+        self.written = []
+        self.writer._write = lambda entries, batch_size: self.written.append(list(entries)) or len(entries)
+
+        # Queue without the background thread so flushes are deterministic
+        def ensure_queue(config):
+            if self.writer._queue is None:
+                self.writer._queue = queue.Queue(maxsize=config['MAX_QUEUE_SIZE'])
+            return self.writer._queue
+        self.writer._ensure_worker = ensure_queue
+
+    @override_settings(PRICING_LOG_SETTINGS={'BATCH_SIZE': 2, 'MAX_QUEUE_SIZE': 100})
+    def test_entries_are_buffered_until_flush(self):
+        """Test submit only queues and flush writes in batches"""
+        self.writer.submit(range(5))
+        self.assertEqual(self.written, [])
+
+        self.assertEqual(self.writer.flush(), 5)
+        self.assertEqual(self.written, [[0, 1], [2, 3], [4]])
+        self.assertEqual(self.writer.get_stats()['queued'], 0)
+
+    @override_settings(PRICING_LOG_SETTINGS={'MAX_QUEUE_SIZE': 3})
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test back-pressure drops entries once the queue is full"""
+        self.writer.submit(range(5))
+
+        stats = self.writer.get_stats()
+        self.assertEqual(stats['queued'], 3)
+        self.assertEqual(stats['dropped'], 2)
+
+    @override_settings(PRICING_LOG_SETTINGS={'SAMPLE_RATE': 0.0})
+    def test_sampling_skips_entries(self):
+        """Test sampled out entries are never queued"""
+        self.writer.submit(range(5))
+
+        stats = self.writer.get_stats()
+        self.assertEqual(stats['sampled_out'], 5)
+        self.assertEqual(stats['queued'], 0)
+
+    @override_settings(PRICING_LOG_SETTINGS={'ASYNC_ENABLED': False})
+    def test_sync_mode_writes_immediately(self):
+        """Test disabling async writes entries in the caller"""
+        self.writer.submit(['entry'])
+        self.assertEqual(self.written, [['entry']])
+
+    @override_settings(PRICING_LOG_SETTINGS={'FLUSH_INTERVAL_MS': 60000})
+    def test_worker_flushes_on_shutdown(self):
+        """Test starting the worker registers one flush for interpreter exit"""
+        writer = PriceLogWriter()
+        with mock.patch('core.buffered_writer.atexit.register') as register, \
+                mock.patch('core.buffered_writer.threading.Thread'):
+            writer._ensure_worker(writer.get_config())
+            writer._thread = None
+            writer._ensure_worker(writer.get_config())
+
+        register.assert_called_once_with(writer.flush)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PRICING_LOG_SETTINGS=SYNC_PRICING_LOGS)
+class SurgeGridTestCase(TestCase):
+    """Test precomputed surge grid"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rides.models import Ride, RideStatus
+
+        cache.clear()
+        self.cache = cache
+        self.busy_zone = PricingZone.objects.create(
+            name='Lekki', city='Lagos',
+            min_latitude=Decimal('6.43'), max_latitude=Decimal('6.47'),
+            min_longitude=Decimal('3.43'), max_longitude=Decimal('3.55')
+        )
+        self.quiet_zone = PricingZone.objects.create(
+            name='Ikeja', city='Lagos',
+            min_latitude=Decimal('6.58'), max_latitude=Decimal('6.63'),
+            min_longitude=Decimal('3.32'), max_longitude=Decimal('3.37')
+        )
+        PricingZone.objects.create(
+            name='Airport', city='Lagos', surge_enabled=False,
+            min_latitude=Decimal('6.57'), max_latitude=Decimal('6.58'),
+            min_longitude=Decimal('3.31'), max_longitude=Decimal('3.33')
+        )
+
+        rider = User.objects.create_user(
+            email='surge@example.com', password='pass12345', phone_number='+2348000000002'
+        )
+        for ride_status in [RideStatus.REQUESTED] * 3 + [RideStatus.IN_PROGRESS, RideStatus.COMPLETED]:
+            Ride.objects.create(
+                rider=rider, status=ride_status, rider_tier='normal',
+                platform_commission_rate=Decimal('15.00'),
+                pickup_latitude=Decimal('6.4474'), pickup_longitude=Decimal('3.4700'),
+                pickup_address='Lekki', destination_latitude=Decimal('6.6018'),
+                destination_longitude=Decimal('3.3515'), destination_address='Ikeja'
+            )
+
+    def test_grid_counts_demand_per_zone_with_constant_queries(self):
+        """Test one grouped pass publishes every surge-enabled zone"""
+        with self.assertNumQueries(5):
+            surge_grid = SurgeManagementService.update_surge_grid()
+
+        self.assertEqual(set(surge_grid), {str(self.busy_zone.pk), str(self.quiet_zone.pk)})
+        self.assertEqual(self.cache.get(SURGE_GRID_CACHE_KEY), surge_grid)
+
+        # 4 open rides and no drivers in Lekki: ratio 4.0 -> high surge
+        multiplier, level, demand_ratio, _ = surge_grid[str(self.busy_zone.pk)]
+        self.assertEqual((multiplier, level, demand_ratio), ('2.000', 'high', '4.0'))
+        self.assertEqual(surge_grid[str(self.quiet_zone.pk)][1], 'none')
+
+        busy_surge = DemandSurge.objects.get(zone=self.busy_zone)
+        self.assertEqual((busy_surge.active_rides, busy_surge.pending_requests), (1, 3))
+
+        # Second run updates the rows in place
+        SurgeManagementService.update_surge_grid()
+        self.assertEqual(DemandSurge.objects.count(), 2)
+
+    def test_engine_reads_surge_from_grid(self):
+        """Test the quote path takes the multiplier from the published grid"""
+        SurgeManagementService.update_surge_grid()
+        engine = PricingEngine()
+        engine.calculation_log = {'factors_applied': []}
+
+        with self.assertNumQueries(0):
+            multiplier = engine._get_surge_multiplier(
+                Decimal('6.45'), Decimal('3.47'), timezone.now(), zone=self.busy_zone
+            )
+
+        self.assertEqual(multiplier, Decimal('2.000'))
+        self.assertEqual(engine.calculation_log['factors_applied'][0]['surge_level'], 'high')
@@ -11,6 +11,7 @@ app_name = 'pricing'
 urlpatterns = [
     # Public pricing endpoints
     path('quote/', views.get_price_quote, name='price_quote'),
+    path('quote/batch/', views.get_batch_price_quote, name='batch_price_quote'),
     path('surge-levels/', views.get_surge_levels, name='surge_levels'),
     path('zones/', views.get_pricing_zones, name='pricing_zones'),
     path('transparency/', views.get_price_transparency, name='price_transparency'),
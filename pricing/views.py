@@ -15,6 +15,7 @@ from .engines import PricingEngine, SurgeManagementService
 from .models import PricingZone, PromotionalCode
 from .serializers import (
     PriceQuoteRequestSerializer, PriceQuoteResponseSerializer,
+    BatchPriceQuoteRequestSerializer, BatchPriceQuoteResponseSerializer,
     SurgeLevelSerializer, PricingZoneSerializer
 )
 
@@ -90,6 +91,67 @@ def get_price_quote(request):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def get_batch_price_quote(request):
+    """
+    Get price quotes for several vehicle types and promo codes in one request
+    
+    POST /api/pricing/quote/batch/
+    {
+        "pickup_lat": 6.5244,
+        "pickup_lng": 3.3792,
+        "dropoff_lat": 6.4474,
+        "dropoff_lng": 3.3903,
+        "distance_km": "15.2",
+        "estimated_duration_minutes": 25,
+        "vehicle_types": ["economy", "premium", "luxury"],
+        "promo_codes": ["SAVE20"]
+    }
+    """
+    serializer = BatchPriceQuoteRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(
+            {'error': 'Invalid request data', 'details': serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    data = serializer.validated_data
+    
+    try:
+        engine = PricingEngine()
+        
+        # Shared factors are resolved once for all vehicle types
+        batch_result = engine.calculate_batch_prices(
+            user=request.user,
+            pickup_lat=Decimal(str(data['pickup_lat'])),
+            pickup_lng=Decimal(str(data['pickup_lng'])),
+            dropoff_lat=Decimal(str(data['dropoff_lat'])),
+            dropoff_lng=Decimal(str(data['dropoff_lng'])),
+            distance_km=data['distance_km'],
+            estimated_duration_minutes=data['estimated_duration_minutes'],
+            vehicle_types=data['vehicle_types'],
+            promo_codes=data.get('promo_codes')
+        )
+        
+        response_serializer = BatchPriceQuoteResponseSerializer(batch_result)
+        
+        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        
+    except ValueError as e:
+        logger.warning(f"Batch price calculation error for user {request.user.id}: {e}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error in batch price calculation: {e}")
+        return Response(
+            {'error': 'Unable to calculate prices at this time'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['GET'])
 def get_surge_levels(request):
     """
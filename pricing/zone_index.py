@@ -0,0 +1,139 @@
+"""
+VIP Ride-Hailing Platform - Pricing Zone Index
+Process-local lookup structure resolving coordinates to pricing zones
+"""
+
+import bisect
+import threading
+import time
+import logging
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class PricingZoneIndex:
+    """
+    Sorted latitude-slab index over the bounding boxes of active pricing zones
+
+    The distinct min/max latitudes of all zones split the map into slabs;
+    each slab keeps the zones whose latitude range covers its lower edge,
+    in the same order PricingZone.objects.filter(is_active=True) returns
+    them. A lookup is a bisect over the slab edges followed by a longitude
+    check on the few zones of that slab, so the first matching zone is the
+    same one the linear scan over contains_point() would return.
+
+    The index is rebuilt lazily after invalidate(). Zone saves in other
+    processes are picked up through a version number kept in the shared
+    cache, which is checked at most every VERSION_CHECK_INTERVAL_SECONDS.
+    """
+
+    VERSION_CACHE_KEY = 'pricing_zone_index_version'
+    VERSION_CHECK_INTERVAL_SECONDS = 5
+
+    def __init__(self):
+        # (edges, slabs) replaced together so lookups never mix two builds
+        self._table: Tuple[List[Decimal], List[List[Tuple]]] = ([], [])
+        self._zone_count = 0
+        self._version = None
+        self._is_built = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def build(self, zones) -> None:
+        """Build the index from an iterable of PricingZone instances"""
+        zones = list(zones)
+        edges = sorted({
+            edge for zone in zones
+            for edge in (zone.min_latitude, zone.max_latitude)
+        })
+
+        slabs = []
+        for edge in edges:
+            slabs.append([
+                (zone.min_latitude, zone.max_latitude,
+                 zone.min_longitude, zone.max_longitude, zone)
+                for zone in zones
+                if zone.min_latitude <= edge <= zone.max_latitude
+            ])
+
+        self._table = (edges, slabs)
+        self._zone_count = len(zones)
+        self._is_built = True
+
+    def lookup(self, latitude, longitude):
+        """Find the pricing zone containing a point in the built index"""
+        edges, slabs = self._table
+        slab_index = bisect.bisect_right(edges, latitude) - 1
+        if slab_index < 0:
+            return None
+
+        for min_lat, max_lat, min_lng, max_lng, zone in slabs[slab_index]:
+            if min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng:
+                return zone
+
+        return None
+
+    def resolve(self, latitude, longitude):
+        """Find the active pricing zone for given coordinates"""
+        self.ensure_current()
+        return self.lookup(latitude, longitude)
+
+    def ensure_current(self) -> None:
+        """Rebuild from the database if invalidated locally or by another process"""
+        now = time.monotonic()
+        if self._is_built and now - self._checked_at < self.VERSION_CHECK_INTERVAL_SECONDS:
+            return
+
+        with self._lock:
+            shared_version = self._get_shared_version()
+            self._checked_at = now
+            if self._is_built and shared_version == self._version:
+                return
+
+            from .models import PricingZone
+            self.build(PricingZone.objects.filter(is_active=True))
+            self._version = shared_version
+            logger.debug(f"Pricing zone index rebuilt with {self._zone_count} zones")
+
+    def invalidate(self) -> None:
+        """Drop the built index here and signal other processes to rebuild"""
+        self._is_built = False
+        try:
+            try:
+                cache.incr(self.VERSION_CACHE_KEY)
+            except ValueError:
+                cache.set(self.VERSION_CACHE_KEY, 1, None)
+        except Exception as e:
+            logger.error(f"Failed to publish pricing zone index version: {e}")
+
+    def _get_shared_version(self):
+        try:
+            return cache.get(self.VERSION_CACHE_KEY)
+        except Exception as e:
+            logger.error(f"Failed to read pricing zone index version: {e}")
+            return self._version
+
+    def get_stats(self) -> dict:
+        """Get index statistics"""
+        return {
+            'zones_indexed': self._zone_count,
+            'latitude_slabs': len(self._table[0]),
+            'is_built': self._is_built,
+            'version': self._version
+        }
+
+
+# Global pricing zone index instance
+_zone_index: Optional[PricingZoneIndex] = None
+
+
+def get_zone_index() -> PricingZoneIndex:
+    """Get global pricing zone index instance"""
+    global _zone_index
+    if _zone_index is None:
+        _zone_index = PricingZoneIndex()
+    return _zone_index
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RidesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rides'
+    
+    def ready(self):
+        """Import signal handlers when app is ready"""
+        import rides.signals  # noqa: F401
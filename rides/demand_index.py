@@ -0,0 +1,204 @@
+# Ride Demand Index
+"""
+Rolling, cell-bucketed counter of open ride requests for surge pricing.
+
+Open rides are bucketed into the same kind of lat/lng grid cells as the
+driver spatial index, so counting demand around a pickup point only reads
+the few cells covering the search radius instead of every ride requested
+on the platform in the last half hour. The counter is kept current from
+ride saves (see rides/signals.py) and is periodically reloaded from the
+database so that rides created by other worker processes are picked up.
+"""
+
+import math
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.utils import timezone
+
+from .driver_index import cells_covering, haversine_km
+from .models import Ride, RideStatus
+
+logger = logging.getLogger(__name__)
+
+
+class RideDemandIndex:
+    """Grid-cell counter of open ride requests inside a rolling time window"""
+
+    CELL_SIZE_DEGREES = 0.02  # ~2.2km cells around the equator
+    WINDOW_MINUTES = 30  # Rides requested earlier no longer count as demand
+    REFRESH_INTERVAL_SECONDS = 30  # Reload from DB to see other workers' rides
+
+    # Rides still waiting for, or about to get, a driver
+    DEMAND_STATUSES = frozenset([
+        RideStatus.REQUESTED,
+        RideStatus.DRIVER_ACCEPTED,
+        RideStatus.DRIVER_EN_ROUTE,
+    ])
+
+    def __init__(self, cell_size_degrees: float = None):
+        self.cell_size = cell_size_degrees or self.CELL_SIZE_DEGREES
+        # ride_id -> (lat, lng, requested_at timestamp, cell)
+        self._rides: Dict = {}
+        self._cells: Dict[Tuple[int, int], Dict] = {}
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._rides)
+
+    def _cell_for(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            int(math.floor(latitude / self.cell_size)),
+            int(math.floor(longitude / self.cell_size))
+        )
+
+    def _window_start(self) -> float:
+        return (timezone.now() - timedelta(minutes=self.WINDOW_MINUTES)).timestamp()
+
+    def add(self, ride_id, latitude: float, longitude: float,
+            requested_at: datetime) -> None:
+        """Count a ride as open demand at its pickup location"""
+        latitude = float(latitude)
+        longitude = float(longitude)
+        cell = self._cell_for(latitude, longitude)
+        requested_ts = requested_at.timestamp()
+
+        with self._lock:
+            self.remove(ride_id)
+            self._rides[ride_id] = (latitude, longitude, requested_ts, cell)
+            self._cells.setdefault(cell, {})[ride_id] = (latitude, longitude, requested_ts)
+
+    def remove(self, ride_id) -> bool:
+        """Stop counting a ride"""
+        with self._lock:
+            previous = self._rides.pop(ride_id, None)
+            if previous is None:
+                return False
+            self._discard_from_cell(ride_id, previous[3])
+            return True
+
+    def _discard_from_cell(self, ride_id, cell: Tuple[int, int]) -> None:
+        members = self._cells.get(cell)
+        if members is None:
+            return
+        members.pop(ride_id, None)
+        if not members:
+            del self._cells[cell]
+
+    def update_ride(self, ride) -> None:
+        """Sync a Ride instance into the counter based on its status and age"""
+        is_demand = (
+            ride.status in self.DEMAND_STATUSES and
+            ride.requested_at is not None and
+            ride.pickup_latitude is not None and
+            ride.pickup_longitude is not None and
+            ride.requested_at.timestamp() >= self._window_start()
+        )
+
+        if is_demand:
+            self.add(ride.pk, ride.pickup_latitude, ride.pickup_longitude, ride.requested_at)
+        else:
+            self.remove(ride.pk)
+
+    def load(self, entries: Iterable[Tuple]) -> int:
+        """Replace counter contents with (ride_id, lat, lng, requested_at) rows"""
+        rides = {}
+        cells: Dict[Tuple[int, int], Dict] = {}
+
+        for ride_id, latitude, longitude, requested_at in entries:
+            latitude = float(latitude)
+            longitude = float(longitude)
+            requested_ts = requested_at.timestamp()
+            cell = self._cell_for(latitude, longitude)
+            rides[ride_id] = (latitude, longitude, requested_ts, cell)
+            cells.setdefault(cell, {})[ride_id] = (latitude, longitude, requested_ts)
+
+        with self._lock:
+            self._rides = rides
+            self._cells = cells
+            self._loaded_at = time.monotonic()
+
+        return len(rides)
+
+    def refresh_from_db(self) -> int:
+        """Reload open rides inside the window with a single values query"""
+        rows = Ride.objects.filter(
+            requested_at__gte=timezone.now() - timedelta(minutes=self.WINDOW_MINUTES),
+            status__in=list(self.DEMAND_STATUSES)
+        ).values_list('id', 'pickup_latitude', 'pickup_longitude', 'requested_at')
+
+        count = self.load(rows)
+        logger.debug(f"Ride demand index reloaded with {count} open rides")
+        return count
+
+    def is_stale(self) -> bool:
+        """Check whether the counter should be reloaded from the database"""
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at > self.REFRESH_INTERVAL_SECONDS
+
+    def ensure_fresh(self) -> None:
+        """Reload from the database if the counter was never loaded or is stale"""
+        if self.is_stale():
+            try:
+                self.refresh_from_db()
+            except Exception as e:
+                logger.error(f"Failed to refresh ride demand index: {e}")
+
+    def count_within(self, latitude: float, longitude: float, radius_km: float) -> int:
+        """
+        Count open rides requested inside the window within radius_km of a point
+
+        Only the cells covering the radius are read; rides that have aged
+        out of the window are dropped from those cells as they are found.
+        """
+        latitude = float(latitude)
+        longitude = float(longitude)
+        window_start = self._window_start()
+        count = 0
+
+        with self._lock:
+            for cell in cells_covering(latitude, longitude, radius_km, self.cell_size):
+                members = self._cells.get(cell)
+                if not members:
+                    continue
+
+                expired = []
+                for ride_id, (r_lat, r_lng, requested_ts) in members.items():
+                    if requested_ts < window_start:
+                        expired.append(ride_id)
+                    elif haversine_km(latitude, longitude, r_lat, r_lng) <= radius_km:
+                        count += 1
+
+                for ride_id in expired:
+                    self.remove(ride_id)
+
+        return count
+
+    def get_stats(self) -> Dict:
+        """Get counter statistics"""
+        with self._lock:
+            return {
+                'open_rides': len(self._rides),
+                'occupied_cells': len(self._cells),
+                'cell_size_degrees': self.cell_size,
+                'seconds_since_reload': (
+                    time.monotonic() - self._loaded_at if self._loaded_at else None
+                )
+            }
+
+
+# Global ride demand index instance
+_demand_index: Optional[RideDemandIndex] = None
+
+
+def get_demand_index() -> RideDemandIndex:
+    """Get global ride demand index instance"""
+    global _demand_index
+    if _demand_index is None:
+        _demand_index = RideDemandIndex()
+    return _demand_index
@@ -0,0 +1,310 @@
+# Driver Spatial Index
+"""
+In-memory spatial index of online drivers for ride matching.
+
+Drivers are bucketed into fixed-size lat/lng grid cells so that
+"K nearest drivers within R km" only has to look at the cells around the
+pickup point instead of scanning every online driver in the database.
+The index is kept current from driver saves (see rides/signals.py) and is
+periodically reloaded from the database so that updates made by other
+worker processes are picked up.
+"""
+
+import heapq
+import math
+import threading
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Calculate haversine distance between two points in kilometers"""
+    lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2)
+    return 2 * math.asin(math.sqrt(a)) * EARTH_RADIUS_KM
+
+
+def cells_covering(latitude: float, longitude: float, radius_km: float,
+                   cell_size: float) -> List[Tuple[int, int]]:
+    """List the grid cells overlapping the bounding box of a radius around a point"""
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    max_abs_lat = min(abs(latitude) + lat_delta, 89.9)
+    lng_delta = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+
+    min_i = int(math.floor((latitude - lat_delta) / cell_size))
+    max_i = int(math.floor((latitude + lat_delta) / cell_size))
+    min_j = int(math.floor((longitude - lng_delta) / cell_size))
+    max_j = int(math.floor((longitude + lng_delta) / cell_size))
+
+    return [
+        (i, j)
+        for i in range(min_i, max_i + 1)
+        for j in range(min_j, max_j + 1)
+    ]
+
+
+class DriverSpatialIndex:
+    """Grid-cell index answering nearest-driver queries in memory"""
+
+    CELL_SIZE_DEGREES = 0.02  # ~2.2km cells around the equator
+    REFRESH_INTERVAL_SECONDS = 30  # Reload from DB to see other workers' updates
+
+    def __init__(self, cell_size_degrees: float = None):
+        self.cell_size = cell_size_degrees or self.CELL_SIZE_DEGREES
+        # driver_id -> (lat, lng, subscription_tier, cell)
+        self._positions: Dict[int, Tuple[float, float, str, Tuple[int, int]]] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, driver_id) -> bool:
+        return driver_id in self._positions
+
+    def _cell_for(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            int(math.floor(latitude / self.cell_size)),
+            int(math.floor(longitude / self.cell_size))
+        )
+
+    def upsert(self, driver_id, latitude: float, longitude: float,
+               subscription_tier: str = '') -> None:
+        """Insert or move a driver in the index"""
+        latitude = float(latitude)
+        longitude = float(longitude)
+        cell = self._cell_for(latitude, longitude)
+
+        with self._lock:
+            previous = self._positions.get(driver_id)
+            if previous and previous[3] != cell:
+                self._discard_from_cell(driver_id, previous[3])
+            self._positions[driver_id] = (latitude, longitude, subscription_tier, cell)
+            self._cells.setdefault(cell, set()).add(driver_id)
+
+    def remove(self, driver_id) -> bool:
+        """Remove a driver from the index"""
+        with self._lock:
+            previous = self._positions.pop(driver_id, None)
+            if previous is None:
+                return False
+            self._discard_from_cell(driver_id, previous[3])
+            return True
+
+    def _discard_from_cell(self, driver_id, cell: Tuple[int, int]) -> None:
+        members = self._cells.get(cell)
+        if members is None:
+            return
+        members.discard(driver_id)
+        if not members:
+            del self._cells[cell]
+
+    def update_driver(self, driver) -> None:
+        """Sync a Driver instance into the index, dropping it if it cannot be matched"""
+        is_matchable = (
+            driver.status == driver.DriverStatus.ACTIVE and
+            driver.is_online and
+            driver.is_available and
+            driver.current_location_lat is not None and
+            driver.current_location_lng is not None
+        )
+
+        if is_matchable:
+            self.upsert(
+                driver.pk,
+                driver.current_location_lat,
+                driver.current_location_lng,
+                driver.subscription_tier
+            )
+        else:
+            self.remove(driver.pk)
+
+    def load(self, entries: Iterable[Tuple]) -> int:
+        """Replace index contents with (driver_id, lat, lng, subscription_tier) rows"""
+        positions = {}
+        cells: Dict[Tuple[int, int], Set[int]] = {}
+
+        for driver_id, latitude, longitude, subscription_tier in entries:
+            latitude = float(latitude)
+            longitude = float(longitude)
+            cell = self._cell_for(latitude, longitude)
+            positions[driver_id] = (latitude, longitude, subscription_tier, cell)
+            cells.setdefault(cell, set()).add(driver_id)
+
+        with self._lock:
+            self._positions = positions
+            self._cells = cells
+            self._loaded_at = time.monotonic()
+
+        return len(positions)
+
+    def refresh_from_db(self) -> int:
+        """Reload all matchable drivers with a single values query"""
+        from accounts.models import Driver
+
+        rows = Driver.objects.filter(
+            status=Driver.DriverStatus.ACTIVE,
+            is_online=True,
+            is_available=True,
+            current_location_lat__isnull=False,
+            current_location_lng__isnull=False,
+        ).values_list(
+            'id', 'current_location_lat', 'current_location_lng', 'subscription_tier'
+        )
+
+        count = self.load(rows)
+        logger.debug(f"Driver spatial index reloaded with {count} drivers")
+        return count
+
+    def is_stale(self) -> bool:
+        """Check whether the index should be reloaded from the database"""
+        if self._loaded_at is None:
+            return True
+        return time.monotonic() - self._loaded_at > self.REFRESH_INTERVAL_SECONDS
+
+    def ensure_fresh(self) -> None:
+        """Reload from the database if the index was never loaded or is stale"""
+        if self.is_stale():
+            try:
+                self.refresh_from_db()
+            except Exception as e:
+                logger.error(f"Failed to refresh driver spatial index: {e}")
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        k: int,
+        subscription_tiers: Optional[Iterable[str]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the k nearest drivers within radius_km of a point
+
+        Cells are visited in rings of increasing distance from the point's
+        cell; the search stops as soon as the k-th best distance found is
+        closer than anything the next ring could contain.
+
+        Returns:
+            List of (driver_id, distance_km) ordered nearest first
+        """
+        if k <= 0 or radius_km <= 0:
+            return []
+
+        latitude = float(latitude)
+        longitude = float(longitude)
+        allowed_tiers = set(subscription_tiers) if subscription_tiers is not None else None
+
+        # Narrowest cell width inside the search area bounds the ring distance
+        max_abs_lat = min(abs(latitude) + radius_km / KM_PER_DEGREE_LAT, 89.9)
+        cell_km = self.cell_size * KM_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat))
+        max_ring = int(math.ceil(radius_km / cell_km)) + 1
+
+        # Max-heap of the best k candidates as (-distance, driver_id)
+        best: List[Tuple[float, int]] = []
+
+        def consider(driver_ids):
+            for driver_id in driver_ids:
+                d_lat, d_lng, tier, _ = self._positions[driver_id]
+                if allowed_tiers is not None and tier not in allowed_tiers:
+                    continue
+                distance = haversine_km(latitude, longitude, d_lat, d_lng)
+                if distance > radius_km:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, driver_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, driver_id))
+
+        with self._lock:
+            center_i, center_j = self._cell_for(latitude, longitude)
+
+            if len(self._positions) <= (2 * max_ring + 1) ** 2:
+                # Sparse index: checking every driver is cheaper than walking rings
+                for (cell_i, cell_j), driver_ids in self._cells.items():
+                    if max(abs(cell_i - center_i), abs(cell_j - center_j)) <= max_ring:
+                        consider(driver_ids)
+            else:
+                for ring in range(max_ring + 1):
+                    if len(best) >= k and -best[0][0] <= (ring - 1) * cell_km:
+                        break
+                    for cell in self._ring_cells(center_i, center_j, ring):
+                        driver_ids = self._cells.get(cell)
+                        if driver_ids:
+                            consider(driver_ids)
+
+        return sorted(
+            ((driver_id, -neg_distance) for neg_distance, driver_id in best),
+            key=lambda item: item[1]
+        )
+
+    def count_within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        subscription_tiers: Optional[Iterable[str]] = None
+    ) -> int:
+        """Count indexed drivers within radius_km, reading only the covering cells"""
+        latitude = float(latitude)
+        longitude = float(longitude)
+        allowed_tiers = set(subscription_tiers) if subscription_tiers is not None else None
+        count = 0
+
+        with self._lock:
+            for cell in cells_covering(latitude, longitude, radius_km, self.cell_size):
+                for driver_id in self._cells.get(cell, ()):
+                    d_lat, d_lng, tier, _ = self._positions[driver_id]
+                    if allowed_tiers is not None and tier not in allowed_tiers:
+                        continue
+                    if haversine_km(latitude, longitude, d_lat, d_lng) <= radius_km:
+                        count += 1
+
+        return count
+
+    @staticmethod
+    def _ring_cells(center_i: int, center_j: int, ring: int):
+        """Yield the cells at Chebyshev distance `ring` from the center cell"""
+        if ring == 0:
+            yield (center_i, center_j)
+            return
+        for j in range(center_j - ring, center_j + ring + 1):
+            yield (center_i - ring, j)
+            yield (center_i + ring, j)
+        for i in range(center_i - ring + 1, center_i + ring):
+            yield (i, center_j - ring)
+            yield (i, center_j + ring)
+
+    def get_stats(self) -> Dict:
+        """Get index statistics"""
+        with self._lock:
+            return {
+                'drivers_indexed': len(self._positions),
+                'occupied_cells': len(self._cells),
+                'cell_size_degrees': self.cell_size,
+                'seconds_since_reload': (
+                    time.monotonic() - self._loaded_at if self._loaded_at else None
+                )
+            }
+
+
+# Global driver index instance
+_driver_index: Optional[DriverSpatialIndex] = None
+
+
+def get_driver_index() -> DriverSpatialIndex:
+    """Get global driver spatial index instance"""
+    global _driver_index
+    if _driver_index is None:
+        _driver_index = DriverSpatialIndex()
+    return _driver_index
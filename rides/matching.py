@@ -9,6 +9,7 @@ Comprehensive ride matching algorithm that handles:
 - Driver availability status management
 """
 
+import heapq
 import math
 import logging
 from datetime import datetime, timedelta
@@ -23,8 +24,20 @@ from django.utils import timezone
 from django.conf import settings
 
 from accounts.models import Driver, UserTier
-from fleet_management.models import Vehicle
+from fleet_management.models import Vehicle, VehicleStatus
+from gps_tracking.location_store import get_location_store
 from .models import Ride, RideOffer, RideStatus, RideType, BillingModel
+from .demand_index import get_demand_index
+from .driver_index import get_driver_index
+
+# requirements/base.txt pins numpy, but the Docker images install the root
+# requirements.txt, which does not; those keep the pure Python scoring path
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +70,7 @@ class RideMatchingService:
     # Configuration constants
     MAX_SEARCH_RADIUS_KM = 20.0  # Maximum search radius for drivers
     VIP_SEARCH_RADIUS_KM = 50.0  # Extended search for VIP rides
-    MAX_DRIVERS_TO_CONSIDER = 50  # Limit drivers to consider for performance
+    MAX_DRIVERS_TO_CONSIDER = 50  # Nearest candidates taken from the spatial index
     
     # Scoring weights
     DISTANCE_WEIGHT = 0.3
@@ -117,26 +130,19 @@ class RideMatchingService:
             logger.warning(f"No available drivers found for ride {ride.id}")
             return []
         
-        # Score and rank drivers
-        scored_drivers = []
-        
-        for driver_data in available_drivers:
-            driver = driver_data['driver']
-            vehicle = driver_data['vehicle']
-            distance_km = driver_data['distance_km']
-            
-            try:
-                score_data = self.score_driver_for_ride(
-                    driver, vehicle, ride, distance_km, surge_multiplier
-                )
-                scored_drivers.append(score_data)
-            except Exception as e:
-                logger.error(f"Error scoring driver {driver.id}: {e}")
-                continue
+        # VIP ride history with this customer for all candidates in one query
+        trusted_ride_counts = None
+        if ride.customer_tier == UserTier.VIP:
+            trusted_ride_counts = self.load_vip_trusted_ride_counts(
+                [driver_data['driver'] for driver_data in available_drivers],
+                ride.customer
+            )
         
-        # Sort by score (highest first) and return top drivers
-        scored_drivers.sort(key=lambda x: x.score, reverse=True)
-        top_drivers = scored_drivers[:max_drivers]
+        # Score all candidates in one pass and keep the best
+        top_drivers = self.score_drivers(
+            available_drivers, ride, surge_multiplier, max_drivers,
+            trusted_ride_counts=trusted_ride_counts
+        )
         
         logger.info(f"Returning top {len(top_drivers)} drivers for ride {ride.id}")
         for i, driver_score in enumerate(top_drivers):
@@ -158,38 +164,64 @@ class RideMatchingService:
     ) -> List[Dict]:
         """
         Get available drivers within radius who can serve the ride tier
-        
-        Returns list of dicts with driver, vehicle, and distance information
+
+        Candidates come from the in-memory driver spatial index, which
+        returns up to MAX_DRIVERS_TO_CONSIDER nearest drivers in the radius;
+        only those are loaded from the database.
+
+        Returns list of dicts with driver, vehicle, and distance information,
+        ordered nearest first
         """
-        # Base query for available drivers
+        # Filter by tier capability
+        subscription_tiers = self.get_eligible_subscription_tiers(customer_tier)
+
+        # Nearest candidates from the spatial index
+        driver_index = get_driver_index()
+        driver_index.ensure_fresh()
+        nearest = driver_index.nearest(
+            pickup_lat, pickup_lng, radius_km,
+            self.MAX_DRIVERS_TO_CONSIDER,
+            subscription_tiers=subscription_tiers
+        )
+        if not nearest:
+            return []
+
+        candidate_order = {driver_id: rank for rank, (driver_id, _) in enumerate(nearest)}
+
+        # Base query for available drivers (re-checked against the DB)
         drivers_query = Driver.objects.filter(
+            id__in=list(candidate_order),
             status=Driver.DriverStatus.ACTIVE,
             is_online=True,
             is_available=True,
             current_location_lat__isnull=False,
             current_location_lng__isnull=False,
-        ).select_related('user', 'fleet_company').prefetch_related('assigned_vehicles')
-        
-        # Filter by tier capability
-        if customer_tier == UserTier.VIP:
-            drivers_query = drivers_query.filter(
-                subscription_tier__in=[
-                    Driver.SubscriptionTier.VIP,
-                    Driver.SubscriptionTier.PREMIUM
-                ]
+        ).select_related('user', 'fleet_company').prefetch_related(
+            models.Prefetch(
+                'user__owned_vehicles',
+                queryset=Vehicle.objects.filter(status=VehicleStatus.ACTIVE).order_by('pk'),
+                to_attr='active_vehicles'
             )
-        elif customer_tier == UserTier.PREMIUM:
-            drivers_query = drivers_query.filter(
-                subscription_tier__in=[
-                    Driver.SubscriptionTier.VIP,
-                    Driver.SubscriptionTier.PREMIUM
-                ]
-            )
-        
+        )
+
+        if subscription_tiers:
+            drivers_query = drivers_query.filter(subscription_tier__in=subscription_tiers)
+
+        candidates = sorted(drivers_query, key=lambda d: candidate_order[d.id])
+        self.apply_live_locations(candidates)
+
+        # Load vehicles and subscriptions for all candidates up front
+        try:
+            vehicles_by_driver = self.load_candidate_vehicles(candidates)
+            subscriptions_by_driver = self.load_active_subscriptions(candidates)
+        except Exception as e:
+            logger.error(f"Error loading driver eligibility data: {e}")
+            return []
+
         # Get drivers with distance calculation
         available_drivers = []
-        
-        for driver in drivers_query[:self.MAX_DRIVERS_TO_CONSIDER]:
+
+        for driver in candidates:
             try:
                 # Calculate distance
                 distance_km = self.calculate_distance(
@@ -203,12 +235,17 @@ class RideMatchingService:
                     continue
                 
                 # Get driver's vehicle
-                vehicle = self.get_driver_vehicle(driver, ride_type, customer_tier)
+                vehicle = self.choose_vehicle(
+                    vehicles_by_driver.get(driver.id, []), customer_tier
+                )
                 if not vehicle:
                     continue
                 
                 # Check if driver can accept this ride type
-                if not self.can_driver_accept_ride(driver, customer_tier, ride_type):
+                if not self.can_driver_accept_ride(
+                    driver, customer_tier, ride_type,
+                    subscriptions=subscriptions_by_driver
+                ):
                     continue
                 
                 available_drivers.append({
@@ -223,6 +260,110 @@ class RideMatchingService:
         
         return available_drivers
     
+    def apply_live_locations(self, drivers: List[Driver]) -> None:
+        """
+        Replace stored driver positions with their last known GPS locations
+
+        Driver.current_location_lat/lng are only written when the app posts
+        an availability update, so drivers streaming GPS are placed from the
+        location store instead (one read for the batch). Drivers without a
+        live entry keep their stored position.
+        """
+        if not drivers:
+            return
+
+        location_store = get_location_store()
+        try:
+            entries = location_store.get_many([driver.user_id for driver in drivers])
+        except Exception as e:
+            logger.error(f"Error loading live driver locations: {e}")
+            return
+
+        for driver in drivers:
+            lat, lng = location_store.coordinates(entries.get(driver.user_id))
+            if lat is not None and lng is not None:
+                driver.current_location_lat = Decimal(str(round(lat, 7)))
+                driver.current_location_lng = Decimal(str(round(lng, 7)))
+
+    def get_eligible_subscription_tiers(self, customer_tier: str) -> Optional[List[str]]:
+        """Get driver subscription tiers allowed to serve a customer tier (None = all)"""
+        if customer_tier in (UserTier.VIP, UserTier.VIP_PREMIUM):
+            return [
+                Driver.SubscriptionTier.VIP,
+                Driver.SubscriptionTier.PREMIUM
+            ]
+        return None
+    
+    def load_candidate_vehicles(self, drivers: List[Driver]) -> Dict[int, List[Vehicle]]:
+        """
+        Load active vehicles for a batch of drivers
+
+        A driver's vehicles are the ones their user owns. They come from the
+        active_vehicles prefetch of get_available_drivers; drivers loaded
+        without it are looked up with a single query for the whole batch.
+
+        Returns:
+            Dict mapping driver id to active vehicles ordered by id
+        """
+        vehicles_by_driver: Dict[int, List[Vehicle]] = {}
+        owners: Dict[int, int] = {}
+
+        for driver in drivers:
+            prefetched = getattr(driver.user, 'active_vehicles', None)
+            if prefetched is not None:
+                if prefetched:
+                    vehicles_by_driver[driver.id] = list(prefetched)
+            else:
+                owners[driver.user_id] = driver.id
+
+        if owners:
+            owned_vehicles = Vehicle.objects.filter(
+                owner_id__in=list(owners),
+                status=VehicleStatus.ACTIVE
+            ).order_by('pk')
+            for vehicle in owned_vehicles:
+                vehicles_by_driver.setdefault(owners[vehicle.owner_id], []).append(vehicle)
+
+        return vehicles_by_driver
+
+    def load_active_subscriptions(self, drivers: List[Driver]) -> Dict[int, object]:
+        """Load active subscriptions for a batch of drivers with a single query"""
+        from payments.models import DriverSubscription
+
+        subscriptions = {}
+        for subscription in DriverSubscription.objects.filter(
+            driver__in=drivers,
+            status='active'
+        ):
+            subscriptions.setdefault(subscription.driver_id, subscription)
+
+        return subscriptions
+
+    def choose_vehicle(
+        self,
+        vehicles: List[Vehicle],
+        customer_tier: str
+    ) -> Optional[Vehicle]:
+        """Pick the most appropriate vehicle for the customer tier from loaded vehicles"""
+        if not vehicles:
+            return None
+
+        # For VIP rides, prefer premium vehicles
+        if customer_tier == UserTier.VIP:
+            preferred_categories = ['PREMIUM', 'LUXURY']
+        # For premium rides, prefer premium or classic vehicles
+        elif customer_tier == UserTier.VIP_PREMIUM:
+            preferred_categories = ['PREMIUM', 'CLASSIC']
+        else:
+            preferred_categories = []
+
+        for vehicle in vehicles:
+            if vehicle.category in preferred_categories:
+                return vehicle
+
+        # Return any available vehicle for normal rides
+        return vehicles[0]
+
     def get_driver_vehicle(
         self, 
         driver: Driver, 
@@ -232,39 +373,8 @@ class RideMatchingService:
         """
         Get the most appropriate vehicle for the driver based on ride requirements
         """
-        # Get driver's available vehicles
-        if hasattr(driver, 'assigned_vehicles') and driver.assigned_vehicles.exists():
-            vehicles = driver.assigned_vehicles.filter(
-                status='ACTIVE'
-            )
-        else:
-            # Driver is vehicle owner
-            vehicles = Vehicle.objects.filter(
-                owner=driver.user,
-                status='ACTIVE'
-            )
-        
-        if not vehicles.exists():
-            return None
-        
-        # For VIP rides, prefer premium vehicles
-        if customer_tier == UserTier.VIP:
-            premium_vehicles = vehicles.filter(
-                category__in=['PREMIUM', 'LUXURY']
-            )
-            if premium_vehicles.exists():
-                return premium_vehicles.first()
-        
-        # For premium rides, prefer premium or classic vehicles
-        if customer_tier == UserTier.PREMIUM:
-            suitable_vehicles = vehicles.filter(
-                category__in=['PREMIUM', 'CLASSIC']
-            )
-            if suitable_vehicles.exists():
-                return suitable_vehicles.first()
-        
-        # Return any available vehicle for normal rides
-        return vehicles.first()
+        vehicles = self.load_candidate_vehicles([driver]).get(driver.id, [])
+        return self.choose_vehicle(vehicles, customer_tier)
     
     def score_driver_for_ride(
         self,
@@ -272,7 +382,8 @@ class RideMatchingService:
         vehicle: Vehicle,
         ride: Ride,
         distance_km: float,
-        surge_multiplier: Decimal
+        surge_multiplier: Decimal,
+        trusted_ride_counts: Optional[Dict[int, int]] = None
     ) -> DriverScore:
         """
         Calculate a comprehensive score for driver-ride matching
@@ -310,7 +421,13 @@ class RideMatchingService:
         
         # 6. VIP Trusted Driver Bonus
         if ride.customer_tier == UserTier.VIP:
-            trusted_bonus = self.calculate_vip_trusted_bonus(driver, ride.customer)
+            completed_vip_rides = (
+                trusted_ride_counts.get(driver.user_id, 0)
+                if trusted_ride_counts is not None else None
+            )
+            trusted_bonus = self.calculate_vip_trusted_bonus(
+                driver, ride.customer, completed_vip_rides
+            )
             score += trusted_bonus
             if trusted_bonus > 0:
                 match_reasons.append("VIP trusted driver")
@@ -334,6 +451,244 @@ class RideMatchingService:
             match_reasons=match_reasons
         )
     
+    def score_drivers(
+        self,
+        available_drivers: List[Dict],
+        ride: Ride,
+        surge_multiplier: Decimal,
+        max_drivers: int,
+        trusted_ride_counts: Optional[Dict[int, int]] = None
+    ) -> List[DriverScore]:
+        """
+        Score all candidate drivers at once and return the top max_drivers
+
+        Produces the same scores as score_driver_for_ride, but the
+        per-driver factors are gathered into columns and the weights are
+        applied to whole columns (with NumPy when it is installed). Match
+        reasons are only built for the drivers that are returned.
+
+        Returns:
+            List of scored drivers ordered by match quality
+        """
+        if max_drivers <= 0:
+            return []
+
+        is_vip = ride.customer_tier == UserTier.VIP
+        now = timezone.now()
+
+        # Categorical factors only depend on a few driver/vehicle attributes
+        tier_scores: Dict = {}
+        vehicle_scores: Dict = {}
+        trusted_bonuses: Dict = {}
+        fleet_bonuses: Dict = {}
+
+        candidates = []
+        columns = {
+            'distance': [], 'tier': [], 'vehicle': [], 'rating': [],
+            'minutes': [], 'completion': [], 'trusted': [], 'fleet': []
+        }
+
+        for driver_data in available_drivers:
+            driver = driver_data['driver']
+            vehicle = driver_data['vehicle']
+
+            try:
+                tier_key = driver.subscription_tier
+                if tier_key not in tier_scores:
+                    tier_scores[tier_key] = self.calculate_tier_match_score(
+                        driver, ride.customer_tier
+                    )
+
+                vehicle_key = (
+                    vehicle.category, vehicle.has_baby_seat, vehicle.has_wheelchair_access
+                )
+                if vehicle_key not in vehicle_scores:
+                    vehicle_scores[vehicle_key] = self.calculate_vehicle_match_score(
+                        vehicle, ride
+                    )
+
+                trusted_bonus = 0.0
+                if is_vip and trusted_ride_counts is None:
+                    trusted_bonus = self.calculate_vip_trusted_bonus(driver, ride.customer)
+                elif is_vip:
+                    completed_vip_rides = trusted_ride_counts.get(driver.user_id, 0)
+                    if completed_vip_rides not in trusted_bonuses:
+                        trusted_bonuses[completed_vip_rides] = self.calculate_vip_trusted_bonus(
+                            driver, ride.customer, completed_vip_rides
+                        )
+                    trusted_bonus = trusted_bonuses[completed_vip_rides]
+
+                fleet_key = bool(driver.fleet_company)
+                if fleet_key not in fleet_bonuses:
+                    fleet_bonuses[fleet_key] = self.calculate_fleet_priority_bonus(
+                        driver, ride.customer_tier
+                    )
+
+                if driver.last_location_update:
+                    minutes_since_update = (
+                        now - driver.last_location_update
+                    ).total_seconds() / 60
+                else:
+                    minutes_since_update = math.inf
+
+                rating = (
+                    float(driver.average_rating) / 5.0 if driver.average_rating else 0.5
+                )
+                completion_rate = float(driver.completion_rate)
+
+            except Exception as e:
+                logger.error(f"Error scoring driver {driver.id}: {e}")
+                continue
+
+            candidates.append(driver_data)
+            columns['distance'].append(driver_data['distance_km'])
+            columns['tier'].append(tier_scores[tier_key])
+            columns['vehicle'].append(vehicle_scores[vehicle_key])
+            columns['rating'].append(rating)
+            columns['minutes'].append(minutes_since_update)
+            columns['completion'].append(completion_rate)
+            columns['trusted'].append(trusted_bonus)
+            columns['fleet'].append(fleet_bonuses[fleet_key])
+
+        if not candidates:
+            return []
+
+        max_distance = self.get_search_radius(ride.customer_tier, ride.ride_type)
+        if NUMPY_AVAILABLE:
+            scores, availability, selected = self._rank_columns_numpy(
+                columns, max_distance, max_drivers
+            )
+        else:
+            scores, availability, selected = self._rank_columns(
+                columns, max_distance, max_drivers
+            )
+
+        top_drivers = []
+        for i in selected:
+            driver_data = candidates[i]
+            distance_km = driver_data['distance_km']
+            top_drivers.append(DriverScore(
+                driver=driver_data['driver'],
+                vehicle=driver_data['vehicle'],
+                distance_km=distance_km,
+                estimated_arrival_minutes=self.calculate_estimated_arrival(
+                    distance_km, surge_multiplier
+                ),
+                surge_multiplier=surge_multiplier,
+                score=float(scores[i]),
+                match_reasons=self._build_match_reasons(
+                    driver_data['driver'], distance_km,
+                    columns['tier'][i], columns['vehicle'][i],
+                    float(availability[i]), columns['trusted'][i], columns['fleet'][i]
+                )
+            ))
+
+        return top_drivers
+
+    def _rank_columns_numpy(
+        self,
+        columns: Dict[str, List[float]],
+        max_distance: float,
+        max_drivers: int
+    ) -> Tuple:
+        """Apply scoring weights to the factor columns with NumPy"""
+        distance = np.asarray(columns['distance'], dtype=float)
+        minutes = np.asarray(columns['minutes'], dtype=float)
+        completion = np.asarray(columns['completion'], dtype=float)
+
+        availability = (
+            0.5 +
+            np.where(minutes < 5, 0.3, np.where(minutes < 15, 0.2, 0.0)) +
+            np.where(completion >= 95, 0.2, np.where(completion >= 85, 0.1, 0.0))
+        )
+        availability = np.minimum(1.0, availability)
+
+        scores = np.maximum(0, (max_distance - distance) / max_distance) * self.DISTANCE_WEIGHT
+        scores += np.asarray(columns['tier'], dtype=float) * self.TIER_MATCH_WEIGHT
+        scores += np.asarray(columns['vehicle'], dtype=float) * self.VEHICLE_MATCH_WEIGHT
+        scores += np.asarray(columns['rating'], dtype=float) * self.RATING_WEIGHT
+        scores += availability * self.AVAILABILITY_WEIGHT
+        scores += np.asarray(columns['trusted'], dtype=float)
+        scores += np.asarray(columns['fleet'], dtype=float)
+
+        if len(scores) > max_drivers:
+            selected = np.argpartition(-scores, max_drivers - 1)[:max_drivers]
+        else:
+            selected = np.arange(len(scores))
+
+        # Highest score first; ties keep candidate (nearest first) order
+        selected = selected[np.lexsort((selected, -scores[selected]))]
+
+        return scores, availability, selected.tolist()
+
+    def _rank_columns(
+        self,
+        columns: Dict[str, List[float]],
+        max_distance: float,
+        max_drivers: int
+    ) -> Tuple:
+        """Apply scoring weights to the factor columns in pure Python"""
+        scores = []
+        availability = []
+
+        for i, distance_km in enumerate(columns['distance']):
+            minutes = columns['minutes'][i]
+            completion = columns['completion'][i]
+
+            available = 0.5
+            if minutes < 5:
+                available += 0.3
+            elif minutes < 15:
+                available += 0.2
+            if completion >= 95:
+                available += 0.2
+            elif completion >= 85:
+                available += 0.1
+            available = min(1.0, available)
+
+            score = max(0, (max_distance - distance_km) / max_distance) * self.DISTANCE_WEIGHT
+            score += columns['tier'][i] * self.TIER_MATCH_WEIGHT
+            score += columns['vehicle'][i] * self.VEHICLE_MATCH_WEIGHT
+            score += columns['rating'][i] * self.RATING_WEIGHT
+            score += available * self.AVAILABILITY_WEIGHT
+            score += columns['trusted'][i]
+            score += columns['fleet'][i]
+
+            scores.append(score)
+            availability.append(available)
+
+        # Highest score first; ties keep candidate (nearest first) order
+        selected = heapq.nlargest(
+            max_drivers, range(len(scores)), key=lambda i: (scores[i], -i)
+        )
+
+        return scores, availability, selected
+
+    def _build_match_reasons(
+        self,
+        driver: Driver,
+        distance_km: float,
+        tier_score: float,
+        vehicle_score: float,
+        availability_score: float,
+        trusted_bonus: float,
+        fleet_bonus: float
+    ) -> List[str]:
+        """Build human readable match reasons for a selected driver"""
+        match_reasons = [
+            f"Distance: {distance_km:.1f}km",
+            f"Tier match: {tier_score:.2f}",
+            f"Vehicle match: {vehicle_score:.2f}",
+            f"Rating: {driver.average_rating:.1f}/5.0",
+            f"Availability: {availability_score:.2f}",
+        ]
+        if trusted_bonus > 0:
+            match_reasons.append("VIP trusted driver")
+        if fleet_bonus > 0:
+            match_reasons.append("Fleet priority")
+
+        return match_reasons
+
     def calculate_tier_match_score(self, driver: Driver, customer_tier: str) -> float:
         """Calculate how well driver's subscription matches customer tier"""
         if customer_tier == UserTier.VIP:
@@ -343,7 +698,7 @@ class RideMatchingService:
                 return 0.8
             else:
                 return 0.0
-        elif customer_tier == UserTier.PREMIUM:
+        elif customer_tier == UserTier.VIP_PREMIUM:
             if driver.subscription_tier in [Driver.SubscriptionTier.VIP, Driver.SubscriptionTier.PREMIUM]:
                 return 1.0
             else:
@@ -359,7 +714,7 @@ class RideMatchingService:
         if ride.customer_tier == UserTier.VIP:
             if vehicle.category in ['PREMIUM', 'LUXURY']:
                 score += 0.4
-        elif ride.customer_tier == UserTier.PREMIUM:
+        elif ride.customer_tier == UserTier.VIP_PREMIUM:
             if vehicle.category in ['PREMIUM', 'CLASSIC']:
                 score += 0.3
         
@@ -395,17 +750,37 @@ class RideMatchingService:
         
         return min(1.0, score)
     
-    def calculate_vip_trusted_bonus(self, driver: Driver, customer) -> float:
-        """Calculate bonus for VIP trusted drivers"""
-        # Check if driver has successfully completed VIP rides for this customer
-        from .models import Ride
-        
-        completed_vip_rides = Ride.objects.filter(
+    def load_vip_trusted_ride_counts(self, drivers: List[Driver], customer) -> Dict[int, int]:
+        """
+        Count completed VIP rides with the customer for a batch of drivers
+
+        Returns:
+            Dict mapping driver user id to completed VIP ride count
+        """
+        if not drivers:
+            return {}
+
+        rows = Ride.objects.filter(
             customer=customer,
-            driver=driver.user,
+            driver_id__in=[driver.user_id for driver in drivers],
             customer_tier=UserTier.VIP,
             status=RideStatus.COMPLETED
-        ).count()
+        ).values('driver_id').annotate(completed=models.Count('id'))
+
+        return {row['driver_id']: row['completed'] for row in rows}
+
+    def calculate_vip_trusted_bonus(
+        self,
+        driver: Driver,
+        customer,
+        completed_vip_rides: Optional[int] = None
+    ) -> float:
+        """Calculate bonus for VIP trusted drivers"""
+        # Check if driver has successfully completed VIP rides for this customer
+        if completed_vip_rides is None:
+            completed_vip_rides = self.load_vip_trusted_ride_counts(
+                [driver], customer
+            ).get(driver.user_id, 0)
         
         if completed_vip_rides >= 5:
             return 0.3  # Highly trusted
@@ -424,7 +799,7 @@ class RideMatchingService:
         # Fleet companies get priority for VIP rides
         if customer_tier == UserTier.VIP:
             return 0.15
-        elif customer_tier == UserTier.PREMIUM:
+        elif customer_tier == UserTier.VIP_PREMIUM:
             return 0.1
         
         return 0.05
@@ -451,7 +826,7 @@ class RideMatchingService:
         # VIP customers get reduced surge impact
         if customer_tier == UserTier.VIP:
             surge_multiplier = min(surge_multiplier, Decimal('2.0'))
-        elif customer_tier == UserTier.PREMIUM:
+        elif customer_tier == UserTier.VIP_PREMIUM:
             surge_multiplier = min(surge_multiplier, Decimal('2.5'))
         
         return max(Decimal('1.0'), surge_multiplier)
@@ -462,34 +837,28 @@ class RideMatchingService:
         pickup_lng: float,
         customer_tier: str
     ) -> Decimal:
-        """Calculate surge based on real-time demand/supply ratio"""
-        from .models import Ride
-        
+        """
+        Calculate surge based on real-time demand/supply ratio
+
+        Demand comes from the rolling ride demand index and supply from the
+        driver spatial index; both only read the grid cells covering the
+        search area.
+        """
         # Define search area (3km radius for demand calculation)
         search_radius = 3.0
-        now = timezone.now()
-        thirty_minutes_ago = now - timedelta(minutes=30)
         
         # Count recent ride requests in area
-        recent_rides_count = 0
-        all_recent_rides = Ride.objects.filter(
-            requested_at__gte=thirty_minutes_ago,
-            status__in=[RideStatus.REQUESTED, RideStatus.ACCEPTED, RideStatus.DRIVER_ARRIVING]
-        )
-        
-        for ride in all_recent_rides:
-            distance = self.calculate_distance(
-                pickup_lat, pickup_lng,
-                float(ride.pickup_latitude),
-                float(ride.pickup_longitude)
-            )
-            if distance <= search_radius:
-                recent_rides_count += 1
+        demand_index = get_demand_index()
+        demand_index.ensure_fresh()
+        recent_rides_count = demand_index.count_within(pickup_lat, pickup_lng, search_radius)
         
         # Count available drivers in area
-        available_drivers_count = len(self.get_available_drivers(
-            pickup_lat, pickup_lng, search_radius, customer_tier, RideType.NORMAL
-        ))
+        driver_index = get_driver_index()
+        driver_index.ensure_fresh()
+        available_drivers_count = driver_index.count_within(
+            pickup_lat, pickup_lng, search_radius,
+            subscription_tiers=self.get_eligible_subscription_tiers(customer_tier)
+        )
         
         # Calculate surge multiplier
         if available_drivers_count == 0:
@@ -520,9 +889,15 @@ class RideMatchingService:
         self, 
         driver: Driver, 
         customer_tier: str, 
-        ride_type: str
+        ride_type: str,
+        subscriptions: Optional[Dict[int, object]] = None
     ) -> bool:
-        """Check if driver can accept ride based on subscription and status"""
+        """
+        Check if driver can accept ride based on subscription and status
+
+        Pass `subscriptions` from load_active_subscriptions() to avoid a
+        subscription query per driver.
+        """
         # Check subscription status
         if not driver.is_subscription_active:
             return False
@@ -536,6 +911,10 @@ class RideMatchingService:
             return False
         
         # Check if driver has active subscription that allows this tier
+        if subscriptions is not None:
+            subscription = subscriptions.get(driver.id)
+            return bool(subscription) and subscription.can_accept_ride(ride_type)
+
         from payments.models import DriverSubscription
         
         try:
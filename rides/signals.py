@@ -0,0 +1,45 @@
+# rides/signals.py
+"""
+Ride matching signals keeping in-memory matching state current
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+import logging
+
+from accounts.models import Driver
+from .demand_index import get_demand_index
+from .driver_index import get_driver_index
+from .models import Ride
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Driver)
+def sync_driver_spatial_index(sender, instance, **kwargs):
+    """Move, add or drop the driver in the spatial index on every save"""
+    try:
+        get_driver_index().update_driver(instance)
+    except Exception as e:
+        logger.error(f"Failed to update spatial index for driver {instance.pk}: {e}")
+
+
+@receiver(post_delete, sender=Driver)
+def remove_driver_from_spatial_index(sender, instance, **kwargs):
+    """Drop deleted drivers from the spatial index"""
+    get_driver_index().remove(instance.pk)
+
+
+@receiver(post_save, sender=Ride)
+def sync_ride_demand_index(sender, instance, **kwargs):
+    """Count or stop counting the ride as open demand on every save"""
+    try:
+        get_demand_index().update_ride(instance)
+    except Exception as e:
+        logger.error(f"Failed to update demand index for ride {instance.pk}: {e}")
+
+
+@receiver(post_delete, sender=Ride)
+def remove_ride_from_demand_index(sender, instance, **kwargs):
+    """Drop deleted rides from the demand index"""
+    get_demand_index().remove(instance.pk)
@@ -1,3 +1,410 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from accounts.models import Driver, User, UserTier
+from fleet_management.models import Vehicle, VehicleStatus
+from .models import RideStatus
+from .demand_index import RideDemandIndex
+from .driver_index import DriverSpatialIndex, haversine_km
+from . import matching
+from .matching import RideMatchingService
+
+
+class DriverSpatialIndexTestCase(SimpleTestCase):
+    """Test in-memory driver spatial index"""
+
+    def setUp(self):
+        self.index = DriverSpatialIndex()
+        # Lekki pickup with drivers spread across Lagos
+        self.pickup = (6.4474, 3.4700)
+        self.index.load([
+            (1, 6.4480, 3.4710, 'basic'),    # Lekki, ~0.1km
+            (2, 6.4600, 3.4900, 'vip'),      # Lekki Phase 1, ~2.6km
+            (3, 6.5244, 3.3792, 'premium'),  # Mainland, ~13km
+            (4, 6.6018, 3.3515, 'vip'),      # Ikeja, ~21km
+            (5, 7.3775, 3.9470, 'basic'),    # Ibadan, ~115km
+        ])
+
+    def test_nearest_orders_by_distance(self):
+        """Test nearest drivers are returned closest first"""
+        results = self.index.nearest(*self.pickup, radius_km=50, k=10)
+
+        self.assertEqual([driver_id for driver_id, _ in results], [1, 2, 3, 4])
+        distances = [distance for _, distance in results]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_nearest_respects_radius_and_k(self):
+        """Test radius and k cap the candidates"""
+        within_radius = self.index.nearest(*self.pickup, radius_km=15, k=10)
+        self.assertEqual([driver_id for driver_id, _ in within_radius], [1, 2, 3])
+
+        capped = self.index.nearest(*self.pickup, radius_km=50, k=2)
+        self.assertEqual([driver_id for driver_id, _ in capped], [1, 2])
+
+    def test_nearest_filters_subscription_tiers(self):
+        """Test tier filter is applied before the k cap"""
+        results = self.index.nearest(
+            *self.pickup, radius_km=50, k=2,
+            subscription_tiers=['vip', 'premium']
+        )
+
+        self.assertEqual([driver_id for driver_id, _ in results], [2, 3])
+
+    def test_upsert_moves_driver_between_cells(self):
+        """Test driver location updates move it in the index"""
+        self.index.upsert(5, 6.4475, 3.4701, 'basic')
+
+        results = self.index.nearest(*self.pickup, radius_km=1, k=5)
+        self.assertEqual(results[0][0], 5)
+        self.assertEqual(len(self.index), 5)
+
+    def test_remove_driver(self):
+        """Test removed drivers are no longer returned"""
+        self.assertTrue(self.index.remove(1))
+        self.assertFalse(self.index.remove(1))
+
+        results = self.index.nearest(*self.pickup, radius_km=5, k=5)
+        self.assertEqual([driver_id for driver_id, _ in results], [2])
+
+    def test_count_within_radius(self):
+        """Test counting drivers only within the radius and tiers"""
+        self.assertEqual(self.index.count_within(*self.pickup, radius_km=3), 2)
+        self.assertEqual(
+            self.index.count_within(*self.pickup, radius_km=15, subscription_tiers=['vip']),
+            1
+        )
+
+    def test_ring_search_matches_brute_force(self):
+        """Test dense ring search agrees with a full scan"""
+        index = DriverSpatialIndex(cell_size_degrees=0.005)
+        entries = [
+            (i, 6.40 + (i % 40) * 0.004, 3.30 + (i // 40) * 0.004, 'basic')
+            for i in range(1600)
+        ]
+        index.load(entries)
+
+        results = index.nearest(6.45, 3.36, radius_km=3, k=15)
+        expected = sorted(
+            (
+                (driver_id, haversine_km(6.45, 3.36, lat, lng))
+                for driver_id, lat, lng, _ in entries
+            ),
+            key=lambda item: item[1]
+        )[:15]
+
+        # Compare distances since grid points produce exact ties
+        self.assertEqual(
+            [round(distance, 9) for _, distance in results],
+            [round(distance, 9) for _, distance in expected]
+        )
+
+
+class DriverEligibilityTestCase(SimpleTestCase):
+    """Test in-memory vehicle choice for batched driver eligibility"""
+
+    def setUp(self):
+        self.service = RideMatchingService()
+        self.economy = SimpleNamespace(pk=1, category='ECONOMY', status='ACTIVE')
+        self.luxury = SimpleNamespace(pk=2, category='LUXURY', status='ACTIVE')
+        self.classic = SimpleNamespace(pk=3, category='CLASSIC', status='ACTIVE')
+
+    def test_choose_vehicle_prefers_premium_for_vip(self):
+        """Test VIP rides get a premium or luxury vehicle when available"""
+        vehicles = [self.economy, self.classic, self.luxury]
+
+        self.assertIs(self.service.choose_vehicle(vehicles, UserTier.VIP), self.luxury)
+        self.assertIs(self.service.choose_vehicle(vehicles, UserTier.NORMAL), self.economy)
+
+    def test_choose_vehicle_prefers_classic_for_vip_premium(self):
+        """Test VIP Premium rides get a premium or classic vehicle when available"""
+        vehicles = [self.economy, self.luxury, self.classic]
+
+        self.assertIs(self.service.choose_vehicle(vehicles, UserTier.VIP_PREMIUM), self.classic)
+
+    def test_choose_vehicle_falls_back_to_first(self):
+        """Test the first vehicle is used when no preferred category exists"""
+        self.assertIs(
+            self.service.choose_vehicle([self.economy, self.classic], UserTier.VIP),
+            self.economy
+        )
+        self.assertIsNone(self.service.choose_vehicle([], UserTier.VIP))
+
+    def test_vip_premium_limited_to_vip_drivers(self):
+        """Test VIP Premium customers are only matched with VIP and premium drivers"""
+        self.assertEqual(
+            self.service.get_eligible_subscription_tiers(UserTier.VIP_PREMIUM),
+            self.service.get_eligible_subscription_tiers(UserTier.VIP)
+        )
+        self.assertIsNone(self.service.get_eligible_subscription_tiers(UserTier.NORMAL))
+
+    def test_live_locations_override_stored_positions(self):
+        """Test drivers streaming GPS are placed from the location store"""
+        moving = SimpleNamespace(user_id=100, current_location_lat=Decimal('6.5'),
+                                 current_location_lng=Decimal('3.3'))
+        parked = SimpleNamespace(user_id=101, current_location_lat=Decimal('6.4'),
+                                 current_location_lng=Decimal('3.2'))
+        store = mock.Mock()
+        store.get_many.return_value = {100: {'lat': 6.61, 'lng': 3.35}}
+        store.coordinates.side_effect = lambda entry: (
+            (entry['lat'], entry['lng']) if entry else (None, None)
+        )
+
+        with mock.patch.object(matching, 'get_location_store', return_value=store):
+            self.service.apply_live_locations([moving, parked])
+
+        store.get_many.assert_called_once_with([100, 101])
+        self.assertEqual(moving.current_location_lat, Decimal('6.61'))
+        self.assertEqual(parked.current_location_lat, Decimal('6.4'))
+
+
+class CandidateVehicleLoadingTestCase(TestCase):
+    """Test candidate drivers are loaded with their vehicles in constant queries"""
+
+    def setUp(self):
+        self.service = RideMatchingService()
+        self.pickup = (6.4474, 3.4700)
+        self.drivers = []
+        for i in range(3):
+            user = User.objects.create_user(
+                email=f'candidate{i}@example.com',
+                password='testpass123',
+                phone_number=f'+23480000001{i:02d}'
+            )
+            driver = Driver.objects.create(
+                user=user,
+                license_number=f'LAG-CANDIDATE-{i}',
+                license_expiry_date=date(2030, 1, 1),
+                subscription_tier=Driver.SubscriptionTier.VIP,
+                subscription_end_date=timezone.now() + timedelta(days=30),
+                status=Driver.DriverStatus.ACTIVE,
+                is_online=True,
+                is_available=True,
+                current_location_lat=Decimal('6.4480') + Decimal(i) / 1000,
+                current_location_lng=Decimal('3.4710'),
+                license_front_image='front.jpg',
+                license_back_image='back.jpg',
+                identity_document='id.jpg',
+                proof_of_address='address.jpg'
+            )
+            self.drivers.append(driver)
+
+        self.index = DriverSpatialIndex()
+        self.index.load(
+            (driver.id, driver.current_location_lat, driver.current_location_lng,
+             driver.subscription_tier)
+            for driver in self.drivers
+        )
+
+        owner = self.drivers[0].user
+        self.economy = self._vehicle(owner, 'CLASSIC', 'CAND-1')
+        self.luxury = self._vehicle(owner, 'LUXURY', 'CAND-2')
+        self._vehicle(owner, 'LUXURY', 'CAND-3', status=VehicleStatus.MAINTENANCE)
+        self.second = self._vehicle(self.drivers[1].user, 'PREMIUM', 'CAND-4')
+
+    def _vehicle(self, owner, category, plate, status=VehicleStatus.ACTIVE):
+        return Vehicle.objects.create(
+            owner=owner, make='Toyota', model='Camry', year=2022,
+            license_plate=plate, vin_number=f'VIN{plate}', color='Black',
+            category=category, status=status,
+            registration_number=f'REG{plate}', insurance_policy_number=f'INS{plate}',
+            insurance_expiry_date=date(2030, 1, 1), road_worthiness_expiry=date(2030, 1, 1),
+            front_image='front.jpg', back_image='back.jpg', interior_image='interior.jpg',
+            registration_document='registration.pdf', insurance_document='insurance.pdf',
+            fuel_consumption_per_km=Decimal('0.08')
+        )
+
+    def test_get_available_drivers_prefetches_vehicles(self):
+        """Test candidates and their active vehicles are loaded in two queries"""
+        store = mock.Mock()
+        store.get_many.return_value = {}
+        store.coordinates.return_value = (None, None)
+
+        # Subscription eligibility is covered elsewhere; only vehicles are under test
+        with mock.patch.object(matching, 'get_driver_index', return_value=self.index), \
+                mock.patch.object(matching, 'get_location_store', return_value=store), \
+                mock.patch.object(self.service, 'load_active_subscriptions', return_value={}), \
+                mock.patch.object(self.service, 'can_driver_accept_ride', return_value=True):
+            with self.assertNumQueries(2):
+                results = self.service.get_available_drivers(
+                    *self.pickup, 20.0, UserTier.VIP, 'normal'
+                )
+
+        # The third driver owns no vehicle and the maintenance car is skipped
+        self.assertEqual(
+            [(data['driver'].id, data['vehicle'].pk) for data in results],
+            [(self.drivers[0].id, self.luxury.pk), (self.drivers[1].id, self.second.pk)]
+        )
+
+    def test_find_best_drivers_for_normal_and_vip_premium_rides(self):
+        """Test non-VIP tiers are priced, scored and matched end to end"""
+        store = mock.Mock()
+        store.get_many.return_value = {}
+        store.coordinates.return_value = (None, None)
+        demand_index = mock.Mock()
+        demand_index.count_within.return_value = 0
+
+        for tier in [UserTier.NORMAL, UserTier.VIP_PREMIUM]:
+            ride = SimpleNamespace(
+                id=tier, customer_tier=tier, ride_type='normal', customer=None,
+                pickup_latitude=Decimal(str(self.pickup[0])),
+                pickup_longitude=Decimal(str(self.pickup[1])),
+                requires_baby_seat=False, requires_wheelchair_access=False,
+                requires_premium_vehicle=False
+            )
+            with mock.patch.object(matching, 'get_driver_index', return_value=self.index), \
+                    mock.patch.object(matching, 'get_demand_index', return_value=demand_index), \
+                    mock.patch.object(matching, 'get_location_store', return_value=store), \
+                    mock.patch.object(self.service, 'load_active_subscriptions', return_value={}), \
+                    mock.patch.object(self.service, 'can_driver_accept_ride', return_value=True):
+                results = self.service.find_best_drivers(ride)
+
+            self.assertEqual(ride.surge_multiplier, Decimal('1.0'))
+            self.assertEqual(
+                sorted(result.driver.id for result in results),
+                [self.drivers[0].id, self.drivers[1].id]
+            )
+            # Both tiers take the classic car over the luxury one
+            by_driver = {result.driver.id: result.vehicle for result in results}
+            self.assertEqual(by_driver[self.drivers[0].id], self.economy)
+
+    def test_load_candidate_vehicles_without_prefetch(self):
+        """Test drivers loaded without the prefetch share one vehicle query"""
+        drivers = list(Driver.objects.select_related('user').order_by('id'))
+
+        with self.assertNumQueries(1):
+            vehicles = self.service.load_candidate_vehicles(drivers)
+
+        self.assertEqual(vehicles, {
+            self.drivers[0].id: sorted([self.economy, self.luxury], key=lambda vehicle: vehicle.pk),
+            self.drivers[1].id: [self.second],
+        })
+
+
+class DriverScoringTestCase(SimpleTestCase):
+    """Test batch driver scoring against per-driver scoring"""
+
+    def setUp(self):
+        self.service = RideMatchingService()
+        self.ride = SimpleNamespace(
+            customer_tier=UserTier.VIP, ride_type='normal', customer=None,
+            requires_baby_seat=True, requires_wheelchair_access=False,
+            requires_premium_vehicle=True
+        )
+        self.trusted_ride_counts = {101: 6, 104: 1}
+
+        now = timezone.now()
+        categories = ['ECONOMY', 'LUXURY', 'PREMIUM', 'CLASSIC']
+        tiers = ['vip', 'premium', 'basic']
+        self.available_drivers = []
+        for i in range(12):
+            driver = SimpleNamespace(
+                id=i, user_id=100 + i,
+                subscription_tier=tiers[i % 3],
+                fleet_company=object() if i % 4 == 0 else None,
+                last_location_update=now - timedelta(minutes=3 * i) if i % 5 else None,
+                average_rating=Decimal('3.5') + Decimal(i % 4) / 3,
+                completion_rate=Decimal(80 + i)
+            )
+            vehicle = SimpleNamespace(
+                category=categories[i % 4], has_baby_seat=i % 2 == 0,
+                has_wheelchair_access=False
+            )
+            self.available_drivers.append({
+                'driver': driver, 'vehicle': vehicle, 'distance_km': 0.7 + i * 3.1
+            })
+
+    def _expected(self, max_drivers):
+        scored = [
+            self.service.score_driver_for_ride(
+                data['driver'], data['vehicle'], self.ride, data['distance_km'],
+                Decimal('1.0'), trusted_ride_counts=self.trusted_ride_counts
+            )
+            for data in self.available_drivers
+        ]
+        scored.sort(key=lambda x: x.score, reverse=True)
+        return scored[:max_drivers]
+
+    def _assert_matches_per_driver_scoring(self):
+        for max_drivers in (1, 5, 20):
+            results = self.service.score_drivers(
+                self.available_drivers, self.ride, Decimal('1.0'), max_drivers,
+                trusted_ride_counts=self.trusted_ride_counts
+            )
+            expected = self._expected(max_drivers)
+
+            self.assertEqual(
+                [result.driver.id for result in results],
+                [score.driver.id for score in expected]
+            )
+            for result, score in zip(results, expected):
+                self.assertAlmostEqual(result.score, score.score)
+                self.assertEqual(result.match_reasons, score.match_reasons)
+                self.assertEqual(
+                    result.estimated_arrival_minutes, score.estimated_arrival_minutes
+                )
+
+    def test_score_drivers_with_numpy(self):
+        """Test NumPy scoring matches per-driver scoring"""
+        if not matching.NUMPY_AVAILABLE:
+            self.skipTest('NumPy is not installed')
+        self._assert_matches_per_driver_scoring()
+
+    def test_score_drivers_without_numpy(self):
+        """Test pure Python scoring matches per-driver scoring"""
+        with mock.patch.object(matching, 'NUMPY_AVAILABLE', False):
+            self._assert_matches_per_driver_scoring()
+
+
+class RideDemandIndexTestCase(SimpleTestCase):
+    """Test rolling ride demand counter"""
+
+    def setUp(self):
+        self.index = RideDemandIndex()
+        self.pickup = (6.4474, 3.4700)
+        self.now = timezone.now()
+
+    def _ride(self, pk, lat, lng, status=RideStatus.REQUESTED, minutes_ago=1):
+        return SimpleNamespace(
+            pk=pk, status=status, pickup_latitude=Decimal(str(lat)),
+            pickup_longitude=Decimal(str(lng)),
+            requested_at=self.now - timedelta(minutes=minutes_ago)
+        )
+
+    def test_count_within_radius(self):
+        """Test only open rides inside the radius are counted"""
+        self.index.update_ride(self._ride(1, 6.4480, 3.4710))
+        self.index.update_ride(self._ride(2, 6.4600, 3.4800))  # ~1.8km
+        self.index.update_ride(self._ride(3, 6.5244, 3.3792))  # ~13km
+
+        self.assertEqual(self.index.count_within(*self.pickup, radius_km=3), 2)
+        self.assertEqual(self.index.count_within(*self.pickup, radius_km=20), 3)
+
+    def test_status_changes_update_counter(self):
+        """Test rides stop counting once they leave the open statuses"""
+        ride = self._ride(1, 6.4480, 3.4710)
+        self.index.update_ride(ride)
+        ride.status = RideStatus.DRIVER_EN_ROUTE
+        self.index.update_ride(ride)
+        self.assertEqual(self.index.count_within(*self.pickup, radius_km=3), 1)
+
+        ride.status = RideStatus.IN_PROGRESS
+        self.index.update_ride(ride)
+        self.assertEqual(self.index.count_within(*self.pickup, radius_km=3), 0)
+        self.assertEqual(len(self.index), 0)
+
+    def test_rides_age_out_of_window(self):
+        """Test rides older than the window are ignored and dropped"""
+        self.index.update_ride(self._ride(1, 6.4480, 3.4710, minutes_ago=45))
+        self.assertEqual(len(self.index), 0)
+
+        self.index.load([
+            (2, 6.4480, 3.4710, self.now - timedelta(minutes=45)),
+            (3, 6.4481, 3.4711, self.now - timedelta(minutes=5)),
+        ])
+        self.assertEqual(self.index.count_within(*self.pickup, radius_km=3), 1)
+        self.assertEqual(len(self.index), 1)
@@ -79,13 +79,13 @@ MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',  # Prometheus metrics (first)
     'corsheaders.middleware.CorsMiddleware',
     'accounts.security_middleware.CustomSecurityMiddleware',  # Custom security middleware
-    'accounts.rate_limit_middleware.RateLimitMiddleware',  # Rate limiting
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.rate_limit_middleware.RateLimitMiddleware',  # Rate limiting (tiers from session user or JWT claims)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     
@@ -339,6 +339,26 @@ RBAC_SETTINGS = {
     'SESSION_TIMEOUT_MINUTES': int(os.environ.get('SESSION_TIMEOUT_MINUTES', '60')),
     'MAX_LOGIN_ATTEMPTS': int(os.environ.get('MAX_LOGIN_ATTEMPTS', '5')),
     'LOCKOUT_DURATION_MINUTES': int(os.environ.get('LOCKOUT_DURATION_MINUTES', '30')),
+    # 'cache' shares security monitoring counters across workers, 'local' keeps them per process
+    'SECURITY_COUNTER_BACKEND': os.environ.get('SECURITY_COUNTER_BACKEND', 'cache'),
+}
+
+# Shared rate limiter ('redis' shares limits across workers, 'local' is per process)
+RATE_LIMITER_SETTINGS = {
+    'BACKEND': os.environ.get('RATE_LIMITER_BACKEND', 'redis'),
+    'REDIS_URL': REDIS_URL,
+    'KEY_PREFIX': 'rate_limit',
+    'LOCAL_SHARDS': 64,
+}
+
+# Security audit sink (request audit SecurityEvent writes)
+RBAC_AUDIT_SETTINGS = {
+    'ASYNC_ENABLED': os.environ.get('RBAC_AUDIT_ASYNC', 'True') == 'True',
+    'BATCH_SIZE': int(os.environ.get('RBAC_AUDIT_BATCH_SIZE', '500')),
+    'FLUSH_INTERVAL_MS': int(os.environ.get('RBAC_AUDIT_FLUSH_INTERVAL_MS', '1000')),
+    'MAX_QUEUE_SIZE': int(os.environ.get('RBAC_AUDIT_MAX_QUEUE_SIZE', '20000')),
+    'LOW_SEVERITY_SAMPLE_RATE': float(os.environ.get('RBAC_AUDIT_LOW_SEVERITY_SAMPLE_RATE', '1.0')),
+    'IMMEDIATE_SEVERITIES': ['high', 'critical'],
 }
 
 # Role-based access control permissions
@@ -396,11 +416,24 @@ GPS_TRACKING = {
     'MAX_ACCURACY_METERS': 100,
     'VIP_MAX_ACCURACY_METERS': 20,
     'MAX_SPEED_KMH': 200,
-    'LOCATION_RETENTION_DAYS': 30,
-    'VIP_LOCATION_RETENTION_DAYS': 365,
+    'LOCATION_RETENTION_DAYS': 30,  # Plain (non-VIP) locations
+    'VIP_LOCATION_RETENTION_DAYS': 365,  # Encrypted locations; None keeps them
     'GEOFENCE_CHECK_ENABLED': True,
     'REAL_TIME_ETA_ENABLED': True,
     'OFFLINE_BUFFER_MAX_SIZE': 1000,
+    'ENCRYPTION_KEY_CACHE_SIZE': 1024,  # Derived VIP location keys kept in memory
+    'ENCRYPTION_KEY_CACHE_TTL_SECONDS': 900,
+    'GEOFENCE_STATE_BACKEND': 'cache',  # 'cache' (shared) or 'local' per-process LRU
+    'INGEST_BATCH_WINDOW_MS': 200,  # Live updates are buffered this long before one bulk insert
+    'INGEST_BATCH_SIZE': 200,
+    'LAST_LOCATION_BACKEND': 'cache',  # 'cache' (shared) or 'local' in-process map
+    'CONTROL_CENTER_BROADCAST_WINDOW_MS': 1000,  # At most one VIP location frame per window
+    'RIDE_BROADCAST_WINDOW_MS': 250,
+    'TRAJECTORY_TOLERANCE_METERS': 5,  # Douglas-Peucker tolerance for compacted rides
+    'TRAJECTORY_COMPACTION_DELAY_MINUTES': 30,  # Wait for late offline uploads
+    'TRAJECTORY_COMPACTION_BATCH_SIZE': 100,
+    'ETA_STATE_BACKEND': 'cache',  # 'cache' (shared) or 'local' in-process map
+    'ETA_UPDATE_THRESHOLD_SECONDS': 30,  # Save the ETA only when it moves this much
 }
 
 # WebSocket settings
@@ -414,6 +447,15 @@ COMMISSION_RATES = {
     'VIP': {'min': 0.25, 'max': 0.30},
 }
 
+# Price calculation audit log settings
+PRICING_LOG_SETTINGS = {
+    'ASYNC_ENABLED': os.environ.get('PRICING_LOG_ASYNC', 'True') == 'True',
+    'BATCH_SIZE': int(os.environ.get('PRICING_LOG_BATCH_SIZE', '200')),
+    'FLUSH_INTERVAL_MS': int(os.environ.get('PRICING_LOG_FLUSH_INTERVAL_MS', '500')),
+    'MAX_QUEUE_SIZE': int(os.environ.get('PRICING_LOG_MAX_QUEUE_SIZE', '10000')),
+    'SAMPLE_RATE': float(os.environ.get('PRICING_LOG_SAMPLE_RATE', '1.0')),
+}
+
 # Driver Subscription Fees (monthly in USD)
 DRIVER_SUBSCRIPTION_FEES = {
     'BASIC': 99,